@@ -0,0 +1,363 @@
+# Load generator: starts bench/mock_provider.py and a router process wired to
+# it, drives /chat, /stats and /rate at a fixed request rate, and reports
+# throughput, latency percentiles and router CPU/memory per request.
+#
+#   python -m bench.load [--rps 50] [--duration 30] [--concurrency 64] [--mix chat=0.8,stats=0.1,rate=0.1]
+#                        [--latency lognormal:300,0.5] [--error-rate 0.01] [--rate-limit-rate 0.02]
+#                        [--label NAME] [--compare last|PATH]
+#
+# Each run is written to bench/results/<time>-<label>.json and appended to
+# bench/results/history.jsonl; --compare exits non-zero when p95/p99 latency,
+# throughput or CPU per request regressed by more than --tolerance.
+import os
+import sys
+import json
+import math
+import time
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+import httpx
+
+RESULTS_DIR = os.getenv('LLM_ROUTER_BENCH_RESULTS', os.path.join(os.path.dirname(__file__), 'results'))
+REPO_DIR = os.path.join(os.path.dirname(__file__), '..')
+DEFAULT_MODELS = 'llama-3.1-8b-instant,gemini-2.5-flash'
+PROMPT_WORDS = 'the quick brown fox jumps over a lazy dog while routers cache logs and stream tokens'.split()
+
+def parse_mix(value):
+    # "chat=0.8,stats=0.1,rate=0.1" -> normalized weights per endpoint
+    mix = {}
+    for item in filter(None, (v.strip() for v in value.split(','))):
+        name, _, weight = item.partition('=')
+        mix[name] = float(weight or 1)
+    unknown = set(mix) - {'chat', 'stats', 'rate'}
+    if unknown or not mix:
+        raise ValueError(f'Unknown endpoints in mix: {sorted(unknown)}')
+    total = sum(mix.values())
+    return {name: weight / total for name, weight in mix.items()}
+
+def percentile(sorted_values, q):
+    # Nearest-rank percentile of an already sorted list.
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def wait_for(url, process, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'{process.args} exited with {process.returncode}')
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f'Timed out waiting for {url}')
+
+def proc_usage(pid):
+    # (cpu_seconds, rss_kb, peak_rss_kb) from /proc; None when unavailable.
+    try:
+        with open(f'/proc/{pid}/stat', 'r') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        cpu = (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+        memory = {}
+        with open(f'/proc/{pid}/status', 'r') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in ('VmRSS', 'VmHWM'):
+                    memory[key] = int(value.split()[0])
+        return cpu, memory.get('VmRSS'), memory.get('VmHWM')
+    except (OSError, ValueError, IndexError):
+        return None
+
+class Workload:
+    def __init__(self, args):
+        self.mix = parse_mix(args.mix)
+        self.models = [m for m in args.models.split(',') if m]
+        self.hot_ratio = args.hot_ratio
+        self.hot_prompts = [self.prompt() for _ in range(args.hot_prompts)]
+        self.ignore_cache = args.ignore_cache
+        self.prompt_ids = []
+
+    def prompt(self):
+        return ' '.join(random.choices(PROMPT_WORDS, k=12)) + f' #{random.getrandbits(48)}'
+
+    def next_request(self):
+        # Returns (endpoint, method, path, json_body).
+        endpoint = random.choices(list(self.mix), weights=list(self.mix.values()))[0]
+        if endpoint == 'rate' and not self.prompt_ids:
+            endpoint = 'chat'
+        if endpoint == 'stats':
+            return 'stats', 'GET', '/stats', None
+        if endpoint == 'rate':
+            prompt_id, model = random.choice(self.prompt_ids)
+            return 'rate', 'POST', '/rate', {'prompt_id': prompt_id, 'model': model, 'rating': random.randint(1, 5), 'feedback': 'bench'}
+        # Hot prompts repeat across the run and exercise the cache; the rest are unique.
+        hot = self.hot_prompts and random.random() < self.hot_ratio
+        prompt = random.choice(self.hot_prompts) if hot else self.prompt()
+        query = f'model={random.choice(self.models)}' + ('&ignore_cache=true' if self.ignore_cache else '')
+        return 'chat', 'POST', f'/chat?{query}', {'prompt': prompt}
+
+async def drive(base_url, workload, rps, duration, concurrency):
+    # Open-loop arrivals at a fixed rate; a request that would exceed
+    # `concurrency` in flight is counted as dropped instead of delaying the schedule.
+    samples = []
+    dropped = 0
+    in_flight = set()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        async def one(endpoint, method, path, body):
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+                status = response.status_code
+                if endpoint == 'chat' and status == 200:
+                    data = response.json()
+                    workload.prompt_ids.append((data['prompt_id'], data['model_used']))
+                    del workload.prompt_ids[:-1000]
+                    extra = {'from_cache': data.get('from_cache'), 'fallback': data.get('fallback_used')}
+                else:
+                    extra = {}
+            except httpx.HTTPError as e:
+                status, extra = type(e).__name__, {}
+            samples.append({'endpoint': endpoint, 'status': status, 'ms': (time.perf_counter() - start) * 1000, **extra})
+
+        started = time.perf_counter()
+        total = int(rps * duration)
+        for i in range(total):
+            delay = started + i / rps - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if len(in_flight) >= concurrency:
+                dropped += 1
+                continue
+            task = asyncio.ensure_future(one(*workload.next_request()))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+        if in_flight:
+            await asyncio.wait(in_flight)
+        elapsed = time.perf_counter() - started
+    return samples, dropped, elapsed
+
+def summarize(samples, elapsed):
+    endpoints = {}
+    for name in sorted({s['endpoint'] for s in samples}):
+        group = [s for s in samples if s['endpoint'] == name]
+        ok = sorted(s['ms'] for s in group if s['status'] == 200)
+        statuses = {}
+        for s in group:
+            statuses[str(s['status'])] = statuses.get(str(s['status']), 0) + 1
+        summary = {
+            'requests': len(group),
+            'ok': len(ok),
+            'errors': len(group) - len(ok),
+            'statuses': statuses,
+            'throughput_rps': round(len(ok) / elapsed, 2) if elapsed else None,
+            'p50_ms': percentile(ok, 50),
+            'p95_ms': percentile(ok, 95),
+            'p99_ms': percentile(ok, 99),
+            'max_ms': ok[-1] if ok else None
+        }
+        if name == 'chat':
+            summary['cache_hits'] = sum(1 for s in group if s.get('from_cache'))
+            summary['fallbacks'] = sum(1 for s in group if s.get('fallback'))
+        endpoints[name] = {k: round(v, 2) if isinstance(v, float) else v for k, v in summary.items()}
+    return endpoints
+
+def start_stack(args, workdir):
+    mock_port = free_port()
+    mock = subprocess.Popen(
+        [sys.executable, '-m', 'bench.mock_provider', '--port', str(mock_port), '--latency', args.latency,
+         '--error-rate', str(args.error_rate), '--rate-limit-rate', str(args.rate_limit_rate),
+         '--retry-after', str(args.retry_after)] + (['--seed', str(args.seed)] if args.seed is not None else []),
+        cwd=REPO_DIR)
+    mock_url = f'http://127.0.0.1:{mock_port}'
+    wait_for(f'{mock_url}/mock/stats', mock)
+    env = dict(os.environ)
+    env.update({
+        'GROQ_API_KEY': 'bench', 'GEMINI_API_KEY': 'bench',
+        'GROQ_API_URL': f'{mock_url}/openai/v1/chat/completions', 'GEMINI_API_URL': mock_url,
+        'LLM_ROUTER_LOG_DIR': os.path.join(workdir, 'logs'),
+        'LLM_ROUTER_CACHE_DB': os.path.join(workdir, 'cache.db'),
+    })
+    env.update(dict(item.split('=', 1) for item in args.router_env))
+    router_port = free_port()
+    router = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'main:app', '--host', '127.0.0.1', '--port', str(router_port), '--log-level', 'warning'],
+        cwd=REPO_DIR, env=env)
+    router_url = f'http://127.0.0.1:{router_port}'
+    try:
+        wait_for(f'{router_url}/models', router)
+    except RuntimeError:
+        mock.terminate()
+        raise
+    return mock, mock_url, router, router_url
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def run(args):
+    with tempfile.TemporaryDirectory(prefix='llm-router-bench-') as workdir:
+        mock = router = None
+        if args.router_url:
+            router_url, router_pid = args.router_url, args.router_pid
+        else:
+            mock, mock_url, router, router_url = start_stack(args, workdir)
+            router_pid = router.pid
+        try:
+            workload = Workload(args)
+            if args.warmup:
+                asyncio.run(drive(router_url, workload, args.rps, args.warmup, args.concurrency))
+            before = proc_usage(router_pid) if router_pid else None
+            samples, dropped, elapsed = asyncio.run(drive(router_url, workload, args.rps, args.duration, args.concurrency))
+            after = proc_usage(router_pid) if router_pid else None
+            upstream = httpx.get(f'{mock_url}/mock/stats').json()['requests'] if mock else None
+        finally:
+            for process in (router, mock):
+                if process is not None:
+                    process.terminate()
+                    process.wait(10)
+    completed = len(samples)
+    result = {
+        'label': args.label,
+        'timestamp': datetime.utcnow().isoformat(),
+        'commit': git_commit(),
+        'config': {
+            'rps': args.rps, 'duration': args.duration, 'concurrency': args.concurrency, 'mix': args.mix,
+            'models': args.models, 'hot_ratio': args.hot_ratio, 'ignore_cache': args.ignore_cache,
+            'latency': args.latency, 'error_rate': args.error_rate, 'rate_limit_rate': args.rate_limit_rate,
+            'router_env': args.router_env
+        },
+        'elapsed_s': round(elapsed, 3),
+        'requests': completed,
+        'dropped': dropped,
+        'throughput_rps': round(sum(1 for s in samples if s['status'] == 200) / elapsed, 2),
+        'upstream_requests': upstream,
+        'endpoints': summarize(samples, elapsed)
+    }
+    if before and after and completed:
+        result['router'] = {
+            'cpu_s': round(after[0] - before[0], 3),
+            'cpu_ms_per_request': round((after[0] - before[0]) * 1000 / completed, 3),
+            'rss_kb': after[1],
+            'peak_rss_kb': after[2],
+            'rss_growth_kb_per_1k_requests': round((after[1] - before[1]) * 1000 / completed, 1)
+        }
+    return result
+
+def save(result, results_dir=RESULTS_DIR):
+    os.makedirs(results_dir, exist_ok=True)
+    stamp = result['timestamp'].replace(':', '').replace('-', '').split('.')[0]
+    path = os.path.join(results_dir, f"{stamp}-{result['label']}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+    with open(os.path.join(results_dir, 'history.jsonl'), 'a', encoding='utf-8') as f:
+        f.write(json.dumps(result) + '\n')
+    return path
+
+def load_baseline(spec, label, results_dir=RESULTS_DIR):
+    # "last" is the previous run with the same label in history.jsonl.
+    if spec != 'last':
+        with open(spec, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    baseline = None
+    try:
+        with open(os.path.join(results_dir, 'history.jsonl'), 'r', encoding='utf-8') as f:
+            for line in f:
+                entry = json.loads(line)
+                if entry.get('label') == label:
+                    baseline = entry
+    except (OSError, ValueError):
+        return None
+    return baseline
+
+def compare(result, baseline, tolerance):
+    # Returns a list of regression messages; lower is better for latency and
+    # CPU, higher for throughput.
+    checks = []
+    for name, current in result['endpoints'].items():
+        previous = baseline.get('endpoints', {}).get(name)
+        if not previous:
+            continue
+        for key in ('p95_ms', 'p99_ms'):
+            checks.append((f'{name} {key}', previous.get(key), current.get(key), False))
+        checks.append((f'{name} throughput_rps', previous.get('throughput_rps'), current.get('throughput_rps'), True))
+    if 'router' in result and 'router' in baseline:
+        checks.append(('router cpu_ms_per_request', baseline['router']['cpu_ms_per_request'], result['router']['cpu_ms_per_request'], False))
+    regressions = []
+    for name, old, new, higher_is_better in checks:
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        print(f'  {name:32} {old:>10} -> {new:>10}  ({change:+.1%})')
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append(f'{name} {old} -> {new} ({change:+.1%})')
+    return regressions
+
+def report(result):
+    print(f"{result['label']}: {result['requests']} requests in {result['elapsed_s']}s, "
+          f"{result['throughput_rps']} ok/s, {result['dropped']} dropped, {result['upstream_requests']} upstream calls")
+    for name, s in result['endpoints'].items():
+        print(f"  {name:6} n={s['requests']:<6} ok={s['ok']:<6} p50={s['p50_ms']}ms p95={s['p95_ms']}ms p99={s['p99_ms']}ms statuses={s['statuses']}")
+    if 'router' in result:
+        r = result['router']
+        print(f"  router cpu={r['cpu_ms_per_request']}ms/request rss={r['rss_kb']}KB peak={r['peak_rss_kb']}KB "
+              f"growth={r['rss_growth_kb_per_1k_requests']}KB/1k requests")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test the router against a local mock provider.')
+    parser.add_argument('--rps', type=float, default=50)
+    parser.add_argument('--duration', type=float, default=30, help='Seconds of measured load')
+    parser.add_argument('--warmup', type=float, default=3, help='Seconds of unmeasured load first')
+    parser.add_argument('--concurrency', type=int, default=64, help='Max requests in flight')
+    parser.add_argument('--mix', default='chat=0.8,stats=0.1,rate=0.1')
+    parser.add_argument('--models', default=DEFAULT_MODELS)
+    parser.add_argument('--hot-prompts', type=int, default=50, help='Size of the repeated prompt set')
+    parser.add_argument('--hot-ratio', type=float, default=0.3, help='Fraction of chats that reuse a hot prompt')
+    parser.add_argument('--ignore-cache', action='store_true')
+    parser.add_argument('--latency', default='lognormal:300,0.5', help='Mock provider latency distribution')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--retry-after', type=float, default=1.0)
+    parser.add_argument('--router-env', action='append', default=[], metavar='KEY=VALUE', help='Extra environment for the router process')
+    parser.add_argument('--router-url', help='Drive an already running router instead of starting one (no mock, no CPU stats without --router-pid)')
+    parser.add_argument('--router-pid', type=int)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--label', default='default')
+    parser.add_argument('--results-dir', default=RESULTS_DIR)
+    parser.add_argument('--no-save', action='store_true')
+    parser.add_argument('--compare', help='"last" (previous run with this label) or a result file')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='Allowed relative regression for --compare')
+    args = parser.parse_args(argv)
+    if args.seed is not None:
+        random.seed(args.seed)
+    baseline = load_baseline(args.compare, args.label, args.results_dir) if args.compare else None
+    result = run(args)
+    report(result)
+    if not args.no_save:
+        print(f'Saved {save(result, args.results_dir)}')
+    if args.compare:
+        if baseline is None:
+            print('No baseline to compare against')
+            return
+        print(f"Compared with {baseline.get('label')} at {baseline.get('commit')} ({baseline.get('timestamp')}):")
+        regressions = compare(result, baseline, args.tolerance)
+        if regressions:
+            print('Regressions: ' + '; '.join(regressions))
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+# Local stand-in for the Groq (OpenAI-compatible) and Gemini (REST) APIs, so
+# the router can be load tested without keys, quota or network noise.
+#
+#   python -m bench.mock_provider [--port 8900] [--latency lognormal:300,0.5] [--error-rate 0.01] [--rate-limit-rate 0.02]
+#
+# Point the router at it with GROQ_API_URL=http://127.0.0.1:8900/openai/v1/chat/completions
+# and GEMINI_API_URL=http://127.0.0.1:8900 (any API keys will do).
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+DEFAULT_LATENCY = os.getenv('LLM_ROUTER_MOCK_LATENCY', 'lognormal:300,0.5')
+
+def parse_latency(spec):
+    # Returns a sampler of delays in seconds:
+    #   fixed:MS | uniform:LOW-HIGH | normal:MEAN,STDDEV | lognormal:MEDIAN,SIGMA
+    kind, _, args = spec.partition(':')
+    try:
+        if kind == 'fixed':
+            ms = float(args)
+            return lambda: ms / 1000
+        if kind == 'uniform':
+            low, high = (float(v) for v in args.split('-'))
+            return lambda: random.uniform(low, high) / 1000
+        if kind == 'normal':
+            mean, stddev = (float(v) for v in args.split(','))
+            return lambda: max(0.0, random.gauss(mean, stddev)) / 1000
+        if kind == 'lognormal':
+            median, sigma = (float(v) for v in args.split(','))
+            return lambda: random.lognormvariate(0.0, sigma) * median / 1000
+    except ValueError:
+        pass
+    raise ValueError(f'Invalid latency spec: {spec!r}')
+
+class MockConfig:
+    def __init__(self, latency=DEFAULT_LATENCY, error_rate=0.0, rate_limit_rate=0.0, retry_after=1.0,
+                 response_tokens=64, chunks=8, seed=None):
+        self.latency = latency
+        self.sample_latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.response_tokens = response_tokens
+        self.chunks = max(1, chunks)
+        self.requests = 0
+        if seed is not None:
+            random.seed(seed)
+
+    def outcome(self):
+        # 'rate_limited', 'error' or 'ok', drawn independently per request.
+        self.requests += 1
+        roll = random.random()
+        if roll < self.rate_limit_rate:
+            return 'rate_limited'
+        if roll < self.rate_limit_rate + self.error_rate:
+            return 'error'
+        return 'ok'
+
+def _prompt_tokens(text):
+    return max(1, len(text) // 4)
+
+def _answer(prompt, tokens):
+    words = f'Mock answer to: {prompt}'.split()
+    return ' '.join((words * (tokens // max(1, len(words)) + 1))[:tokens])
+
+def create_app(config=None):
+    config = config or MockConfig()
+    app = FastAPI(title='llm-router mock provider')
+    app.state.config = config
+
+    async def delay_and_check():
+        # Sleeps for the sampled latency, then returns an error response or None.
+        outcome = config.outcome()
+        await asyncio.sleep(config.sample_latency())
+        if outcome == 'rate_limited':
+            return JSONResponse({'error': {'message': 'Rate limit reached (mock)', 'code': 429, 'status': 'RESOURCE_EXHAUSTED'}},
+                                status_code=429, headers={'retry-after': str(config.retry_after)})
+        if outcome == 'error':
+            return JSONResponse({'error': {'message': 'Internal error (mock)', 'code': 500, 'status': 'INTERNAL'}}, status_code=500)
+        return None
+
+    def split(text):
+        words = text.split(' ')
+        size = max(1, len(words) // config.chunks)
+        return [' '.join(words[i:i + size]) + (' ' if i + size < len(words) else '') for i in range(0, len(words), size)]
+
+    @app.post('/openai/v1/chat/completions')
+    async def groq_chat(request: Request):
+        body = await request.json()
+        prompt = ' '.join(m.get('content', '') for m in body.get('messages', []))
+        error = await delay_and_check()
+        if error is not None:
+            return error
+        text = _answer(prompt, config.response_tokens)
+        usage = {'prompt_tokens': _prompt_tokens(prompt), 'completion_tokens': config.response_tokens,
+                 'total_tokens': _prompt_tokens(prompt) + config.response_tokens}
+        if not body.get('stream'):
+            return {
+                'id': f'mock-{config.requests}',
+                'object': 'chat.completion',
+                'model': body.get('model'),
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text}, 'finish_reason': 'stop'}],
+                'usage': usage
+            }
+
+        async def events():
+            for piece in split(text):
+                yield 'data: ' + json.dumps({'choices': [{'index': 0, 'delta': {'content': piece}}]}) + '\n\n'
+            yield 'data: ' + json.dumps({'choices': [], 'usage': usage}) + '\n\n'
+            yield 'data: [DONE]\n\n'
+        return StreamingResponse(events(), media_type='text/event-stream')
+
+    def gemini_response(text, prompt, final=True):
+        response = {'candidates': [{'content': {'role': 'model', 'parts': [{'text': text}]}, 'index': 0}]}
+        if final:
+            response['candidates'][0]['finishReason'] = 'STOP'
+            response['usageMetadata'] = {'promptTokenCount': _prompt_tokens(prompt), 'candidatesTokenCount': config.response_tokens,
+                                         'totalTokenCount': _prompt_tokens(prompt) + config.response_tokens}
+        return response
+
+    @app.post('/v1beta/models/{model_action:path}')
+    async def gemini_generate(model_action: str, request: Request):
+        body = await request.json()
+        prompt = ' '.join(part.get('text', '') for content in body.get('contents', []) for part in content.get('parts', []))
+        error = await delay_and_check()
+        if error is not None:
+            return error
+        text = _answer(prompt, config.response_tokens)
+        if not model_action.endswith(':streamGenerateContent'):
+            return gemini_response(text, prompt)
+        pieces = split(text)
+
+        async def events():
+            for i, piece in enumerate(pieces):
+                yield 'data: ' + json.dumps(gemini_response(piece, prompt, final=i == len(pieces) - 1)) + '\r\n\r\n'
+        return StreamingResponse(events(), media_type='text/event-stream')
+
+    @app.get('/mock/stats')
+    def mock_stats():
+        return {'requests': config.requests, 'latency': config.latency}
+
+    return app
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Mock Groq/Gemini provider for load tests.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency', default=DEFAULT_LATENCY, help='fixed:MS | uniform:LOW-HIGH | normal:MEAN,STDDEV | lognormal:MEDIAN,SIGMA')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with a 500')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Fraction of requests answered with a 429')
+    parser.add_argument('--retry-after', type=float, default=1.0, help='Retry-After seconds sent with 429s')
+    parser.add_argument('--response-tokens', type=int, default=64)
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args(argv)
+    import uvicorn
+    config = MockConfig(args.latency, args.error_rate, args.rate_limit_rate, args.retry_after, args.response_tokens, seed=args.seed)
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level='warning')
+
+if __name__ == '__main__':
+    main()
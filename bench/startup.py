@@ -0,0 +1,166 @@
+# Cold-start benchmark: how long a fresh replica takes to import main.py, to
+# answer /healthz, to pass /readyz (startup prewarm against the mock
+# provider) and to serve its first uncached /chat.
+#
+#   python -m bench.startup [--runs 5] [--router-env KEY=VALUE ...] [--label startup] [--compare last|PATH]
+#
+# Results go to bench/results/ next to bench.load's, so running this once per
+# release keeps a startup-time history; --compare exits non-zero when a
+# median regressed by more than --tolerance.
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+import tempfile
+from datetime import datetime
+import httpx
+from bench.load import RESULTS_DIR, REPO_DIR, free_port, wait_for, git_commit, save, load_baseline
+
+IMPORT_SNIPPET = 'import time; t = time.perf_counter(); import main; print((time.perf_counter() - t) * 1000)'
+METRICS = ('import_ms', 'healthz_ms', 'ready_ms', 'first_chat_ms')
+
+def _router_env(workdir, mock_url, extra):
+    env = dict(os.environ)
+    env.update({
+        'GROQ_API_KEY': 'bench', 'GEMINI_API_KEY': 'bench',
+        'GROQ_API_URL': f'{mock_url}/openai/v1/chat/completions', 'GEMINI_API_URL': mock_url,
+        'LLM_ROUTER_LOG_DIR': os.path.join(workdir, 'logs'),
+        'LLM_ROUTER_CACHE_DB': os.path.join(workdir, 'cache.db'),
+    })
+    env.update(dict(item.split('=', 1) for item in extra))
+    return env
+
+def import_time(env):
+    # A fresh interpreter each time: nothing is in sys.modules yet.
+    out = subprocess.run([sys.executable, '-c', IMPORT_SNIPPET], cwd=REPO_DIR, env=env, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+def slowest_imports(env, top=10):
+    # Cumulative -X importtime of main's direct imports, slowest first.
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import main'], cwd=REPO_DIR, env=env, capture_output=True, text=True, check=True)
+    modules = []
+    for line in out.stderr.splitlines():
+        fields = line.split('|')
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        name = fields[2].rstrip()
+        if len(name) - len(name.lstrip()) == 3:
+            modules.append((name.strip(), round(int(fields[1]) / 1000, 1)))
+    return sorted(modules, key=lambda item: -item[1])[:top]
+
+def _poll(url, process, deadline, status=200):
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'{process.args} exited with {process.returncode}')
+        try:
+            if httpx.get(url, timeout=1).status_code == status:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.005)
+    raise RuntimeError(f'Timed out waiting for {url}')
+
+def boot(env, run, timeout=60):
+    # Milliseconds from spawning the server to each milestone.
+    port = free_port()
+    started = time.perf_counter()
+    router = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'main:app', '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning'],
+        cwd=REPO_DIR, env=env)
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        deadline = time.time() + timeout
+        _poll(f'{base_url}/healthz', router, deadline)
+        healthz_ms = (time.perf_counter() - started) * 1000
+        _poll(f'{base_url}/readyz', router, deadline)
+        ready_ms = (time.perf_counter() - started) * 1000
+        checks = httpx.get(f'{base_url}/readyz').json()['checks']
+        sent = time.perf_counter()
+        resp = httpx.post(f'{base_url}/chat', params={'model': 'llama-3.1-8b-instant'}, json={'prompt': f'cold start {run} {time.time()}'}, timeout=30)
+        resp.raise_for_status()
+        first_chat_ms = (time.perf_counter() - sent) * 1000
+    finally:
+        router.terminate()
+        router.wait(10)
+    return {'healthz_ms': healthz_ms, 'ready_ms': ready_ms, 'first_chat_ms': first_chat_ms, 'checks': checks}
+
+def run(args):
+    with tempfile.TemporaryDirectory(prefix='llm-router-startup-') as workdir:
+        mock_port = free_port()
+        mock = subprocess.Popen([sys.executable, '-m', 'bench.mock_provider', '--port', str(mock_port), '--latency', 'fixed:0'], cwd=REPO_DIR)
+        mock_url = f'http://127.0.0.1:{mock_port}'
+        try:
+            wait_for(f'{mock_url}/mock/stats', mock)
+            samples = []
+            for i in range(args.runs):
+                # A new cache and log directory per boot: every run is a cold node.
+                env = _router_env(os.path.join(workdir, str(i)), mock_url, args.router_env)
+                sample = boot(env, i)
+                sample['import_ms'] = import_time(env)
+                samples.append(sample)
+            imports = slowest_imports(env)
+        finally:
+            mock.terminate()
+            mock.wait(10)
+    result = {
+        'label': args.label,
+        'timestamp': datetime.utcnow().isoformat(),
+        'commit': git_commit(),
+        'config': {'runs': args.runs, 'router_env': args.router_env, 'python': sys.version.split()[0]},
+        'startup': {name: round(statistics.median(s[name] for s in samples), 1) for name in METRICS},
+        'prewarm_ms': {name: check['ms'] for name, check in samples[-1]['checks'].items()},
+        'slowest_imports_ms': dict(imports)
+    }
+    result['startup'].update({f'{name}_max': round(max(s[name] for s in samples), 1) for name in METRICS})
+    return result
+
+def compare(result, baseline, tolerance):
+    # Every startup metric is lower-is-better; medians only, maxima are noisy.
+    regressions = []
+    for name in METRICS:
+        old, new = baseline.get('startup', {}).get(name), result['startup'].get(name)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        print(f'  {name:16} {old:>10} -> {new:>10}  ({change:+.1%})')
+        if change > tolerance:
+            regressions.append(f'{name} {old} -> {new} ({change:+.1%})')
+    return regressions
+
+def report(result):
+    s = result['startup']
+    print(f"{result['label']}: median of {result['config']['runs']} cold starts: import {s['import_ms']}ms, /healthz {s['healthz_ms']}ms, "
+          f"/readyz {s['ready_ms']}ms, first /chat {s['first_chat_ms']}ms")
+    print('  prewarm: ' + ', '.join(f'{name} {ms}ms' for name, ms in result['prewarm_ms'].items()))
+    print('  slowest imports: ' + ', '.join(f'{name} {ms}ms' for name, ms in result['slowest_imports_ms'].items()))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure cold-start time of the router.')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--router-env', action='append', default=[], metavar='KEY=VALUE', help='Extra environment for the router process')
+    parser.add_argument('--label', default='startup')
+    parser.add_argument('--results-dir', default=RESULTS_DIR)
+    parser.add_argument('--no-save', action='store_true')
+    parser.add_argument('--compare', help='"last" (previous run with this label) or a result file')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative regression for --compare')
+    args = parser.parse_args(argv)
+    baseline = load_baseline(args.compare, args.label, args.results_dir) if args.compare else None
+    result = run(args)
+    report(result)
+    if not args.no_save:
+        print(f'Saved {save(result, args.results_dir)}')
+    if args.compare:
+        if baseline is None:
+            print('No baseline to compare against')
+            return
+        print(f"Compared with {baseline.get('label')} at {baseline.get('commit')} ({baseline.get('timestamp')}):")
+        regressions = compare(result, baseline, args.tolerance)
+        if regressions:
+            print('Regressions: ' + '; '.join(regressions))
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+# Multi-worker deployment: one uvicorn worker per core behind gunicorn.
+#
+#   gunicorn -c gunicorn.conf.py main:app
+#
+# Workers share the response cache (SQLite WAL), rate-limit buckets, circuit
+# state, sessions, the spend ledger and /metrics through files under
+# LLM_ROUTER_STATE_DIR, and each writes its own log segments, which /stats
+# follows across all workers. Request coalescing, the in-process LRU and the
+# semantic index stay per worker. Variables already set in the environment win.
+import os
+import glob
+import multiprocessing
+
+bind = os.getenv('LLM_ROUTER_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('LLM_ROUTER_WORKERS', str(multiprocessing.cpu_count())))
+worker_class = 'uvicorn.workers.UvicornWorker'
+# Provider calls can take a while; the per-attempt timeouts are enforced by the router.
+timeout = int(os.getenv('LLM_ROUTER_WORKER_TIMEOUT', '120'))
+graceful_timeout = 30
+keepalive = 5
+
+state_dir = os.getenv('LLM_ROUTER_STATE_DIR', 'state')
+os.makedirs(state_dir, exist_ok=True)
+os.environ.setdefault('LLM_ROUTER_LOG_PER_WORKER', '1')
+os.environ.setdefault('LLM_ROUTER_RATE_LIMIT_DB', os.path.join(state_dir, 'shared.db'))
+os.environ.setdefault('LLM_ROUTER_HEALTH_DB', os.path.join(state_dir, 'shared.db'))
+os.environ.setdefault('LLM_ROUTER_LEDGER_DB', os.path.join(state_dir, 'shared.db'))
+os.environ.setdefault('LLM_ROUTER_SESSION_DB', os.path.join(state_dir, 'shared.db'))
+os.environ.setdefault('LLM_ROUTER_METRICS_DIR', os.path.join(state_dir, 'metrics'))
+
+def on_starting(server):
+    # Metrics snapshots from a previous run would be summed into this one's.
+    for path in glob.glob(os.path.join(os.environ['LLM_ROUTER_METRICS_DIR'], 'metrics-*.json')):
+        os.remove(path)
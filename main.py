@@ -1,191 +1,548 @@
 import os
 import time
+import uuid
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, Query, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 from pydantic import BaseModel
 from typing import Optional
-from utils.logger import log_interaction, log_rating, get_prompt_id, log_rating_v2
-from utils.tokens import estimate_token_count
+from utils.logger import log_interaction, log_interactions, interaction_entry, log_rating, get_prompt_id, log_rating_v2, load_stats
+from utils.tokens import count_message_tokens
 import json
 from datetime import datetime
 from dotenv import load_dotenv
-from utils.cache import get_cached_response, store_response
-from collections import defaultdict
-import requests
-import re
+from utils.cache import response_cache, aget_cached_response, aget_semantic_response, aget_cached_responses, aget_semantic_responses, store_response, store_responses, cache_key
+from utils.templates import registry as templates
+from utils import metrics, tracing, analytics, cache_warm, startup
+from utils.analytics import AnalyticsError
+from utils.dispatch import resolve_prompt, resolve_model, generate_response, hedge_delay, inflight, record_upstream_error, template_fields, account_usage, usage_fields, resolve_session
+from utils import sessions
+from utils.sessions import build_messages
+from utils.accounting import ledger, PRICES
+from models.http_client import aclose_async_client
+from models.registry import get_handler, provider_for, AVAILABLE_MODELS
+from models.usage import total_tokens
+from utils.routing import router
+from utils.ratelimit import limiter, RateLimitTimeout, EXPECTED_COMPLETION_TOKENS
+from models.errors import classify, RATE_LIMIT, TRANSIENT, INVALID_REQUEST, SAFETY
+from utils.retry import RetryBudget
 
 load_dotenv()
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    load_stats()
+    metrics.start_multiprocess_flush()
+    analytics.get_store().start()
+    ledger.start()
+    cache_warm.start_background_warm()
+    # Cache, tokenizers and configured providers warm up in parallel while the
+    # server already answers; /readyz passes once they are done.
+    prewarm = asyncio.create_task(startup.prewarm())
+    yield
+    prewarm.cancel()
+    await aclose_async_client()
+    # Spend recorded since the last periodic flush.
+    ledger.flush()
 
-# Load prompt templates
-try:
-    with open('prompt_templates.json', 'r', encoding='utf-8') as f:
-        PROMPT_TEMPLATES = json.load(f)
-except Exception:
-    PROMPT_TEMPLATES = {}
+app = FastAPI(lifespan=lifespan)
+
+@app.get('/healthz')
+def healthz():
+    # Liveness: the process is up and serving, warm or not.
+    return {'status': 'ok'}
+
+@app.get('/readyz')
+def readyz():
+    snapshot = startup.state.snapshot()
+    return JSONResponse(snapshot, status_code=200 if snapshot['status'] == 'ready' else 503)
 
 class ChatRequest(BaseModel):
     prompt: str
     template: Optional[str] = None
 
 @app.post('/chat')
-async def chat_endpoint(request: Request, model: str = Query(...), ignore_cache: bool = Query(False)):
-    from models.groq_handler import GroqHandler
-    from models.gemini_handler import GeminiHandler
-    body = await request.json()
-    prompt = body.get('prompt')
-    template = body.get('template')
-    template_id = body.get('template_id')
-    template_vars = body.get('template_vars', {})
-    # Prompt Template Logic
-    if template_id:
-        # Load templates as list
-        with open('prompt_templates.json', 'r', encoding='utf-8') as f:
-            templates = json.load(f)
-        template_obj = next((t for t in templates if t['id'] == template_id), None)
-        if not template_obj:
-            raise HTTPException(status_code=400, detail=f'Template id {template_id} not found')
-        # Substitute variables in template
-        def sub_vars(tmpl, vars):
-            def repl(match):
-                key = match.group(1)
-                return str(vars.get(key, f'{{{{{key}}}}}'))
-            return re.sub(r'\{\{(.*?)\}\}', repl, tmpl)
-        prompt = sub_vars(template_obj['prompt'], template_vars)
-    elif template and template in PROMPT_TEMPLATES:
-        prompt = PROMPT_TEMPLATES[template].replace('{prompt}', prompt)
-    if not prompt:
-        raise HTTPException(status_code=400, detail='Missing prompt')
+async def chat_endpoint(request: Request, model: str = Query(...), ignore_cache: bool = Query(False), semantic: bool = Query(True), stream: bool = Query(False),
+                        hedge_after_ms: Optional[int] = Query(None), hedge: bool = Query(False), timings: bool = Query(False)):
+    if stream:
+        return await chat_stream_endpoint(request, model, ignore_cache, timings)
+    trace = tracing.start_trace('POST /chat', request.headers.get('traceparent'), **{'llm.model': model})
+    try:
+        payload = await chat_payload(request, model, ignore_cache, semantic, hedge_after_ms, hedge)
+    except BaseException as e:
+        tracing.end_trace(trace, e)
+        raise
+    tracing.end_trace(trace)
+    cache = {True: 'hit', 'semantic': 'semantic'}.get(payload['from_cache'], 'bypass' if ignore_cache else 'miss')
+    metrics.request_duration.observe(trace.root.duration_ms() / 1000, '/chat', cache)
+    if not (timings or tracing.SERVER_TIMING):
+        return JSONResponse(payload)
+    # Where the time went: per-stage totals, and every upstream attempt
+    # including failed fallbacks and hedges that lost.
+    payload['timings'] = trace.timings()
+    return JSONResponse(payload, headers={'Server-Timing': trace.server_timing()})
+
+async def chat_payload(request, model, ignore_cache, semantic, hedge_after_ms, hedge):
+    with tracing.span('parse'):
+        body = await request.json()
+        prompt = resolve_prompt(body)
+        model = resolve_model(model)
+    session_id, history, params = resolve_session(body)
+    template = template_fields(body)
+    session = {'session_id': session_id} if session_id else {}
     # Check cache first unless ignore_cache is True
     if not ignore_cache:
-        cached_response, cached_timestamp = get_cached_response(prompt, model)
+        from_cache = True
+        similarity = None
+        with tracing.span('cache_exact'):
+            lookup_started = time.perf_counter()
+            cached_response, cached_timestamp = await aget_cached_response(prompt, model, params)
+            metrics.cache_lookup_duration.observe(time.perf_counter() - lookup_started, 'exact')
+        metrics.cache_requests.inc('exact', 'miss' if cached_response is None else 'hit')
+        if cached_response is None and semantic and response_cache.semantic is not None:
+            # Near-duplicate tier; only populated when LLM_ROUTER_SEMANTIC_CACHE=1.
+            with tracing.span('cache_semantic'):
+                lookup_started = time.perf_counter()
+                cached_response, cached_timestamp, similarity = await aget_semantic_response(prompt, model, params)
+                metrics.cache_lookup_duration.observe(time.perf_counter() - lookup_started, 'semantic')
+            metrics.cache_requests.inc('semantic', 'miss' if cached_response is None else 'hit')
+            from_cache = 'semantic'
         if cached_response is not None:
             timestamp = cached_timestamp.isoformat() if cached_timestamp else None
             prompt_id = get_prompt_id(timestamp, prompt, model)
-            log_interaction(timestamp, prompt, model, cached_response, 0, None, prompt_id, from_cache=True)
-            return JSONResponse({
+            with tracing.span('log'):
+                log_interaction(timestamp, prompt, model, cached_response, 0, None, prompt_id, from_cache=from_cache, **template, **session)
+            payload = {
                 'prompt_id': prompt_id,
                 'model_used': model,
                 'response_text': cached_response,
                 'latency_ms': 0,
                 'token_count': None,
-                'from_cache': True
-            })
-    # Provider detection for Groq and Google
-    def is_gemini(m):
-        return m and m.startswith('gemini')
-    def is_llama(m):
-        return m and m.startswith((
-            'llama-3.1-8b',
-            'llama-3.3-70b',
-            'deepseek',
-            'meta-llama/llama-4-maverick',
-            'meta-llama/llama-4-scout',
-            'meta-llama/llama-prompt-guard-2-22m',
-            'meta-llama/llama-prompt-guard-2-86m',
-            'mistral',
-            'moonshotai/'
-        ))
-    response_text = None
-    model_used = None
-    latency_ms = None
-    token_count = None
-    error = None
-    errors = {}
-    tried_models = []
-    if is_llama(model):
-        # Try user model, then fallback to llama-3.1-8b-instant
-        for m in [model, 'llama-3.1-8b-instant']:
-            if m in tried_models:
-                continue
-            tried_models.append(m)
-            try:
-                handler = GroqHandler(model_override=m)
-                start = time.time()
-                result = handler.generate(prompt)
-                if isinstance(result, tuple):
-                    response_text, model_token_count = result
-                else:
-                    response_text, model_token_count = result, None
-                latency_ms = int((time.time() - start) * 1000)
-                model_used = m
-                if model_token_count is not None:
-                    token_count = model_token_count
-                else:
-                    token_count = estimate_token_count(prompt + response_text, model=m)
-                break
-            except Exception as e:
-                error = str(e)
-                errors[m] = error
-                response_text = None
-        if response_text is None:
-            detail = f"All Llama/Groq models failed. Errors: {errors}"
-            raise HTTPException(status_code=500, detail=detail)
-    elif is_gemini(model):
-        # Try user model, then fallback to gemini-2.5-flash
-        for m in [model, 'gemini-2.5-flash']:
-            if m in tried_models:
-                continue
-            tried_models.append(m)
-            try:
-                handler = GeminiHandler(model_override=m)
-                start = time.time()
-                result = handler.generate(prompt)
-                if isinstance(result, tuple):
-                    response_text, model_token_count = result
-                else:
-                    response_text, model_token_count = result, None
-                latency_ms = int((time.time() - start) * 1000)
-                model_used = m
-                if model_token_count is not None:
-                    token_count = model_token_count
-                else:
-                    token_count = estimate_token_count(prompt + response_text, model=m)
-                break
-            except Exception as e:
-                error = str(e)
-                errors[m] = error
-                response_text = None
-        if response_text is None:
-            detail = f"All Gemini/Google models failed. Errors: {errors}"
-            raise HTTPException(status_code=500, detail=detail)
-    else:
+                'from_cache': from_cache
+            }
+            if similarity is not None:
+                payload['similarity'] = round(similarity, 4)
+            if session_id:
+                sessions.store.append(session_id, prompt, cached_response)
+            payload.update(session)
+            return payload
+    provider = provider_for(model)
+    if provider is None:
         raise HTTPException(status_code=400, detail=f"Unknown model provider for model: {model}")
+    hedge_after = hedge_delay(model, hedge_after_ms, hedge)
+    with tracing.span('dispatch') as span:
+        result, coalesced = await inflight.do(
+            cache_key(prompt, model, params),
+            lambda: generate_response(prompt, model, provider, hedge_after, history=history, params=params)
+        )
+        if span is not None:
+            span.set(coalesced=coalesced)
+    model_used = result['model_used']
     timestamp = datetime.utcnow().isoformat()
     prompt_id = get_prompt_id(timestamp, prompt, model_used)
-    # Store in cache
-    store_response(prompt, model_used, response_text, datetime.utcnow())
-    log_interaction(timestamp, prompt, model_used, response_text, latency_ms, token_count, prompt_id, from_cache=False)
-    return JSONResponse({
+    fallback_used = model_used != model
+    if fallback_used:
+        metrics.fallbacks.inc(model, model_used)
+    extra = {'hedge': result['hedge']} if result.get('hedge') else {}
+    extra['retries'] = result['retries']
+    extra.update(usage_fields(result))
+    if session_id:
+        sessions.store.append(session_id, prompt, result['response_text'])
+        extra.update(session, context_turns=result.get('context_turns', 0))
+    with tracing.span('log'):
+        log_interaction(timestamp, prompt, model_used, result['response_text'], result['latency_ms'], result['token_count'], prompt_id,
+                        from_cache=False, fallback_used=fallback_used, **template, **extra)
+    return {
         'prompt_id': prompt_id,
         'model_used': model_used,
+        'response_text': result['response_text'],
+        'latency_ms': result['latency_ms'],
+        'token_count': result['token_count'],
+        'from_cache': False,
+        'fallback_used': fallback_used,
+        'coalesced': coalesced,
+        **extra
+    }
+
+# /chat/batch limits: items per request, and upstream calls in flight per
+# provider (LLM_ROUTER_BATCH_CONCURRENCY, or e.g. LLM_ROUTER_BATCH_CONCURRENCY_GROQ).
+BATCH_MAX_ITEMS = int(os.getenv('LLM_ROUTER_BATCH_MAX_ITEMS', '1000'))
+
+def batch_concurrency(provider):
+    default = os.getenv('LLM_ROUTER_BATCH_CONCURRENCY', '8')
+    return max(1, int(os.getenv(f'LLM_ROUTER_BATCH_CONCURRENCY_{provider.upper()}', default)))
+
+def ndjson_line(data):
+    return json.dumps(data, ensure_ascii=False) + '\n'
+
+async def traced(body, name, traceparent, **attributes):
+    # Streamed bodies run after their handler has returned, so the trace
+    # starts on the first read and ends when the stream finishes or is closed.
+    trace = tracing.start_trace(name, traceparent, **attributes)
+    error = None
+    try:
+        async for chunk in body:
+            yield chunk
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        tracing.end_trace(trace, error)
+
+async def batch_call(item, semaphore):
+    try:
+        async with semaphore:
+            with tracing.span('dispatch', **{'llm.model': item['model'], 'batch.index': item['index']}) as span:
+                result, coalesced = await inflight.do(
+                    cache_key(item['prompt'], item['model']),
+                    lambda: generate_response(item['prompt'], item['model'], item['provider'], store=False)
+                )
+                if span is not None:
+                    span.set(coalesced=coalesced)
+    except HTTPException as e:
+        return item, None, {'error': e.detail, 'status_code': e.status_code}
+    except Exception as e:
+        return item, None, {'error': str(e), 'status_code': 500}
+    return item, result, coalesced
+
+async def batch_results(items, ignore_cache, semantic):
+    # One NDJSON line per item, in completion order: invalid items and cache
+    # hits first, then upstream results as they finish. Log entries and cache
+    # inserts are collected and written once when the batch ends.
+    log_entries = []
+    cache_entries = []
+    tasks = []
+    try:
+        pending = []
+        for item in items:
+            if 'error' in item:
+                yield ndjson_line(item)
+            else:
+                pending.append(item)
+        if pending and not ignore_cache:
+            with tracing.span('cache_exact'):
+                hits = await aget_cached_responses([(item['prompt'], item['model']) for item in pending])
+            misses = []
+            for item, (response_text, cached_timestamp) in zip(pending, hits):
+                if response_text is None:
+                    misses.append(item)
+                    continue
+                yield ndjson_line(batch_cache_hit(item, response_text, cached_timestamp, True, None, log_entries))
+            if semantic and misses:
+                by_model = {}
+                for item in misses:
+                    by_model.setdefault(item['model'], []).append(item)
+                misses = []
+                for model, group in by_model.items():
+                    with tracing.span('cache_semantic', **{'llm.model': model}):
+                        hits = await aget_semantic_responses([item['prompt'] for item in group], model)
+                    for item, (response_text, cached_timestamp, similarity) in zip(group, hits):
+                        if response_text is None:
+                            misses.append(item)
+                            continue
+                        yield ndjson_line(batch_cache_hit(item, response_text, cached_timestamp, 'semantic', similarity, log_entries))
+            pending = misses
+        semaphores = {}
+        for item in pending:
+            semaphore = semaphores.get(item['provider'])
+            if semaphore is None:
+                semaphore = semaphores[item['provider']] = asyncio.Semaphore(batch_concurrency(item['provider']))
+            tasks.append(asyncio.ensure_future(batch_call(item, semaphore)))
+        for next_done in asyncio.as_completed(tasks):
+            item, result, coalesced = await next_done
+            if result is None:
+                yield ndjson_line({'index': item['index'], 'model': item['model'], **coalesced})
+                continue
+            model_used = result['model_used']
+            timestamp = datetime.utcnow().isoformat()
+            prompt_id = get_prompt_id(timestamp, item['prompt'], model_used)
+            fallback_used = model_used != item['model']
+            cache_entries.append((item['prompt'], model_used, result['response_text'], datetime.utcnow()))
+            log_entries.append(interaction_entry(timestamp, item['prompt'], model_used, result['response_text'], result['latency_ms'],
+                                                 result['token_count'], prompt_id, from_cache=False, fallback_used=fallback_used, batch=True,
+                                                 retries=result['retries'], **usage_fields(result), **item['log']))
+            yield ndjson_line({
+                'index': item['index'],
+                'prompt_id': prompt_id,
+                'model_used': model_used,
+                'response_text': result['response_text'],
+                'latency_ms': result['latency_ms'],
+                'token_count': result['token_count'],
+                'from_cache': False,
+                'fallback_used': fallback_used,
+                'retries': result['retries'],
+                **usage_fields(result),
+                'coalesced': coalesced
+            })
+    finally:
+        # Also runs when the client disconnects mid-batch: stop outstanding
+        # calls and keep whatever already completed.
+        for task in tasks:
+            task.cancel()
+        with tracing.span('log'):
+            store_responses(cache_entries)
+            log_interactions(log_entries)
+
+def batch_cache_hit(item, response_text, cached_timestamp, from_cache, similarity, log_entries):
+    timestamp = cached_timestamp.isoformat() if cached_timestamp else None
+    prompt_id = get_prompt_id(timestamp, item['prompt'], item['model'])
+    log_entries.append(interaction_entry(timestamp, item['prompt'], item['model'], response_text, 0, None, prompt_id, from_cache=from_cache, batch=True, **item['log']))
+    line = {
+        'index': item['index'],
+        'prompt_id': prompt_id,
+        'model_used': item['model'],
         'response_text': response_text,
-        'latency_ms': latency_ms,
-        'token_count': token_count,
-        'from_cache': False
-    })
+        'latency_ms': 0,
+        'token_count': None,
+        'from_cache': from_cache
+    }
+    if similarity is not None:
+        line['similarity'] = round(similarity, 4)
+    return line
+
+@app.post('/chat/batch')
+async def chat_batch_endpoint(request: Request, model: Optional[str] = Query(None), ignore_cache: bool = Query(False), semantic: bool = Query(True)):
+    # Body: {"items": [{"prompt": ..., "model": ...}, {"template_id": ..., "template_vars": {...}}, ...]}
+    # `model` in the query string is the default for items without one.
+    body = await request.json()
+    raw_items = body.get('items') if isinstance(body, dict) else body
+    if not isinstance(raw_items, list) or not raw_items:
+        raise HTTPException(status_code=400, detail='Expected a non-empty list of items')
+    if len(raw_items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f'Too many items ({len(raw_items)}); the limit is {BATCH_MAX_ITEMS}')
+    items = []
+    for index, raw in enumerate(raw_items):
+        try:
+            if not isinstance(raw, dict):
+                raise HTTPException(status_code=400, detail='Item must be an object')
+            item_model = raw.get('model') or model
+            if not item_model:
+                raise HTTPException(status_code=400, detail='Missing model')
+            prompt = resolve_prompt(raw)
+            item_model = resolve_model(item_model)
+            provider = provider_for(item_model)
+            if provider is None:
+                raise HTTPException(status_code=400, detail=f"Unknown model provider for model: {item_model}")
+            items.append({'index': index, 'prompt': prompt, 'model': item_model, 'provider': provider, 'log': template_fields(raw)})
+        except HTTPException as e:
+            items.append({'index': index, 'model': raw.get('model') if isinstance(raw, dict) else None, 'error': e.detail, 'status_code': e.status_code})
+    return StreamingResponse(traced(batch_results(items, ignore_cache, semantic), 'POST /chat/batch', request.headers.get('traceparent'),
+                                    **{'batch.items': len(items)}),
+                             media_type='application/x-ndjson')
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def stream_response(prompt, model, provider, ignore_cache, session_id=None, history=None, params=None, timings=False):
+    # Relays provider tokens as server-sent events: `token` events while the
+    # answer is generated, then one `done` event with the summary fields.
+    # Fallbacks are only tried if a model fails before its first token.
+    session = {'session_id': session_id} if session_id else {}
+    # Headers are sent before the first token, so timings ride on `done`.
+    trace = tracing.current_trace() if timings or tracing.SERVER_TIMING else None
+    if not ignore_cache:
+        with tracing.span('cache_exact'):
+            cached_response, cached_timestamp = await aget_cached_response(prompt, model, params)
+        if cached_response is not None:
+            timestamp = cached_timestamp.isoformat() if cached_timestamp else None
+            prompt_id = get_prompt_id(timestamp, prompt, model)
+            log_interaction(timestamp, prompt, model, cached_response, 0, None, prompt_id, from_cache=True, stream=True, **session)
+            if session_id:
+                sessions.store.append(session_id, prompt, cached_response)
+            yield sse_event('token', {'text': cached_response})
+            yield sse_event('done', {
+                'prompt_id': prompt_id,
+                'model_used': model,
+                'latency_ms': 0,
+                'ttft_ms': 0,
+                'tokens_per_sec': None,
+                'token_count': None,
+                'from_cache': True,
+                'fallback_used': False,
+                **session,
+                **({'timings': trace.timings()} if trace else {})
+            })
+            return
+    errors = {}
+    skipped = []
+    budget = RetryBudget()
+    for m in router.candidates(model):
+        if m in errors or m in skipped:
+            continue
+        admitted = budget.can_help(m) and router.allow(m)
+        if not admitted:
+            skipped.append(m)
+            continue
+        attempt = 0
+        failed = False
+        try:
+            while True:
+                chunks = []
+                token_count = None
+                first_token_at = None
+                permit = None
+                start = None
+                try:
+                    handler = get_handler(m)
+                    messages = build_messages(history, prompt, m)
+                    prompt_tokens = count_message_tokens(messages, model=m)
+                    with tracing.span('ratelimit', **{'llm.model': m}):
+                        permit = await limiter.acquire(m, handler.api_key, prompt_tokens + EXPECTED_COMPLETION_TOKENS,
+                                                       max_wait=min(limiter.max_wait, budget.remaining()))
+                    start = time.time()
+                    with tracing.span('upstream', **{'llm.model': m, 'attempt': attempt}):
+                        async for text, count in handler.astream(messages):
+                            if text:
+                                if first_token_at is None:
+                                    first_token_at = time.time()
+                                chunks.append(text)
+                                yield sse_event('token', {'text': text})
+                            if count is not None:
+                                token_count = count
+                except RateLimitTimeout as e:
+                    # Queued too long locally; the model itself did nothing wrong.
+                    errors[m] = str(e)
+                    failed = True
+                except Exception as e:
+                    errors[m] = str(e)
+                    if start is not None:
+                        record_upstream_error(m, e, start)
+                    kind = classify(e)
+                    if kind == RATE_LIMIT:
+                        limiter.penalize(m, handler.api_key, e.retry_after)
+                    # Before the first token the client has seen nothing, so the
+                    # same model gets the retries call_model() would give it.
+                    delay = None if chunks else budget.retry_delay(e, attempt)
+                    if delay is not None and (kind != RATE_LIMIT or delay <= limiter.max_wait):
+                        budget.record_retry(m)
+                        metrics.retries.inc(m, kind)
+                        attempt += 1
+                        if kind == TRANSIENT:
+                            await asyncio.sleep(delay)
+                        continue
+                    budget.record_failure(m, e)
+                    if kind not in (INVALID_REQUEST, SAFETY):
+                        router.record_failure(m, e, getattr(e, 'retry_after', None))
+                    if chunks or kind == INVALID_REQUEST:
+                        # Part of the answer already reached the client; switching
+                        # models now would splice two different answers together.
+                        # An invalid request fails the same way on every model.
+                        yield sse_event('error', {'detail': f'Stream from {m} failed: {e}', 'errors': errors, 'retries': budget.total_retries()})
+                        return
+                    failed = True
+                finally:
+                    if permit is not None:
+                        permit.release(total_tokens(token_count))
+                break
+        finally:
+            # No verdict (queued too long, rejected request, client gone) returns
+            # a half-open probe; record_success/record_failure settle the rest.
+            router.release(m, admitted)
+        if failed:
+            continue
+        end = time.time()
+        router.record_success(m, int(((first_token_at or end) - start) * 1000))
+        metrics.upstream_duration.observe(end - start, m, 'ok')
+        response_text = ''.join(chunks).strip()
+        latency_ms = int((end - start) * 1000)
+        ttft_ms = int(((first_token_at or end) - start) * 1000)
+        usage = account_usage(m, handler.api_key, prompt_tokens, response_text, token_count)
+        token_count = usage.pop('token_count')
+        decode_seconds = end - (first_token_at or end)
+        tokens_per_sec = round(usage['completion_tokens'] / decode_seconds, 2) if decode_seconds > 0 else None
+        fallback_used = m != model
+        if fallback_used:
+            metrics.fallbacks.inc(model, m)
+        timestamp = datetime.utcnow().isoformat()
+        prompt_id = get_prompt_id(timestamp, prompt, m)
+        store_response(prompt, m, response_text, datetime.utcnow(), params)
+        if session_id:
+            sessions.store.append(session_id, prompt, response_text)
+            session['context_turns'] = len(messages) - 1 if history else 0
+        retries = budget.total_retries()
+        log_interaction(timestamp, prompt, m, response_text, latency_ms, token_count, prompt_id, from_cache=False, fallback_used=fallback_used,
+                        stream=True, ttft_ms=ttft_ms, tokens_per_sec=tokens_per_sec, retries=retries, **usage, **session)
+        yield sse_event('done', {
+            'prompt_id': prompt_id,
+            'model_used': m,
+            'latency_ms': latency_ms,
+            'ttft_ms': ttft_ms,
+            'tokens_per_sec': tokens_per_sec,
+            'token_count': token_count,
+            **usage,
+            'from_cache': False,
+            'fallback_used': fallback_used,
+            'retries': retries,
+            **session,
+            **({'timings': trace.timings()} if trace else {})
+        })
+        return
+    if not errors:
+        yield sse_event('error', {'detail': f'All candidate models are unavailable (circuit open, rate limited or over budget): {skipped}', 'errors': errors})
+        return
+    yield sse_event('error', {'detail': f'All models failed. Errors: {errors}', 'errors': errors})
+
+@app.post('/chat/stream')
+async def chat_stream_endpoint(request: Request, model: str = Query(...), ignore_cache: bool = Query(False), timings: bool = Query(False)):
+    body = await request.json()
+    prompt = resolve_prompt(body)
+    model = resolve_model(model)
+    provider = provider_for(model)
+    if provider is None:
+        raise HTTPException(status_code=400, detail=f"Unknown model provider for model: {model}")
+    session_id, history, params = resolve_session(body)
+    return StreamingResponse(
+        traced(stream_response(prompt, model, provider, ignore_cache, session_id, history, params, timings),
+               'POST /chat/stream', request.headers.get('traceparent'), **{'llm.model': model}),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.post('/sessions')
+def create_session():
+    # A fresh id for `session_id`; clients may also pick their own.
+    session_id = uuid.uuid4().hex
+    sessions.store.history(session_id)
+    return {'session_id': session_id}
+
+@app.get('/sessions/{session_id}')
+def get_session(session_id: str):
+    turns, prefix = sessions.store.history(session_id)
+    return {'session_id': session_id, 'turns': [{'role': role, 'content': content} for role, content in turns], 'prefix_hash': prefix or None}
+
+@app.delete('/sessions/{session_id}')
+def delete_session(session_id: str):
+    if not sessions.store.delete(session_id):
+        raise HTTPException(status_code=404, detail=f'Session {session_id} not found')
+    return {'status': 'deleted', 'session_id': session_id}
 
 @app.get('/models')
 def list_models():
     return {
-        "available_models": [
-            "llama-3.1-8b-instant",  # via Groq
-            "llama-3.3-70b-versatile",  # via Groq
-            "deepseek-r1-distill-llama-70b",  # via Groq
-            "meta-llama/llama-4-maverick-17b-128e-instruct",  # via Groq
-            "meta-llama/llama-4-scout-17b-16e-instruct",  # via Groq
-            "mistral-saba-24b",  # via Groq
-            "moonshotai/kimi-k2-instruct",  # via Groq
-            "gemini-2.5-pro",  # Gemini 2.5 Pro
-            "gemini-2.5-flash",  # Gemini 2.5 Flash
-            "gemini-2.5-flash-lite-preview-06-17",  # Gemini 2.5 Flash-Lite Preview 06-17
-            "gemini-2.0-flash",  # Gemini 2.0 Flash
-            "gemini-2.0-flash-lite"  # Gemini 2.0 Flash-Lite
-        ],
-        "note": "You can use any of these models by changing the model name in the query parameter if supported by your API key."
+        "available_models": list(AVAILABLE_MODELS),
+        # USD per million input/output tokens.
+        "pricing": {m: {'input_per_mtok': PRICES[m][0], 'output_per_mtok': PRICES[m][1]} for m in AVAILABLE_MODELS if m in PRICES},
+        "note": "You can use any of these models by changing the model name in the query parameter if supported by your API key. Use model=auto to let the router pick one."
     }
 
+@app.get('/templates')
+def list_templates(category: Optional[str] = Query(None), tag: Optional[str] = Query(None)):
+    # Optional filters use the registry's category/tag indexes.
+    return [t.to_dict() for t in templates.find(category=category, tag=tag)]
+
+@app.get('/templates/{template_id}')
+def get_template(template_id: str):
+    template = templates.get(template_id)
+    if template is None:
+        raise HTTPException(status_code=404, detail=f'Template id {template_id} not found')
+    return template.to_dict()
+
+@app.get('/routing')
+def routing_endpoint():
+    # Per-model health as seen by the router: circuit state, latency, error rate.
+    return {'models': router.snapshot(), 'auto_ranking': router.rank_auto(), 'rate_limits': limiter.snapshot()}
+
 @app.post('/rate')
 async def rate_endpoint(payload: dict):
     # Expects: {"prompt_id": ..., "model": ..., "rating": ..., "feedback": ...}
@@ -198,51 +555,33 @@ async def rate_endpoint(payload: dict):
     log_rating_v2(prompt_id, model, rating, feedback)
     return {'status': 'ok', 'prompt_id': prompt_id, 'model': model, 'rating': rating, 'feedback': feedback}
 
+@app.get('/analytics/query')
+def analytics_query(start: Optional[str] = Query(None), end: Optional[str] = Query(None), model: Optional[str] = Query(None),
+                    template: Optional[str] = Query(None), cache: Optional[str] = Query(None), fallback: Optional[bool] = Query(None),
+                    group_by: Optional[str] = Query(None), percentiles: bool = Query(False)):
+    # Aggregates over the compacted analytics store. start/end take ISO times
+    # or epoch seconds; model, template, cache and group_by take comma lists.
+    started = time.perf_counter()
+    store = analytics.get_store()
+    store.maybe_compact()
+    split = lambda value: [v.strip() for v in value.split(',') if v.strip()] if value else None
+    try:
+        rows = store.query(start, end, split(model), split(template), split(cache), fallback, split(group_by) or (), percentiles)
+    except AnalyticsError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        'rows': rows,
+        'compacted_at': datetime.utcfromtimestamp(store.compacted_at).isoformat() if store.compacted_at else None,
+        'query_ms': round((time.perf_counter() - started) * 1000, 2)
+    }
+
+@app.get('/metrics')
+def metrics_endpoint():
+    # Prometheus text format; summed over all workers when LLM_ROUTER_METRICS_DIR is set.
+    return PlainTextResponse(metrics.render_metrics(), media_type='text/plain; version=0.0.4; charset=utf-8')
+
 @app.get('/stats')
 def stats_endpoint():
-    import os
-    import json
-    import csv
-    # Model usage and latency from prompts.json
-    prompts_path = os.path.join('logs', 'prompts.json')
-    ratings_path = os.path.join('logs', 'ratings.json')
-    model_usage = defaultdict(int)
-    latency_sum = defaultdict(float)
-    latency_count = defaultdict(int)
-    fallback_count = 0
-    total_prompts = 0
-    avg_rating = defaultdict(float)
-    rating_count = defaultdict(int)
-    # Prompts
-    if os.path.exists(prompts_path):
-        with open(prompts_path, 'r', encoding='utf-8') as f:
-            prompts = json.load(f)
-        for entry in prompts:
-            model = entry.get('model')
-            model_usage[model] += 1
-            total_prompts += 1
-            latency = entry.get('latency_ms')
-            if latency is not None:
-                latency_sum[model] += float(latency) / 1000.0
-                latency_count[model] += 1
-            if entry.get('fallback_used'):
-                fallback_count += 1
-    # Ratings
-    if os.path.exists(ratings_path):
-        with open(ratings_path, 'r', encoding='utf-8') as f:
-            ratings = json.load(f)
-        for entry in ratings:
-            model = entry.get('model')
-            rating = entry.get('rating')
-            if model and rating is not None:
-                avg_rating[model] += float(rating)
-                rating_count[model] += 1
-    avg_latency = {m: (latency_sum[m] / latency_count[m]) if latency_count[m] else 0 for m in model_usage}
-    avg_rating_out = {m: (avg_rating[m] / rating_count[m]) if rating_count[m] else 0 for m in model_usage}
-    return {
-        'model_usage': dict(model_usage),
-        'avg_latency': avg_latency,
-        'avg_rating': avg_rating_out,
-        'total_fallbacks': fallback_count,
-        'total_prompts': total_prompts
-    } 
\ No newline at end of file
+    # Served from running aggregates; the logs are only scanned once per process.
+    # `spend` is today's token and cost ledger.
+    return {**load_stats().snapshot(), 'spend': ledger.snapshot()}
@@ -0,0 +1,82 @@
+import re
+import asyncio
+
+# Error kinds, used to decide whether a failed call is worth retrying on the
+# same model, worth a fallback, or neither.
+RATE_LIMIT = 'rate_limit'
+TRANSIENT = 'transient'
+AUTH = 'auth'
+INVALID_REQUEST = 'invalid_request'
+SAFETY = 'safety'
+UNKNOWN = 'unknown'
+
+class ProviderError(RuntimeError):
+    # Base for classified upstream failures. `status_code` is the provider's
+    # HTTP status when there was one.
+    kind = UNKNOWN
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+class RateLimitError(ProviderError):
+    # Provider answered 429 / quota exhausted. `retry_after` is in seconds when
+    # the provider said how long to back off, otherwise None.
+    kind = RATE_LIMIT
+
+    def __init__(self, message, retry_after=None, status_code=429):
+        super().__init__(message, status_code)
+        self.retry_after = retry_after
+
+class TransientError(ProviderError):
+    # 5xx, 408, timeouts and dropped connections: the same call may succeed.
+    kind = TRANSIENT
+
+class AuthError(ProviderError):
+    # Bad or unauthorised API key; every model behind that key fails the same way.
+    kind = AUTH
+
+class InvalidRequestError(ProviderError):
+    # The request itself was rejected (400, 404, 413, 422); retrying won't help.
+    kind = INVALID_REQUEST
+
+class SafetyBlockError(ProviderError):
+    # The provider's content filter refused the prompt or the answer.
+    kind = SAFETY
+
+def error_for_status(status_code, message, retry_after=None):
+    if status_code == 429:
+        return RateLimitError(message, retry_after)
+    if status_code in (401, 403):
+        return AuthError(message, status_code)
+    if status_code == 408 or status_code >= 500:
+        return TransientError(message, status_code)
+    if 400 <= status_code < 500:
+        return InvalidRequestError(message, status_code)
+    return ProviderError(message, status_code)
+
+def classify(exc):
+    # Error kind for any exception raised by a handler call.
+    if isinstance(exc, ProviderError):
+        return exc.kind
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return TRANSIENT
+    return UNKNOWN
+
+_DURATION_RE = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+
+def parse_retry_after(value):
+    # Accepts a Retry-After number of seconds or a Go-style duration such as
+    # Groq's x-ratelimit-reset-* headers ("7.66s", "2m59.56s", "120ms").
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    units = {'h': 3600.0, 'm': 60.0, 's': 1.0, 'ms': 0.001}
+    parts = _DURATION_RE.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * units[unit] for amount, unit in parts)
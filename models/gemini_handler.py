@@ -1,22 +1,164 @@
 import os
+import re
+import asyncio
+import threading
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+from models.usage import token_usage
+from models.errors import RateLimitError, TransientError, AuthError, SafetyBlockError, ProviderError, error_for_status
+
+# genai.configure mutates global SDK state; only redo it when the key changes.
+_configured_key = None
+_configure_lock = threading.Lock()
+
+def _configure(api_key):
+    global _configured_key
+    if _configured_key == api_key:
+        return
+    with _configure_lock:
+        if _configured_key != api_key:
+            api_url = os.getenv('GEMINI_API_URL')
+            if api_url:
+                # A non-Google endpoint (e.g. bench/mock_provider.py) only speaks REST.
+                genai.configure(api_key=api_key, transport='rest', client_options={'api_endpoint': api_url})
+            else:
+                genai.configure(api_key=api_key)
+            _configured_key = api_key
+
+_RETRY_DELAY_RE = re.compile(r'retry_delay\s*\{\s*seconds:\s*(\d+)|retry in (\d+(?:\.\d+)?)s', re.IGNORECASE)
+
+# Finish reasons meaning a content filter stopped the answer.
+_BLOCKED_FINISH_REASONS = {'SAFETY', 'RECITATION', 'BLOCKLIST', 'PROHIBITED_CONTENT', 'SPII'}
+
+def _provider_error(model, exc):
+    # Maps SDK exceptions onto the typed errors in models.errors; None when
+    # the exception isn't a provider failure we recognise.
+    if isinstance(exc, (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)):
+        # Quota errors carry the suggested back-off in a RetryInfo detail, which
+        # the SDK only surfaces inside the message text.
+        match = _RETRY_DELAY_RE.search(str(exc))
+        retry_after = float(match.group(1) or match.group(2)) if match else None
+        return RateLimitError(f'Gemini API rate limit for model {model}: {exc}', retry_after)
+    if isinstance(exc, (genai.types.BlockedPromptException, genai.types.StopCandidateException)):
+        return SafetyBlockError(f'Gemini blocked the request for model {model}: {exc}')
+    if isinstance(exc, google_exceptions.GoogleAPICallError) and exc.code:
+        if 'API_KEY_INVALID' in str(exc) or 'API key not valid' in str(exc):
+            # Bad keys come back as 400 INVALID_ARGUMENT.
+            return AuthError(f'Gemini API key rejected for model {model}: {exc}', exc.code)
+        return error_for_status(int(exc.code), f'Gemini API error {exc.code} for model {model}: {exc}')
+    if isinstance(exc, (google_exceptions.RetryError, google_exceptions.ServerError, ConnectionError)):
+        return TransientError(f'Gemini API error for model {model}: {exc}')
+    return None
+
+def _usage(metadata):
+    if not metadata:
+        return None
+    return token_usage(getattr(metadata, 'prompt_token_count', None), getattr(metadata, 'candidates_token_count', None),
+                       getattr(metadata, 'total_token_count', None))
+
+def _contents(prompt):
+    # Chat messages ({'role', 'content'}) become Gemini contents; Gemini calls
+    # the assistant role "model".
+    if not isinstance(prompt, list):
+        return prompt
+    return [{'role': 'model' if m['role'] == 'assistant' else 'user', 'parts': [m['content']]} for m in prompt]
 
 class GeminiHandler:
+    provider = 'gemini'
+
     def __init__(self, model_override=None):
         self.api_key = os.getenv('GEMINI_API_KEY')
         if not self.api_key:
             raise ValueError('GEMINI_API_KEY is not set in environment')
-        genai.configure(api_key=self.api_key)
+        _configure(self.api_key)
         self.model = model_override
         if not self.model:
             raise ValueError('No model specified for GeminiHandler')
+        # The SDK has no async REST transport, so a custom endpoint is called
+        # through the sync client on a worker thread.
+        self.rest = bool(os.getenv('GEMINI_API_URL'))
+        self._generative_model = None
+
+    @property
+    def generative_model(self):
+        # Built on first use and reused by every later call on this handler.
+        if self._generative_model is None:
+            self._generative_model = genai.GenerativeModel(self.model)
+        return self._generative_model
+
+    def _parse(self, response):
+        feedback = getattr(response, 'prompt_feedback', None)
+        if feedback is not None and getattr(feedback, 'block_reason', None):
+            raise SafetyBlockError(f'Gemini blocked the prompt for model {self.model}: {feedback.block_reason}')
+        try:
+            text = response.text.strip() if hasattr(response, 'text') else str(response)
+        except ValueError as e:
+            # No text parts; the finish reason says why.
+            candidates = getattr(response, 'candidates', None) or []
+            reason = getattr(getattr(candidates[0], 'finish_reason', None), 'name', None) if candidates else None
+            if reason in _BLOCKED_FINISH_REASONS:
+                raise SafetyBlockError(f'Gemini stopped the answer for model {self.model}: {reason}') from e
+            raise ProviderError(f'Gemini returned no text for model {self.model}: {e}') from e
+        return text, _usage(getattr(response, 'usage_metadata', None))
 
     def generate(self, prompt: str):
-        model = genai.GenerativeModel(self.model)
-        response = model.generate_content(prompt)
-        text = response.text.strip() if hasattr(response, 'text') else str(response)
-        # Try to get token count from response.usage_metadata if available
-        token_count = None
-        if hasattr(response, 'usage_metadata') and response.usage_metadata:
-            token_count = getattr(response.usage_metadata, 'total_token_count', None)
-        return text, token_count 
\ No newline at end of file
+        try:
+            response = self.generative_model.generate_content(_contents(prompt))
+        except Exception as e:
+            error = _provider_error(self.model, e)
+            if error is None:
+                raise
+            raise error from e
+        return self._parse(response)
+
+    async def warmup(self):
+        # Startup prewarm. The SDK opens its channels on the first call, so
+        # this only builds the model object ahead of the first request and
+        # reports that no connection was opened.
+        self.generative_model
+        return False
+
+    async def agenerate(self, prompt: str):
+        if self.rest:
+            return await asyncio.to_thread(self.generate, prompt)
+        try:
+            response = await self.generative_model.generate_content_async(_contents(prompt))
+        except Exception as e:
+            error = _provider_error(self.model, e)
+            if error is None:
+                raise
+            raise error from e
+        return self._parse(response)
+
+    async def astream(self, prompt: str):
+        # Yields (text_delta, token_count); token_count comes with the last chunk.
+        if self.rest:
+            text, token_count = await self.agenerate(prompt)
+            yield text, None
+            yield '', token_count
+            return
+        try:
+            response = await self.generative_model.generate_content_async(_contents(prompt), stream=True)
+            token_count = None
+            async for chunk in response:
+                feedback = getattr(chunk, 'prompt_feedback', None)
+                if feedback is not None and getattr(feedback, 'block_reason', None):
+                    raise SafetyBlockError(f'Gemini blocked the prompt for model {self.model}: {feedback.block_reason}')
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # Chunks without candidate parts (e.g. usage-only) have no text.
+                    text = ''
+                if getattr(chunk, 'usage_metadata', None):
+                    token_count = _usage(chunk.usage_metadata) or token_count
+                if text:
+                    yield text, None
+        except ProviderError:
+            raise
+        except Exception as e:
+            error = _provider_error(self.model, e)
+            if error is None:
+                raise
+            raise error from e
+        if token_count is not None:
+            yield '', token_count
@@ -1,7 +1,13 @@
 import os
-import requests
+import json
+import httpx
+from models.http_client import get_async_client, get_sync_session
+from models.errors import TransientError, SafetyBlockError, error_for_status, parse_retry_after
+from models.usage import token_usage
 
 class GroqHandler:
+    provider = 'groq'
+
     def __init__(self, model_override=None):
         self.api_key = os.getenv('GROQ_API_KEY')
         self.api_url = os.getenv('GROQ_API_URL', 'https://api.groq.com/openai/v1/chat/completions')
@@ -10,31 +16,104 @@ class GroqHandler:
             raise ValueError('GROQ_API_KEY is not set in environment')
         if not self.model:
             raise ValueError('No model specified for GroqHandler')
-
-    def generate(self, prompt: str):
-        headers = {
+        self.headers = {
             'Authorization': f'Bearer {self.api_key}',
             'Content-Type': 'application/json',
         }
-        data = {
+
+    def _payload(self, prompt, stream=False):
+        # `prompt` is a string, or chat messages ({'role', 'content'}) for a
+        # multi-turn session.
+        payload = {
             'model': self.model,
-            'messages': [
+            'messages': prompt if isinstance(prompt, list) else [
                 {'role': 'user', 'content': prompt}
             ],
             'max_tokens': 512,
             'temperature': 0.7
         }
-        response = requests.post(self.api_url, headers=headers, json=data, timeout=30)
+        if stream:
+            payload['stream'] = True
+            payload['stream_options'] = {'include_usage': True}
+        return payload
+
+    def _raise_api_error(self, response):
+        try:
+            err_json = response.json()
+            err_msg = err_json.get('error', {}).get('message', str(err_json))
+        except Exception:
+            err_msg = response.text
+        if response.status_code == 429:
+            headers = response.headers
+            retry_after = parse_retry_after(headers.get('retry-after'))
+            if retry_after is None:
+                retry_after = parse_retry_after(headers.get('x-ratelimit-reset-requests') or headers.get('x-ratelimit-reset-tokens'))
+            raise error_for_status(429, f'Groq API rate limit for model {self.model}: {err_msg}', retry_after)
+        raise error_for_status(response.status_code, f'Groq API error {response.status_code} for model {self.model}: {err_msg}')
+
+    def _parse(self, result):
+        choice = result['choices'][0]
+        if choice.get('finish_reason') == 'content_filter':
+            raise SafetyBlockError(f'Groq content filter blocked the response for model {self.model}')
+        text = choice['message']['content'].strip()
+        return text, self._usage(result.get('usage'))
+
+    def _usage(self, usage):
+        usage = usage or {}
+        return token_usage(usage.get('prompt_tokens'), usage.get('completion_tokens'), usage.get('total_tokens'))
+
+    def generate(self, prompt: str):
+        # Only the sync path uses requests; keep it off the import path.
+        import requests
+        session = get_sync_session(self.provider)
+        try:
+            response = session.post(self.api_url, headers=self.headers, json=self._payload(prompt), timeout=30)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise TransientError(f'Groq API connection error for model {self.model}: {e}') from e
         try:
             response.raise_for_status()
         except requests.HTTPError:
-            try:
-                err_json = response.json()
-                err_msg = err_json.get('error', {}).get('message', str(err_json))
-            except Exception:
-                err_msg = response.text
-            raise RuntimeError(f'Groq API error for model {self.model}: {err_msg}')
-        result = response.json()
-        text = result['choices'][0]['message']['content'].strip()
-        token_count = result.get('usage', {}).get('total_tokens')
-        return text, token_count 
\ No newline at end of file
+            self._raise_api_error(response)
+        return self._parse(response.json())
+
+    async def warmup(self):
+        # Startup prewarm: resolves the host and leaves a TLS connection in the
+        # provider pool for the first real request. Any status code will do.
+        await get_async_client(self.provider).head(self.api_url, timeout=10)
+        return True
+
+    async def agenerate(self, prompt: str):
+        client = get_async_client(self.provider)
+        try:
+            response = await client.post(self.api_url, headers=self.headers, json=self._payload(prompt), timeout=30)
+        except httpx.TransportError as e:
+            raise TransientError(f'Groq API connection error for model {self.model}: {e}') from e
+        if response.is_error:
+            self._raise_api_error(response)
+        return self._parse(response.json())
+
+    async def astream(self, prompt: str):
+        # Yields (text_delta, token_count); token_count is only set on the
+        # final usage chunk.
+        client = get_async_client(self.provider)
+        try:
+            async with client.stream('POST', self.api_url, headers=self.headers, json=self._payload(prompt, stream=True), timeout=30) as response:
+                if response.is_error:
+                    await response.aread()
+                    self._raise_api_error(response)
+                async for line in response.aiter_lines():
+                    if not line.startswith('data:'):
+                        continue
+                    data = line[len('data:'):].strip()
+                    if data == '[DONE]':
+                        break
+                    chunk = json.loads(data)
+                    for choice in chunk.get('choices') or []:
+                        delta = (choice.get('delta') or {}).get('content')
+                        if delta:
+                            yield delta, None
+                    usage = chunk.get('usage') or (chunk.get('x_groq') or {}).get('usage')
+                    if usage:
+                        yield '', self._usage(usage)
+        except httpx.TransportError as e:
+            raise TransientError(f'Groq API connection error for model {self.model}: {e}') from e
@@ -0,0 +1,70 @@
+import os
+import threading
+import httpx
+
+# Connection pool settings, shared by every handler of a provider.
+POOL_SIZE = int(os.getenv('LLM_ROUTER_POOL_SIZE', '100'))
+KEEPALIVE_CONNECTIONS = int(os.getenv('LLM_ROUTER_KEEPALIVE_CONNECTIONS', '20'))
+KEEPALIVE_EXPIRY = float(os.getenv('LLM_ROUTER_KEEPALIVE_EXPIRY', '60'))
+HTTP_TIMEOUT = float(os.getenv('LLM_ROUTER_HTTP_TIMEOUT', '30'))
+
+# Providers whose endpoints speak HTTP/2. Only enabled when the optional
+# `h2` package is installed, otherwise httpx refuses to build the client.
+HTTP2_PROVIDERS = {'groq'}
+
+def _h2_available():
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+HTTP2_ENABLED = os.getenv('LLM_ROUTER_HTTP2', '1') != '0' and _h2_available()
+
+# One keep-alive pool per provider so concurrent requests reuse TLS
+# connections instead of handshaking on every call.
+_async_clients = {}
+_sync_sessions = {}
+_session_lock = threading.Lock()
+
+def get_async_client(provider='default'):
+    client = _async_clients.get(provider)
+    if client is None or client.is_closed:
+        limits = httpx.Limits(
+            max_connections=POOL_SIZE,
+            max_keepalive_connections=KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY
+        )
+        client = httpx.AsyncClient(
+            timeout=HTTP_TIMEOUT,
+            limits=limits,
+            http2=HTTP2_ENABLED and provider in HTTP2_PROVIDERS
+        )
+        _async_clients[provider] = client
+    return client
+
+def get_sync_session(provider='default'):
+    session = _sync_sessions.get(provider)
+    if session is None:
+        with _session_lock:
+            session = _sync_sessions.get(provider)
+            if session is None:
+                # Only the sync handler paths use requests; keep it off the import path.
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=KEEPALIVE_CONNECTIONS, pool_maxsize=POOL_SIZE)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _sync_sessions[provider] = session
+    return session
+
+async def aclose_async_client():
+    for provider, client in list(_async_clients.items()):
+        if not client.is_closed:
+            await client.aclose()
+    _async_clients.clear()
+    with _session_lock:
+        for session in _sync_sessions.values():
+            session.close()
+        _sync_sessions.clear()
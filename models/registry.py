@@ -0,0 +1,78 @@
+import os
+import threading
+
+# Model name prefixes served through Groq's OpenAI-compatible API.
+GROQ_MODEL_PREFIXES = (
+    'llama-3.1-8b',
+    'llama-3.3-70b',
+    'deepseek',
+    'meta-llama/llama-4-maverick',
+    'meta-llama/llama-4-scout',
+    'meta-llama/llama-prompt-guard-2-22m',
+    'meta-llama/llama-prompt-guard-2-86m',
+    'mistral',
+    'moonshotai/'
+)
+
+# Models advertised by /models and considered by `model=auto`.
+AVAILABLE_MODELS = [
+    'llama-3.1-8b-instant',  # via Groq
+    'llama-3.3-70b-versatile',  # via Groq
+    'deepseek-r1-distill-llama-70b',  # via Groq
+    'meta-llama/llama-4-maverick-17b-128e-instruct',  # via Groq
+    'meta-llama/llama-4-scout-17b-16e-instruct',  # via Groq
+    'mistral-saba-24b',  # via Groq
+    'moonshotai/kimi-k2-instruct',  # via Groq
+    'gemini-2.5-pro',  # Gemini 2.5 Pro
+    'gemini-2.5-flash',  # Gemini 2.5 Flash
+    'gemini-2.5-flash-lite-preview-06-17',  # Gemini 2.5 Flash-Lite Preview 06-17
+    'gemini-2.0-flash',  # Gemini 2.0 Flash
+    'gemini-2.0-flash-lite'  # Gemini 2.0 Flash-Lite
+]
+
+# Environment variable holding each provider's API key.
+PROVIDER_KEYS = {
+    'groq': 'GROQ_API_KEY',
+    'gemini': 'GEMINI_API_KEY'
+}
+
+_handlers = {}
+_lock = threading.Lock()
+
+def provider_for(model):
+    if model and model.startswith('gemini'):
+        return 'gemini'
+    if model and model.startswith(GROQ_MODEL_PREFIXES):
+        return 'groq'
+    return None
+
+def provider_configured(provider):
+    return bool(os.getenv(PROVIDER_KEYS.get(provider, '')))
+
+def _handler_class(provider):
+    # Imported lazily so the Gemini SDK is only loaded once it is needed.
+    if provider == 'groq':
+        from models.groq_handler import GroqHandler
+        return GroqHandler
+    from models.gemini_handler import GeminiHandler
+    return GeminiHandler
+
+# Handlers are long-lived: API keys are read once, provider SDKs are configured
+# once and HTTP connections come from the per-provider pool. Construction errors
+# (e.g. a missing API key) propagate and are not cached.
+def get_handler(model):
+    provider = provider_for(model)
+    if provider is None:
+        raise ValueError(f'Unknown model provider for model: {model}')
+    handler = _handlers.get(model)
+    if handler is None:
+        with _lock:
+            handler = _handlers.get(model)
+            if handler is None:
+                handler = _handler_class(provider)(model_override=model)
+                _handlers[model] = handler
+    return handler
+
+def reset_handlers():
+    with _lock:
+        _handlers.clear()
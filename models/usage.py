@@ -0,0 +1,28 @@
+from dataclasses import dataclass
+
+@dataclass(frozen=True)
+class TokenUsage:
+    # A provider's usage report, the second item handlers return from
+    # agenerate() and yield last from astream(). Either half of the split may
+    # be missing; accounting counts that half locally.
+    prompt_tokens: int = None
+    completion_tokens: int = None
+    total_tokens: int = None
+
+    @property
+    def total(self):
+        if self.total_tokens is not None:
+            return self.total_tokens
+        return (self.prompt_tokens or 0) + (self.completion_tokens or 0)
+
+def token_usage(prompt_tokens, completion_tokens, total_tokens):
+    # None when the provider reported nothing at all.
+    if prompt_tokens is None and completion_tokens is None and total_tokens is None:
+        return None
+    return TokenUsage(prompt_tokens, completion_tokens, total_tokens)
+
+def total_tokens(usage):
+    # Total count of a TokenUsage; a handler may also report a bare int total.
+    if usage is None or isinstance(usage, int):
+        return usage
+    return usage.total
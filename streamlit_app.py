@@ -1,6 +1,7 @@
 import streamlit as st
 import requests
 import time
+import uuid
 import json
 from collections import defaultdict
 
@@ -80,6 +81,32 @@ if template_mode == "Template":
         st.sidebar.caption(f"Tags: {', '.join(selected_template.get('tags', []))}")
         st.sidebar.write(selected_template["prompt"])
 
+# Streams /chat/stream server-sent events into a placeholder and returns the
+# final summary merged with the full response text.
+def stream_chat(query, payload):
+    placeholder = st.empty()
+    text = ""
+    summary = {}
+    event = None
+    with requests.post(f"{API_BASE}/chat/stream?{query}", json=payload, stream=True, timeout=60) as resp:
+        if resp.status_code != 200:
+            raise RuntimeError(f"Backend error: {resp.status_code} {resp.text}")
+        for line in resp.iter_lines(decode_unicode=True):
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = json.loads(line[len("data: "):])
+                if event == "token":
+                    text += data["text"]
+                    placeholder.markdown(text + "▌")
+                elif event == "done":
+                    summary = data
+                elif event == "error":
+                    raise RuntimeError(data.get("detail"))
+    placeholder.empty()
+    summary["response_text"] = text
+    return summary
+
 # --------------------
 # Main Content Tabs
 # --------------------
@@ -93,6 +120,8 @@ with tabs[0]:
     chat_history = st.session_state.get("chat_history", [])
     with st.expander("Advanced Settings", expanded=False):
         ignore_cache = st.checkbox("Ignore Cache (force fresh response)", value=False)
+        stream_response = st.checkbox("Stream response (show tokens as they arrive)", value=True)
+        remember_conversation = st.checkbox("Remember conversation (send follow-ups with earlier turns as context)", value=True)
     if template_mode == "Raw Prompt":
         user_prompt = st.text_area("Enter your prompt", key="raw_prompt")
         template_id = None
@@ -120,31 +149,35 @@ with tabs[0]:
             else:
                 st.error("Please enter a prompt or select a template.")
                 st.stop()
+            # The backend keeps the conversation; only the new turn is sent.
+            if remember_conversation:
+                payload["session_id"] = st.session_state.setdefault("session_id", uuid.uuid4().hex)
+            query = f"model={selected_model}&ignore_cache={'true' if ignore_cache else 'false'}"
             try:
-                resp = requests.post(
-                    f"{API_BASE}/chat?model={selected_model}&ignore_cache={'true' if ignore_cache else 'false'}",
-                    json=payload,
-                    timeout=60
-                )
-                if resp.status_code == 200:
-                    data = resp.json()
-                    chat_history.append({
-                        "prompt": user_prompt or (selected_template["prompt"] if selected_template else ""),
-                        "template_id": template_id,
-                        "template_vars": template_vars,
-                        "response": data["response_text"],
-                        "model_used": data.get("model_used"),
-                        "latency_ms": data.get("latency_ms"),
-                        "token_count": data.get("token_count"),
-                        "from_cache": data.get("from_cache"),
-                        "fallback_used": data.get("fallback_used"),
-                        "error_message": data.get("error_message"),
-                        "prompt_id": data.get("prompt_id")
-                    })
-                    st.session_state["chat_history"] = chat_history
+                if stream_response:
+                    data = stream_chat(query, payload)
                 else:
-                    st.error(f"Backend error: {resp.status_code} {resp.text}")
-                    st.stop()
+                    resp = requests.post(f"{API_BASE}/chat?{query}", json=payload, timeout=60)
+                    if resp.status_code != 200:
+                        st.error(f"Backend error: {resp.status_code} {resp.text}")
+                        st.stop()
+                    data = resp.json()
+                chat_history.append({
+                    "prompt": user_prompt or (selected_template["prompt"] if selected_template else ""),
+                    "template_id": template_id,
+                    "template_vars": template_vars,
+                    "response": data["response_text"],
+                    "model_used": data.get("model_used"),
+                    "latency_ms": data.get("latency_ms"),
+                    "ttft_ms": data.get("ttft_ms"),
+                    "tokens_per_sec": data.get("tokens_per_sec"),
+                    "token_count": data.get("token_count"),
+                    "from_cache": data.get("from_cache"),
+                    "fallback_used": data.get("fallback_used"),
+                    "error_message": data.get("error_message"),
+                    "prompt_id": data.get("prompt_id")
+                })
+                st.session_state["chat_history"] = chat_history
             except Exception as e:
                 st.error(f"Request failed: {e}")
                 st.stop()
@@ -161,6 +194,8 @@ with tabs[0]:
             cols = st.columns([1,1,1,1,1,2])
             cols[0].metric("Model", entry.get("model_used", "?"))
             cols[1].metric("Latency (s)", f"{(entry.get('latency_ms') or 0)/1000:.2f}")
+            if entry.get("ttft_ms") is not None:
+                cols[1].caption(f"TTFT {entry['ttft_ms']} ms · {entry.get('tokens_per_sec') or '?'} tok/s")
             cols[2].metric("Tokens", entry.get("token_count", "?"))
             cols[3].metric("Cache", "✅" if entry.get("from_cache") else "❌")
             cols[4].metric("Fallback", "⚠️" if entry.get("fallback_used") else "✅")
@@ -187,6 +222,12 @@ with tabs[0]:
                         st.error(f"Rating error: {e}")
     if st.button("Reset Session"):
         st.session_state["chat_history"] = []
+        session_id = st.session_state.pop("session_id", None)
+        if session_id:
+            try:
+                requests.delete(f"{API_BASE}/sessions/{session_id}", timeout=10)
+            except Exception:
+                pass
         st.experimental_rerun()
 
 # --------------------
@@ -229,10 +270,27 @@ with tabs[2]:
         st.bar_chart(stats["model_usage"])
         st.subheader("Average Latency (s)")
         st.bar_chart(stats["avg_latency"])
+        if stats.get("latency_percentiles"):
+            st.subheader("Latency Percentiles (s)")
+            st.dataframe(stats["latency_percentiles"])
         st.subheader("Average Rating")
         st.bar_chart(stats["avg_rating"])
         st.metric("Total Fallbacks", stats["total_fallbacks"])
+        st.metric("Total Cache Hits", stats.get("total_cache_hits", 0))
         st.metric("Total Prompts", stats["total_prompts"])
+    st.subheader("Requests per Day")
+    try:
+        daily_resp = requests.get(f"{API_BASE}/analytics/query", params={"group_by": "day,model"})
+        if daily_resp.status_code == 200:
+            daily = {}
+            for row in daily_resp.json()["rows"]:
+                daily.setdefault(row["model"], {})[row["day"]] = row["requests"]
+            if daily:
+                st.line_chart(daily)
+        else:
+            st.error(f"Analytics error: {daily_resp.text}")
+    except Exception as e:
+        st.error(f"Analytics fetch failed: {e}")
 
 # --------------------
 # Footer
@@ -0,0 +1,22 @@
+import os
+import tempfile
+
+# Keep test runs from touching the repository's logs/ directory and cache.db.
+_tmp = tempfile.mkdtemp(prefix='llm-router-tests-')
+os.environ.setdefault('LLM_ROUTER_LOG_DIR', os.path.join(_tmp, 'logs'))
+os.environ.setdefault('LLM_ROUTER_CACHE_DB', os.path.join(_tmp, 'cache.db'))
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def reset_router_health():
+    # Circuit-breaker and rate-limit state is process-wide; don't let one
+    # test's failures leak.
+    from utils.routing import router
+    from utils.ratelimit import limiter, MemoryBackend
+    router.health.clear()
+    yield
+    router.health.clear()
+    limiter.lanes.clear()
+    limiter.backend = MemoryBackend()
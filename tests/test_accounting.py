@@ -0,0 +1,102 @@
+import asyncio
+import httpx
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+from models import http_client
+from models.groq_handler import GroqHandler
+from models.registry import reset_handlers
+from models.usage import TokenUsage
+from utils.accounting import Ledger, ledger, cost, _parse_prices
+from utils.dispatch import generate_response
+from utils.routing import router
+
+@pytest.fixture
+def groq_env(monkeypatch):
+    monkeypatch.setenv('GROQ_API_KEY', 'test-key')
+    reset_handlers()
+    yield
+    reset_handlers()
+    http_client._async_clients.clear()
+
+@pytest.fixture
+def budgets(monkeypatch):
+    # Budgets against a clean copy of today's spend on the shared ledger.
+    monkeypatch.setattr(ledger, 'spent', {})
+    monkeypatch.setattr(ledger, 'pending', {})
+
+    def set_budgets(**limits):
+        monkeypatch.setattr(ledger, 'budgets', {k.replace('_', '-'): v for k, v in limits.items()})
+    return set_budgets
+
+def test_groq_usage_is_split(groq_env):
+    http_client._async_clients['groq'] = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, json={
+        'choices': [{'message': {'content': 'hi'}, 'finish_reason': 'stop'}],
+        'usage': {'prompt_tokens': 7, 'completion_tokens': 5, 'total_tokens': 12}})))
+    text, usage = asyncio.run(GroqHandler(model_override='llama-3.1-8b-instant').agenerate('x'))
+    assert usage == TokenUsage(7, 5, 12)
+
+def test_prices_and_cost():
+    assert _parse_prices('my-model=1/2, other=0.5') == {'my-model': (1.0, 2.0), 'other': (0.5, 0.5)}
+    assert cost('gemini-2.5-pro', 1_000_000, 100_000) == pytest.approx(1.25 + 1.0)
+    assert cost('unpriced-model', 1000, 1000) == 0.0
+
+def test_ledger_flush_shares_spend_between_workers(tmp_path):
+    first, second = Ledger(str(tmp_path / 'ledger.db'), {}), Ledger(str(tmp_path / 'ledger.db'), {})
+    first.record('gemini-2.5-pro', 'key-a', 1_000_000, 0)
+    second.record('gemini-2.5-pro', 'key-b', 1_000_000, 0)
+    first.flush()
+    second.flush()
+    first.flush()
+    snapshot = first.snapshot()
+    assert snapshot['requests'] == 2 and snapshot['cost_usd'] == 2.5
+    assert len(snapshot['by_key']) == 2
+    assert first.spent['gemini'] == 2.5
+    # Flushing again adds nothing.
+    second.flush()
+    assert second.snapshot()['cost_usd'] == 2.5
+
+def test_call_charges_ledger_with_reported_split(groq_env, budgets):
+    async def agenerate(self, prompt):
+        return 'answer', TokenUsage(1_000_000, 1_000_000)
+    with patch.object(GroqHandler, 'agenerate', agenerate):
+        result = asyncio.run(generate_response('hi', 'llama-3.3-70b-versatile', 'groq', store=False))
+    assert (result['prompt_tokens'], result['completion_tokens'], result['token_count']) == (1_000_000, 1_000_000, 2_000_000)
+    assert result['cost_usd'] == pytest.approx(0.59 + 0.79)
+    assert ledger.spent['groq'] == pytest.approx(1.38)
+
+def test_stream_charges_ledger_with_reported_split(groq_env, budgets):
+    from main import app
+
+    async def astream(self, prompt):
+        yield 'answer', None
+        yield '', TokenUsage(prompt_tokens=1_000_000, completion_tokens=1_000_000)
+    with patch.object(GroqHandler, 'astream', astream), patch('main.store_response'), patch('main.log_interaction'):
+        resp = TestClient(app).post('/chat/stream?model=llama-3.3-70b-versatile&ignore_cache=true', json={'prompt': 'q'})
+    done = resp.text.strip().split('\n\n')[-1]
+    assert '"prompt_tokens": 1000000, "completion_tokens": 1000000' in done and '"token_count": 2000000' in done
+    assert ledger.spent['groq'] == pytest.approx(1.38)
+
+def test_budget_prefers_cheaper_then_blocks(groq_env, budgets):
+    budgets(groq=10.0)
+    assert router.candidates('llama-3.3-70b-versatile')[0] == 'llama-3.3-70b-versatile'
+    ledger.record('llama-3.3-70b-versatile', 'k', 10_000_000, 0)
+    # 5.90 of 10.00 spent: still in order. Past the soft limit, cheapest first.
+    assert router.candidates('llama-3.3-70b-versatile')[0] == 'llama-3.3-70b-versatile'
+    ledger.record('llama-3.3-70b-versatile', 'k', 4_000_000, 0)
+    assert router.candidates('llama-3.3-70b-versatile')[0] == 'llama-3.1-8b-instant'
+    ledger.record('llama-3.3-70b-versatile', 'k', 10_000_000, 0)
+    assert not router.allow('llama-3.1-8b-instant')
+    with pytest.raises(HTTPException) as info:
+        asyncio.run(generate_response('hi', 'llama-3.3-70b-versatile', 'groq', store=False))
+    assert info.value.status_code == 503
+    assert ledger.snapshot()['budgets']['groq']['remaining_usd'] == 0
+
+def test_models_and_stats_expose_accounting():
+    from main import app
+    client = TestClient(app)
+    pricing = client.get('/models').json()['pricing']
+    assert pricing['llama-3.1-8b-instant'] == {'input_per_mtok': 0.05, 'output_per_mtok': 0.08}
+    spend = client.get('/stats').json()['spend']
+    assert {'day', 'requests', 'prompt_tokens', 'completion_tokens', 'cost_usd', 'by_model', 'budgets'} <= set(spend)
@@ -0,0 +1,93 @@
+import os
+import pytest
+from fastapi.testclient import TestClient
+from utils import logger, analytics
+from utils.analytics import AnalyticsStore, AnalyticsError
+
+@pytest.fixture
+def log_paths(tmp_path, monkeypatch):
+    monkeypatch.setattr(logger, 'PROMPTS_LOG', str(tmp_path / 'prompts.jsonl'))
+    monkeypatch.setattr(logger, 'RATINGS_LOG', str(tmp_path / 'ratings.jsonl'))
+    monkeypatch.setattr(logger, 'CSV_LOG', str(tmp_path / 'prompts.csv'))
+    monkeypatch.setattr(logger, 'RATINGS_CSV', str(tmp_path / 'ratings.csv'))
+    yield tmp_path
+    logger.flush_logs(timeout=5)
+
+@pytest.fixture
+def store(log_paths):
+    return AnalyticsStore(str(log_paths / 'analytics.db'))
+
+def _log(prompt_id, model='m1', latency=100, tokens=10, **extra):
+    logger.log_interaction('2026-01-02T03:04:05', 'p', model, 'r', latency, tokens, prompt_id, **extra)
+
+def test_compaction_is_incremental_across_rotation(store, log_paths, monkeypatch):
+    for i in range(3):
+        _log(f'id{i}')
+    logger.flush_logs(timeout=5)
+    assert store.compact()['interactions'] == 3
+    assert store.compact()['interactions'] == 0
+    # Rotated segments keep their inode, so nothing is read twice.
+    monkeypatch.setattr(logger, 'ROTATE_MAX_BYTES', 1)
+    for i in range(3, 5):
+        _log(f'id{i}')
+    logger.flush_logs(timeout=5)
+    assert len(logger.segment_paths(logger.PROMPTS_LOG)) > 1
+    assert store.compact()['interactions'] == 2
+    assert store.query()[0]['requests'] == 5
+
+def test_latest_rating_joins_on_prompt_id(store):
+    _log('a')
+    logger.log_rating_v2('a', 'm1', 2, '')
+    logger.log_rating_v2('a', 'm1', 5, '')
+    logger.flush_logs(timeout=5)
+    store.compact()
+    # A rating compacted before its interaction is joined too.
+    logger.log_rating_v2('b', 'm1', 3, '')
+    logger.flush_logs(timeout=5)
+    store.compact()
+    _log('b')
+    logger.flush_logs(timeout=5)
+    store.compact()
+    row = store.query()[0]
+    assert row['ratings'] == 2
+    assert row['avg_rating'] == 4.0
+
+def test_filters_and_group_by(store):
+    _log('a', model='m1', latency=100)
+    _log('b', model='m1', latency=0, from_cache=True)
+    _log('c', model='m2', latency=300, fallback_used=True, template='t1')
+    logger.flush_logs(timeout=5)
+    store.compact()
+    rows = {r['model']: r for r in store.query(group_by=['model'])}
+    assert rows['m1']['requests'] == 2 and rows['m1']['cache_hits'] == 1
+    # Cache hits don't count towards latency.
+    assert rows['m1']['avg_latency_ms'] == 100
+    assert rows['m2']['fallbacks'] == 1
+    assert [r['requests'] for r in store.query(cache=['hit'])] == [1]
+    assert store.query(templates=['t1'])[0]['requests'] == 1
+    assert store.query(models=['m2'], fallback=False) == []
+    assert store.query(start='2027-01-01') == []
+    with pytest.raises(AnalyticsError):
+        store.query(group_by=['prompt'])
+    with pytest.raises(AnalyticsError):
+        store.query(start='yesterday')
+
+def test_percentiles_per_group(store):
+    for i in range(1, 101):
+        _log(f'a{i}', model='m1', latency=i)
+        _log(f'b{i}', model='m2', latency=i * 10)
+    logger.flush_logs(timeout=5)
+    store.compact()
+    rows = {r['model']: r for r in store.query(group_by=['model'], percentiles=True)}
+    assert (rows['m1']['p50_latency_ms'], rows['m1']['p95_latency_ms'], rows['m1']['p99_latency_ms']) == (50, 95, 99)
+    assert rows['m2']['p95_latency_ms'] == 950
+
+def test_query_endpoint(store, monkeypatch):
+    from main import app
+    monkeypatch.setattr(analytics, 'store', store)
+    monkeypatch.setattr(analytics, 'QUERY_STALENESS', 0)
+    _log('a', model='m1', template='t1')
+    resp = TestClient(app).get('/analytics/query?group_by=model,template&template=t1')
+    assert resp.status_code == 200
+    assert resp.json()['rows'][0]['template'] == 't1'
+    assert TestClient(app).get('/analytics/query?cache=warm').status_code == 400
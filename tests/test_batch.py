@@ -0,0 +1,84 @@
+import asyncio
+import json
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+from models.groq_handler import GroqHandler
+from models.registry import reset_handlers
+from utils.cache import ResponseCache
+
+@pytest.fixture
+def groq_env(monkeypatch):
+    monkeypatch.setenv('GROQ_API_KEY', 'test-key')
+    reset_handlers()
+    yield
+    reset_handlers()
+
+def test_bulk_cache_roundtrip(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    cache = ResponseCache(path)
+    cache.put_many([('a', 'm', 'ra', None), ('b', 'm', 'rb', None)])
+    assert cache.flush(timeout=5)
+    fresh = ResponseCache(path)
+    results = fresh.get_many([('b', 'm'), ('missing', 'm'), ('a', 'm'), ('a', 'other')])
+    assert [r for r, _ in results] == ['rb', None, 'ra', None]
+
+def _run_batch(items, delays, query=''):
+    from main import app
+
+    async def fake_generate(self, prompt):
+        await asyncio.sleep(delays.get(prompt, 0))
+        return f'answer to {prompt}', 3
+
+    async def fake_lookup(pairs):
+        return [('cached answer', None) if prompt == 'cached' else (None, None) for prompt, _ in pairs]
+
+    with patch.object(GroqHandler, 'agenerate', fake_generate), \
+            patch('main.aget_cached_responses', fake_lookup), \
+            patch('main.store_responses') as store, patch('main.log_interactions') as log:
+        resp = TestClient(app).post(f'/chat/batch?model=llama-3.1-8b-instant{query}', json={'items': items})
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+    return resp, lines, store, log
+
+def test_batch_streams_in_completion_order(groq_env):
+    items = [
+        {'prompt': 'slow'},
+        {'prompt': 'cached'},
+        {'prompt': 'fast'},
+        {'prompt': 'x', 'model': 'no-such-model'}
+    ]
+    resp, lines, store, log = _run_batch(items, {'slow': 0.2, 'fast': 0.01})
+    assert resp.headers['content-type'].startswith('application/x-ndjson')
+    assert [line['index'] for line in lines] == [3, 1, 2, 0]
+    assert lines[0]['status_code'] == 400
+    assert lines[1]['from_cache'] is True
+    assert lines[3]['response_text'] == 'answer to slow'
+    # One bulk write each at the end of the batch.
+    store.assert_called_once()
+    assert sorted(entry[0] for entry in store.call_args.args[0]) == ['fast', 'slow']
+    log.assert_called_once()
+    assert len(log.call_args.args[0]) == 3
+
+def test_batch_respects_provider_concurrency(groq_env, monkeypatch):
+    from main import app
+    monkeypatch.setenv('LLM_ROUTER_BATCH_CONCURRENCY_GROQ', '2')
+    running = []
+    peak = []
+
+    async def fake_generate(self, prompt):
+        running.append(prompt)
+        peak.append(len(running))
+        await asyncio.sleep(0.02)
+        running.remove(prompt)
+        return 'ok', 1
+
+    with patch.object(GroqHandler, 'agenerate', fake_generate), \
+            patch('main.store_responses'), patch('main.log_interactions'):
+        resp = TestClient(app).post('/chat/batch?model=llama-3.1-8b-instant&ignore_cache=true',
+                                    json={'items': [{'prompt': f'p{i}'} for i in range(6)]})
+    assert len(resp.text.splitlines()) == 6
+    assert max(peak) == 2
+
+def test_batch_rejects_empty_body():
+    from main import app
+    assert TestClient(app).post('/chat/batch', json={'items': []}).status_code == 400
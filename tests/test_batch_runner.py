@@ -0,0 +1,78 @@
+import asyncio
+import json
+import time
+import pytest
+from unittest.mock import patch
+from models.groq_handler import GroqHandler
+from models.registry import reset_handlers
+from utils.batch_runner import run, parse_rpm
+from utils.ratelimit import TokenBucket
+
+@pytest.fixture
+def groq_env(monkeypatch):
+    monkeypatch.setenv('GROQ_API_KEY', 'test-key')
+    reset_handlers()
+    yield
+    reset_handlers()
+
+def _write_lines(path, lines, mode='w'):
+    with open(path, mode, encoding='utf-8') as f:
+        for line in lines:
+            f.write((line if isinstance(line, str) else json.dumps(line)) + '\n')
+
+def _run(input_path, output_path, calls, **kwargs):
+    async def fake_generate(self, prompt):
+        calls.append(prompt)
+        # Later lines finish first; output must still be in input order.
+        await asyncio.sleep(0.02 / len(calls))
+        return f'answer to {prompt}', 2
+
+    with patch.object(GroqHandler, 'agenerate', fake_generate), \
+            patch('utils.dispatch.store_response'), patch('utils.batch_runner.log_interaction'):
+        return asyncio.run(run(str(input_path), str(output_path), model='llama-3.1-8b-instant', ignore_cache=True, **kwargs))
+
+def _read(path):
+    return [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+
+def test_runs_file_in_input_order(groq_env, tmp_path):
+    src, dst = tmp_path / 'in.jsonl', tmp_path / 'out.jsonl'
+    _write_lines(src, [{'prompt': 'a', 'id': 'x1'}, 'not json', '', {'prompt': 'b'}, {'prompt': 'c', 'model': 'nope'}])
+    calls = []
+    state = _run(src, dst, calls, concurrency=4)
+    results = _read(dst)
+    assert [r['line'] for r in results] == [1, 2, 4, 5]
+    assert results[0]['id'] == 'x1' and results[0]['response_text'] == 'answer to a'
+    assert results[1]['status_code'] == 400
+    assert results[3]['status_code'] == 400
+    assert state['completed'] == 4 and state['errors'] == 2
+
+def test_resumes_after_checkpoint(groq_env, tmp_path):
+    src, dst = tmp_path / 'in.jsonl', tmp_path / 'out.jsonl'
+    _write_lines(src, [{'prompt': f'p{i}'} for i in range(3)])
+    _run(src, dst, [])
+    # A torn line written after the last checkpoint must not survive a resume.
+    with open(dst, 'a', encoding='utf-8') as f:
+        f.write('{"line": 99, "resp')
+    _write_lines(src, [{'prompt': f'p{i}'} for i in range(3, 5)], mode='a')
+    calls = []
+    _run(src, dst, calls)
+    assert calls == ['p3', 'p4']
+    assert [r['line'] for r in _read(dst)] == [1, 2, 3, 4, 5]
+    calls = []
+    _run(src, dst, calls, restart=True)
+    assert len(calls) == 5
+    assert len(_read(dst)) == 5
+
+def test_token_bucket_paces_callers():
+    bucket = TokenBucket(rate=50, capacity=1)
+
+    async def take(n):
+        for _ in range(n):
+            await bucket.acquire()
+
+    start = time.monotonic()
+    asyncio.run(take(4))
+    assert time.monotonic() - start >= 0.05
+
+def test_parse_rpm():
+    assert parse_rpm('groq=30, gemini=15') == {'groq': 30.0, 'gemini': 15.0}
@@ -0,0 +1,61 @@
+import asyncio
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from bench.mock_provider import MockConfig, create_app, parse_latency
+from bench.load import parse_mix, percentile, summarize, compare
+from models.groq_handler import GroqHandler
+from models.errors import RateLimitError
+
+def test_parse_latency():
+    assert parse_latency('fixed:250')() == 0.25
+    assert 0.05 <= parse_latency('uniform:50-100')() <= 0.1
+    assert parse_latency('lognormal:200,0.5')() > 0
+    with pytest.raises(ValueError):
+        parse_latency('pareto:1')
+
+def _groq_against(config, monkeypatch):
+    # GroqHandler.agenerate talking to the mock app in-process.
+    monkeypatch.setenv('GROQ_API_KEY', 'bench')
+    monkeypatch.setenv('GROQ_API_URL', 'http://mock/openai/v1/chat/completions')
+    handler = GroqHandler('llama-3.1-8b-instant')
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=create_app(config)))
+    monkeypatch.setattr('models.groq_handler.get_async_client', lambda provider: client)
+    return handler
+
+def test_mock_speaks_groq_protocol(monkeypatch):
+    handler = _groq_against(MockConfig('fixed:0', response_tokens=10), monkeypatch)
+    text, token_count = asyncio.run(handler.agenerate('hello mock'))
+    assert text.startswith('Mock answer to: hello mock')
+    assert token_count.total == 12
+
+def test_mock_rate_limits_with_retry_after(monkeypatch):
+    handler = _groq_against(MockConfig('fixed:0', rate_limit_rate=1.0, retry_after=2.5), monkeypatch)
+    with pytest.raises(RateLimitError) as excinfo:
+        asyncio.run(handler.agenerate('hello'))
+    assert excinfo.value.retry_after == 2.5
+
+def test_mock_gemini_route():
+    client = TestClient(create_app(MockConfig('fixed:0', response_tokens=4)))
+    resp = client.post('/v1beta/models/gemini-2.5-flash:generateContent', json={'contents': [{'parts': [{'text': 'hi'}]}]})
+    data = resp.json()
+    assert data['candidates'][0]['content']['parts'][0]['text'].startswith('Mock')
+    assert data['usageMetadata']['candidatesTokenCount'] == 4
+
+def test_summary_and_compare():
+    assert parse_mix('chat=3,stats=1') == {'chat': 0.75, 'stats': 0.25}
+    assert percentile(list(range(1, 101)), 95) == 95
+    samples = [{'endpoint': 'chat', 'status': 200, 'ms': float(ms), 'from_cache': ms < 10} for ms in range(1, 101)]
+    samples.append({'endpoint': 'chat', 'status': 500, 'ms': 1.0})
+    summary = summarize(samples, elapsed=10.0)['chat']
+    assert summary['ok'] == 100 and summary['errors'] == 1 and summary['cache_hits'] == 9
+    assert summary['p99_ms'] == 99.0
+    baseline = {'endpoints': {'chat': dict(summary, p95_ms=50.0)}}
+    regressions = compare({'endpoints': {'chat': summary}}, baseline, tolerance=0.1)
+    assert regressions == ['chat p95_ms 50.0 -> 95.0 (+90.0%)']
+
+def test_startup_compare():
+    from bench.startup import compare as compare_startup
+    baseline = {'startup': {'import_ms': 1000.0, 'healthz_ms': 2000.0, 'ready_ms': 3000.0, 'first_chat_ms': 50.0}}
+    result = {'startup': {'import_ms': 1100.0, 'healthz_ms': 2000.0, 'ready_ms': 4500.0, 'first_chat_ms': 40.0}}
+    assert compare_startup(result, baseline, tolerance=0.2) == ['ready_ms 3000.0 -> 4500.0 (+50.0%)']
@@ -0,0 +1,59 @@
+import asyncio
+import sqlite3
+import time
+from utils.cache import ResponseCache, cache_key
+
+def test_roundtrip_through_sqlite(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    cache = ResponseCache(path)
+    cache.put('What is  the capital?', 'm', 'Paris')
+    assert cache.flush(timeout=5)
+    fresh = ResponseCache(path)
+    response, timestamp = fresh.get('What is the capital?', 'm')
+    assert response == 'Paris'
+    assert timestamp is not None
+    assert asyncio.run(fresh.aget('What is the capital?', 'other-model')) == (None, None)
+
+def test_key_is_fixed_size_and_param_sensitive():
+    assert len(cache_key('x' * 100000, 'm')) == 64
+    assert cache_key('hi', 'm', {'temperature': 0.7}) != cache_key('hi', 'm', {'temperature': 0})
+    assert cache_key(' hi\n', 'm') == cache_key('hi', 'm')
+
+def test_ttl_expiry(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache.db'), ttl_seconds=0.05)
+    cache.put('p', 'm', 'r')
+    assert cache.get('p', 'm')[0] == 'r'
+    time.sleep(0.1)
+    assert cache.get('p', 'm') == (None, None)
+
+def test_max_bytes_evicts_oldest(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache.db'), max_bytes=1000)
+    for i in range(20):
+        cache.put(f'prompt {i:02d}', 'm', 'x' * 90)
+        cache.flush(timeout=5)
+    cache.lru.clear()
+    assert cache.get('prompt 00', 'm') == (None, None)
+    assert cache.get('prompt 19', 'm')[0] == 'x' * 90
+    assert cache._total_bytes <= 1000
+
+def test_migrates_legacy_table(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE cache (prompt TEXT, model VARCHAR, response TEXT, timestamp DATETIME, PRIMARY KEY (prompt, model))')
+    conn.execute("INSERT INTO cache VALUES ('old prompt', 'm', 'old answer', '2025-07-15 19:45:46.596064')")
+    conn.commit()
+    conn.close()
+    cache = ResponseCache(path)
+    assert cache.get('old prompt', 'm')[0] == 'old answer'
+
+def test_two_writers_share_one_file(tmp_path):
+    # Separate ResponseCache instances stand in for worker processes; each
+    # commits through its own BEGIN IMMEDIATE connection.
+    path = str(tmp_path / 'cache.db')
+    writers = [ResponseCache(path), ResponseCache(path)]
+    for i in range(200):
+        for n, cache in enumerate(writers):
+            cache.put(f'p{n}-{i}', 'm', 'r')
+    assert all(cache.flush(timeout=10) for cache in writers)
+    assert sqlite3.connect(path).execute('SELECT count(*) FROM response_cache').fetchone()[0] == 400
+    assert ResponseCache(path).get('p1-199', 'm')[0] == 'r'
@@ -0,0 +1,95 @@
+import csv
+import json
+import time
+import asyncio
+import pytest
+from utils import cache_warm
+from datetime import datetime, timedelta
+from utils.cache import ResponseCache
+
+def _ago(**delta):
+    return (datetime.utcnow() - timedelta(**delta)).isoformat()
+
+def _entry(prompt, model='m', response='answer', **extra):
+    return {'timestamp': _ago(hours=2), 'prompt': prompt, 'model': model, 'response': response, **extra}
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    fresh = ResponseCache(str(tmp_path / 'cache.db'), semantic=False)
+    monkeypatch.setattr(cache_warm, 'response_cache', fresh)
+    monkeypatch.setattr(cache_warm, 'flush_cache', fresh.flush)
+    return fresh
+
+@pytest.fixture
+def log(tmp_path):
+    path = tmp_path / 'prompts.jsonl'
+    entries = [_entry('popular'), _entry(' popular ', response='newer answer', timestamp=_ago(hours=1)), _entry('popular'),
+               _entry('rare'), _entry('other model', model='n'), _entry('other model', model='n'),
+               _entry('in a session', session_id='s'), _entry('in a session', session_id='s'), _entry('in a session', session_id='s')]
+    path.write_text(''.join(json.dumps(e) + '\n' for e in entries))
+    return str(path)
+
+def test_top_pairs_counts_by_cache_key(log):
+    pairs = cache_warm.top_pairs(2, [log])
+    assert [(p['prompt'].strip(), p['model'], p['count']) for p in pairs] == [('popular', 'm', 3), ('other model', 'n', 2)]
+    assert pairs[0]['response'] == 'newer answer'
+
+def test_csv_logs(tmp_path):
+    path = tmp_path / 'prompts.csv'
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['timestamp', 'prompt', 'model', 'response'])
+        writer.writeheader()
+        writer.writerows([_entry('a'), _entry('b'), _entry('b')])
+    assert [p['prompt'] for p in cache_warm.top_pairs(5, [str(path)])] == ['b', 'a']
+
+def test_preload_skips_cached_pairs(cache, log):
+    cache.put('rare', 'm', 'fresh')
+    assert cache_warm.preload(10, [log]) == 2
+    cache.lru.clear()
+    assert cache.get('popular', 'm')[0] == 'newer answer'
+    assert cache.get('rare', 'm')[0] == 'fresh'
+    assert cache.get('in a session', 'm') == (None, None)
+
+def test_preload_keeps_logged_expiry(cache, tmp_path):
+    path = tmp_path / 'prompts.jsonl'
+    entries = [_entry('recent', timestamp=_ago(hours=1)), _entry('stale', timestamp=_ago(days=30))]
+    path.write_text(''.join(json.dumps(e) + '\n' for e in entries))
+    assert cache_warm.preload(10, [str(path)]) == 1
+    assert cache.get('stale', 'm') == (None, None)
+    row = next(cache.export_rows())
+    assert row['prompt'] == 'recent'
+    # A TTL from when it was logged, not from the preload.
+    assert abs(row['expires_at'] - (time.time() - 3600 + cache.ttl_seconds)) < 60
+
+def test_precompute_generates_missing_pairs(cache, log, monkeypatch):
+    calls = []
+
+    async def generate_response(prompt, model, provider):
+        calls.append((prompt, model))
+        cache.put(prompt, model, 'generated')
+        return {'model_used': model}
+    monkeypatch.setattr(cache_warm, 'generate_response', generate_response)
+    monkeypatch.setattr(cache_warm, 'provider_for', lambda model: 'groq')
+    cache.put('popular', 'm', 'cached')
+    stats = asyncio.run(cache_warm.precompute(10, [log], concurrency=2))
+    assert stats == {'pairs': 2, 'generated': 2, 'errors': 0}
+    assert sorted(model for _, model in calls) == ['m', 'n']
+
+@pytest.mark.parametrize('name', ['export.jsonl', 'export.jsonl.gz', 'export.db'])
+def test_export_import_roundtrip(cache, tmp_path, monkeypatch, name):
+    cache.put('hello', 'm', 'world')
+    cache.put('with params', 'm', 'x', params={'context': 'abc'})
+    path = str(tmp_path / name)
+    assert cache_warm.export_cache(path) == 2
+    target = ResponseCache(str(tmp_path / 'replica.db'), semantic=False)
+    monkeypatch.setattr(cache_warm, 'response_cache', target)
+    assert cache_warm.import_cache(path) == 2
+    assert target.get('hello', 'm')[0] == 'world'
+    # Keys are kept as exported, so parameterized entries still match.
+    assert target.get('with params', 'm', {'context': 'abc'})[0] == 'x'
+    assert target._total_bytes == cache._total_bytes
+
+def test_import_drops_expired_rows(cache, tmp_path):
+    path = tmp_path / 'export.jsonl'
+    path.write_text(json.dumps({'key': 'k' * 64, 'model': 'm', 'prompt': 'p', 'response': 'r', 'timestamp': None, 'expires_at': 1.0}) + '\n')
+    assert cache_warm.import_cache(str(path)) == 0
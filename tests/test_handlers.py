@@ -0,0 +1,88 @@
+import asyncio
+import time
+import httpx
+import pytest
+from unittest.mock import patch
+from models import http_client
+from models.groq_handler import GroqHandler
+from models.registry import get_handler, provider_for, reset_handlers
+from models.usage import TokenUsage
+
+def _groq_transport(handler):
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+@pytest.fixture
+def groq_env(monkeypatch):
+    monkeypatch.setenv('GROQ_API_KEY', 'test-key')
+    reset_handlers()
+    yield
+    reset_handlers()
+    http_client._async_clients.clear()
+
+def test_groq_agenerate_parses_response(groq_env):
+    def handler(request):
+        assert request.headers['Authorization'] == 'Bearer test-key'
+        return httpx.Response(200, json={
+            'choices': [{'message': {'content': ' Paris. '}}],
+            'usage': {'total_tokens': 12}
+        })
+    http_client._async_clients['groq'] = _groq_transport(handler)
+    text, tokens = asyncio.run(GroqHandler(model_override='llama-3.1-8b-instant').agenerate('Capital of France?'))
+    assert text == 'Paris.'
+    assert tokens == TokenUsage(total_tokens=12)
+
+def test_groq_agenerate_raises_api_error(groq_env):
+    def handler(request):
+        return httpx.Response(400, json={'error': {'message': 'bad prompt'}})
+    http_client._async_clients['groq'] = _groq_transport(handler)
+    with pytest.raises(RuntimeError, match='bad prompt'):
+        asyncio.run(GroqHandler(model_override='llama-3.1-8b-instant').agenerate('x'))
+
+def test_chat_does_not_block_event_loop(groq_env, tmp_path):
+    from main import app
+    import models.gemini_handler  # keep the SDK import out of the timed section
+
+    async def slow_generate(self, prompt):
+        await asyncio.sleep(0.2)
+        return f'echo {prompt}', 3
+
+    async def fire():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return await asyncio.gather(*[
+                client.post('/chat?model=llama-3.1-8b-instant&ignore_cache=true', json={'prompt': f'p{i}'})
+                for i in range(5)
+            ])
+
+    with patch.object(GroqHandler, 'agenerate', slow_generate), \
+            patch('utils.dispatch.store_response'), patch('main.log_interaction'):
+        start = time.time()
+        responses = asyncio.run(fire())
+        elapsed = time.time() - start
+    assert all(r.status_code == 200 for r in responses)
+    assert elapsed < 0.2 * 5
+
+def test_registry_reuses_handlers(groq_env):
+    first = get_handler('llama-3.1-8b-instant')
+    assert get_handler('llama-3.1-8b-instant') is first
+    assert get_handler('llama-3.3-70b-versatile') is not first
+
+def test_registry_does_not_cache_failed_construction(monkeypatch):
+    reset_handlers()
+    monkeypatch.delenv('GROQ_API_KEY', raising=False)
+    with pytest.raises(ValueError):
+        get_handler('llama-3.1-8b-instant')
+    monkeypatch.setenv('GROQ_API_KEY', 'late-key')
+    assert get_handler('llama-3.1-8b-instant').api_key == 'late-key'
+    reset_handlers()
+
+def test_provider_for():
+    assert provider_for('gemini-2.5-flash') == 'gemini'
+    assert provider_for('moonshotai/kimi-k2-instruct') == 'groq'
+    assert provider_for('groq') is None
+
+def test_async_client_is_pooled_per_provider():
+    http_client._async_clients.clear()
+    assert http_client.get_async_client('groq') is http_client.get_async_client('groq')
+    assert http_client.get_async_client('groq') is not http_client.get_async_client('gemini')
+    http_client._async_clients.clear()
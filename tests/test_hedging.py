@@ -0,0 +1,81 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+from models.groq_handler import GroqHandler
+from models.registry import reset_handlers
+
+@pytest.fixture
+def groq_env(monkeypatch):
+    monkeypatch.setenv('GROQ_API_KEY', 'test-key')
+    reset_handlers()
+    yield
+    reset_handlers()
+
+def _post(query, delays, failures=()):
+    from main import app
+    started, cancelled = [], []
+
+    async def fake_generate(self, prompt):
+        started.append(self.model)
+        try:
+            await asyncio.sleep(delays[self.model])
+        except asyncio.CancelledError:
+            cancelled.append(self.model)
+            raise
+        if self.model in failures:
+            raise RuntimeError(f'{self.model} failed')
+        return f'answer from {self.model}', 4
+
+    with patch.object(GroqHandler, 'agenerate', fake_generate), \
+            patch('utils.dispatch.store_response'), patch('main.log_interaction') as log:
+        resp = TestClient(app).post(f'/chat?model=llama-3.3-70b-versatile&ignore_cache=true&{query}', json={'prompt': 'q'})
+    return resp, started, cancelled, log
+
+def test_fast_primary_does_not_hedge(groq_env):
+    resp, started, _, _ = _post('hedge_after_ms=200', {'llama-3.3-70b-versatile': 0.01, 'llama-3.1-8b-instant': 0.01})
+    data = resp.json()
+    assert started == ['llama-3.3-70b-versatile']
+    assert data['hedge']['fired'] is False
+    assert data['model_used'] == 'llama-3.3-70b-versatile'
+
+def test_slow_primary_loses_to_hedge(groq_env):
+    resp, started, cancelled, log = _post('hedge_after_ms=50', {'llama-3.3-70b-versatile': 1.0, 'llama-3.1-8b-instant': 0.01})
+    data = resp.json()
+    assert started == ['llama-3.3-70b-versatile', 'llama-3.1-8b-instant']
+    assert cancelled == ['llama-3.3-70b-versatile']
+    assert data['model_used'] == 'llama-3.1-8b-instant'
+    assert data['hedge']['fired'] is True
+    assert data['hedge']['winner'] == 'llama-3.1-8b-instant'
+    assert data['hedge']['overhead_ms'] >= 50
+    assert data['latency_ms'] < 1000
+    assert log.call_args.kwargs['hedge']['winner'] == 'llama-3.1-8b-instant'
+
+def test_primary_failure_before_deadline_falls_back(groq_env):
+    resp, started, _, _ = _post('hedge_after_ms=500', {'llama-3.3-70b-versatile': 0.0, 'llama-3.1-8b-instant': 0.0},
+                                failures=('llama-3.3-70b-versatile',))
+    data = resp.json()
+    assert resp.status_code == 200
+    assert data['hedge']['fired'] is False
+    assert data['model_used'] == 'llama-3.1-8b-instant'
+
+def test_both_fail(groq_env):
+    resp, _, _, _ = _post('hedge_after_ms=10', {'llama-3.3-70b-versatile': 0.05, 'llama-3.1-8b-instant': 0.0},
+                          failures=('llama-3.3-70b-versatile', 'llama-3.1-8b-instant'))
+    assert resp.status_code == 500
+    assert 'llama-3.1-8b-instant failed' in resp.json()['detail']
+
+@pytest.mark.parametrize('error', ['invalid', 'auth'])
+def test_rejected_primary_does_not_start_backup(groq_env, error):
+    from models.errors import InvalidRequestError, AuthError
+    from main import app
+    started = []
+
+    async def fake_generate(self, prompt):
+        started.append(self.model)
+        raise InvalidRequestError('bad request') if error == 'invalid' else AuthError('bad key')
+
+    with patch.object(GroqHandler, 'agenerate', fake_generate), patch('utils.dispatch.store_response'):
+        resp = TestClient(app).post('/chat?model=llama-3.3-70b-versatile&ignore_cache=true&hedge_after_ms=500', json={'prompt': 'q'})
+    assert started == ['llama-3.3-70b-versatile']
+    assert resp.status_code == (400 if error == 'invalid' else 500)
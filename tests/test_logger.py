@@ -0,0 +1,100 @@
+import csv
+import json
+import os
+import pytest
+from utils import logger
+from utils.migrate_logs import migrate
+
+@pytest.fixture
+def log_paths(tmp_path, monkeypatch):
+    monkeypatch.setattr(logger, 'PROMPTS_LOG', str(tmp_path / 'prompts.jsonl'))
+    monkeypatch.setattr(logger, 'RATINGS_LOG', str(tmp_path / 'ratings.jsonl'))
+    monkeypatch.setattr(logger, 'CSV_LOG', str(tmp_path / 'prompts.csv'))
+    monkeypatch.setattr(logger, 'RATINGS_CSV', str(tmp_path / 'ratings.csv'))
+    monkeypatch.setattr(logger, 'JSON_LOG', str(tmp_path / 'prompts.json'))
+    monkeypatch.setattr(logger, 'RATINGS_JSON', str(tmp_path / 'ratings.json'))
+    yield tmp_path
+    logger.flush_logs(timeout=5)
+
+def test_log_interaction_appends_jsonl(log_paths):
+    for i in range(3):
+        logger.log_interaction(f't{i}', f'p{i}', 'm', 'r', 10, 5, f'id{i}')
+    assert logger.flush_logs(timeout=5)
+    lines = (log_paths / 'prompts.jsonl').read_text(encoding='utf-8').splitlines()
+    assert [json.loads(line)['prompt_id'] for line in lines] == ['id0', 'id1', 'id2']
+    assert (log_paths / 'prompts.csv').read_text(encoding='utf-8').startswith('timestamp,prompt,model')
+
+def test_log_rating_v2_appends(log_paths):
+    logger.log_rating_v2('id0', 'm', 5, 'great')
+    logger.log_rating('id0', 4, 'ts')
+    logger.flush_logs(timeout=5)
+    assert [r['rating'] for r in logger.iter_ratings()] == [5, 4]
+
+def test_rotation_by_size(log_paths, monkeypatch):
+    monkeypatch.setattr(logger, 'ROTATE_MAX_BYTES', 1)
+    for i in range(3):
+        logger.log_interaction('t', 'p', 'm', 'r', 1, 1, f'id{i}')
+    logger.flush_logs(timeout=5)
+    segments = logger.segment_paths(str(log_paths / 'prompts.jsonl'))
+    assert len(segments) == 3
+    assert [e['prompt_id'] for e in logger.iter_interactions()] == ['id0', 'id1', 'id2']
+
+def test_iter_skips_torn_line(log_paths):
+    (log_paths / 'prompts.jsonl').write_text('{"prompt_id": "a"}\n{"prompt_', encoding='utf-8')
+    assert [e['prompt_id'] for e in logger.iter_interactions()] == ['a']
+
+def test_migrate_legacy_json(log_paths):
+    legacy = log_paths / 'prompts.json'
+    legacy.write_text(json.dumps([{'prompt_id': 'old1'}, {'prompt_id': 'old2'}]), encoding='utf-8')
+    logger.log_interaction('t', 'p', 'm', 'r', 1, 1, 'new1')
+    logger.flush_logs(timeout=5)
+    before = [e['prompt_id'] for e in logger.iter_interactions()]
+    assert migrate(str(legacy), str(log_paths / 'prompts.jsonl')) == 2
+    assert not legacy.exists()
+    assert os.path.exists(str(legacy) + '.migrated')
+    assert [e['prompt_id'] for e in logger.iter_interactions()] == before == ['old1', 'old2', 'new1']
+
+def test_per_worker_segments_are_merged(log_paths, monkeypatch):
+    monkeypatch.setattr(logger, 'LOG_PER_WORKER', True)
+    (log_paths / 'prompts.w1.jsonl').write_text('{"prompt_id": "other-worker"}\n', encoding='utf-8')
+    (log_paths / 'prompts.w1.20200101T000000000000.jsonl').write_text('{"prompt_id": "rotated"}\n', encoding='utf-8')
+    logger.log_interaction('t', 'p', 'm', 'r', 1, 1, 'mine')
+    assert logger.flush_logs(timeout=5)
+    assert (log_paths / f'prompts.w{os.getpid()}.jsonl').exists()
+    assert not (log_paths / 'prompts.jsonl').exists()
+    assert [e['prompt_id'] for e in logger.iter_interactions()][0] == 'rotated'
+    assert {e['prompt_id'] for e in logger.iter_interactions()} == {'rotated', 'other-worker', 'mine'}
+
+def test_csv_with_old_header_keeps_its_columns_until_migrated(log_paths):
+    from utils.migrate_logs import migrate_csv
+    old = log_paths / 'prompts.csv'
+    old.write_text(','.join(logger.INTERACTION_FIELDS[:-1]) + '\r\nt,p,m,r,1,1,old,,False\r\n', encoding='utf-8')
+    logger.log_interaction('t', 'p', 'm', 'r', 1, 1, 'new', fallback_used=True)
+    logger.flush_logs(timeout=5)
+
+    def rows():
+        with open(old, newline='', encoding='utf-8') as f:
+            return list(csv.DictReader(f))
+    assert [r['prompt_id'] for r in rows()] == ['old', 'new'] and all(None not in r for r in rows())
+    assert logger.segment_paths(str(old)) == [str(old)]
+    assert migrate_csv(str(old), logger.INTERACTION_FIELDS) == 2
+    assert [r['fallback_used'] for r in rows()] == ['', ''] and list(rows()[0]) == logger.INTERACTION_FIELDS
+    assert migrate_csv(str(old), logger.INTERACTION_FIELDS) == 0
+
+def test_per_worker_stats_follow_every_worker(log_paths, monkeypatch):
+    from utils.stats import StatsAggregator
+    monkeypatch.setattr(logger, 'LOG_PER_WORKER', True)
+    monkeypatch.setattr(logger, 'aggregator', StatsAggregator())
+    monkeypatch.setattr(logger, '_stats_offsets', {})
+    monkeypatch.setattr(logger, '_stats_follower', object())
+    other = log_paths / 'prompts.w1.jsonl'
+    other.write_text(json.dumps({'model': 'm', 'latency_ms': 100}) + '\n', encoding='utf-8')
+    logger.log_interaction('t', 'p', 'm', 'r', 300, 1, 'mine')
+    assert logger.load_stats().snapshot()['model_usage'] == {'m': 2}
+    # Another worker's later lines show up; nothing is counted twice.
+    with open(other, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({'model': 'n', 'latency_ms': 5}) + '\n' + '{"model": "torn')
+    (log_paths / 'ratings.w1.jsonl').write_text(json.dumps({'model': 'm', 'rating': 4}) + '\n', encoding='utf-8')
+    snapshot = logger.load_stats().snapshot()
+    assert snapshot['model_usage'] == {'m': 2, 'n': 1} and snapshot['avg_rating']['m'] == 4
+    assert logger.load_stats().snapshot()['total_prompts'] == 3
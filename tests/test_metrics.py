@@ -0,0 +1,88 @@
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from models.groq_handler import GroqHandler
+from models.registry import reset_handlers
+from utils import metrics
+from utils.metrics import Registry
+
+def test_render_histogram_and_counter():
+    registry = Registry()
+    latency = registry.histogram('latency_seconds', 'Latency.', ('model',), buckets=(0.1, 1.0))
+    errors = registry.counter('errors_total', 'Errors.', ('model', 'error'))
+    latency.observe(0.05, 'a')
+    latency.observe(0.5, 'a')
+    latency.observe(5, 'a')
+    errors.inc('a', 'Timeout"Error')
+    text = registry.render()
+    assert '# TYPE latency_seconds histogram' in text
+    assert 'latency_seconds_bucket{model="a",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{model="a",le="1.0"} 2' in text
+    assert 'latency_seconds_bucket{model="a",le="+Inf"} 3' in text
+    assert 'latency_seconds_sum{model="a"} 5.55' in text
+    assert 'latency_seconds_count{model="a"} 3' in text
+    assert 'errors_total{model="a",error="Timeout\\"Error"} 1' in text
+
+def test_merge_sums_worker_snapshots():
+    registry = Registry()
+    latency = registry.histogram('latency_seconds', 'Latency.', (), buckets=(1.0,))
+    hits = registry.counter('hits_total', 'Hits.', ('tier',))
+    latency.observe(0.5)
+    hits.inc('exact', amount=2)
+    first = registry.snapshot()
+    latency.observe(2.0)
+    hits.inc('exact')
+    second = registry.snapshot()
+    text = registry.render(registry.merge([first, second]))
+    assert 'hits_total{tier="exact"} 5' in text
+    assert 'latency_seconds_bucket{le="1.0"} 2' in text
+    assert 'latency_seconds_count 3' in text
+
+def test_updates_from_many_threads_are_not_lost():
+    import threading
+    registry = Registry()
+    count = registry.counter('c_total', 'C.', ('k',))
+    latency = registry.histogram('h_seconds', 'H.', ('k',), buckets=(1.0,))
+
+    def work():
+        for _ in range(20000):
+            count.inc('x')
+            latency.observe(0.5, 'x')
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert count.series[('x',)] == 160000
+    assert latency.series[('x',)][:2] == [160000, 0]
+    assert latency.series[('x',)][-1] == 80000.0
+
+def test_multiprocess_render_reads_all_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_DIR', str(tmp_path))
+    before = metrics.fallbacks.series.get(('m-a', 'm-b'), 0)
+    metrics.fallbacks.inc('m-a', 'm-b')
+    (tmp_path / 'metrics-999999.json').write_text(
+        '{"llm_router_fallbacks_total": [[["m-a", "m-b"], 4]]}', encoding='utf-8')
+    text = metrics.render_metrics()
+    assert f'llm_router_fallbacks_total{{requested="m-a",served="m-b"}} {before + 5}' in text
+
+def test_chat_updates_metrics(monkeypatch):
+    monkeypatch.setenv('GROQ_API_KEY', 'test-key')
+    reset_handlers()
+    from main import app
+
+    async def fake_generate(self, prompt):
+        return 'ok', 12
+
+    series = ('llama-3.1-8b-instant', 'out')
+    before = metrics.tokens.series.get(series, 0)
+    with patch.object(GroqHandler, 'agenerate', fake_generate), \
+            patch('utils.dispatch.store_response'), patch('main.log_interaction'):
+        client = TestClient(app)
+        response = client.post('/chat?model=llama-3.1-8b-instant&ignore_cache=true', json={'prompt': 'metrics test'})
+        assert response.status_code == 200
+        scrape = client.get('/metrics')
+    assert scrape.status_code == 200
+    assert scrape.headers['content-type'].startswith('text/plain')
+    assert metrics.tokens.series[series] > before
+    assert 'llm_router_upstream_duration_seconds_count{model="llama-3.1-8b-instant",outcome="ok"}' in scrape.text
+    assert 'llm_router_request_duration_seconds_bucket{endpoint="/chat",cache="bypass",le="+Inf"}' in scrape.text
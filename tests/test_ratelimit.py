@@ -0,0 +1,153 @@
+import asyncio
+import time
+import httpx
+import pytest
+from unittest.mock import patch
+from models import http_client
+from models.errors import RateLimitError, parse_retry_after
+from models.groq_handler import GroqHandler
+from models.registry import reset_handlers
+from utils import metrics
+from utils.ratelimit import RateLimiter, RateLimitTimeout, SQLiteBackend, _parse_limits
+
+def test_parse_limits_and_durations():
+    limits = _parse_limits('groq=30/6000/8, meta-llama/llama-4-scout-17b-16e-instruct=5')
+    assert limits['groq'] == (30.0, 6000.0, 8)
+    assert limits['meta-llama/llama-4-scout-17b-16e-instruct'] == (5.0, 0.0, 0)
+    assert parse_retry_after('2m30s') == 150.0
+    assert parse_retry_after('1.5') == 1.5
+
+def test_rpm_queues_until_deadline():
+    limiter = RateLimiter(limits={'groq': (2, 0, 0)}, max_wait=0.1)
+
+    async def run():
+        await limiter.acquire('llama-3.1-8b-instant', 'k', 10)
+        await limiter.acquire('llama-3.1-8b-instant', 'k', 10)
+        # Other keys and models have their own buckets.
+        await limiter.acquire('llama-3.1-8b-instant', 'other-key', 10)
+        await limiter.acquire('llama-3.3-70b-versatile', 'k', 10)
+        with pytest.raises(RateLimitTimeout):
+            await limiter.acquire('llama-3.1-8b-instant', 'k', 10)
+
+    asyncio.run(run())
+    lane = limiter.snapshot()
+    assert sum(v['timeouts'] for v in lane.values()) == 1
+    assert all('k' not in name.split(':')[0] for name in lane)
+
+def test_concurrency_cap_and_queue_depth():
+    limiter = RateLimiter(limits={'m-model': (0, 0, 1)})
+    depths = []
+
+    async def hold(delay):
+        permit = await limiter.acquire('m-model', 'k', 1)
+        await asyncio.sleep(delay)
+        depths.append(next(iter(limiter.snapshot().values()))['queue_depth'])
+        permit.release()
+
+    async def run():
+        start = time.monotonic()
+        await asyncio.gather(hold(0.05), hold(0.05))
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) >= 0.1
+    assert depths[0] == 1
+    stats = next(iter(limiter.snapshot().values()))
+    assert stats['admitted'] == 2 and stats['active'] == 0 and stats['max_wait_ms'] >= 40
+
+def test_retry_after_blocks_lane_and_tokens_settle():
+    limiter = RateLimiter(limits={'m-model': (0, 1000, 0)})
+
+    async def run():
+        permit = await limiter.acquire('m-model', 'k', 800)
+        permit.release(actual_tokens=100)
+        # The unused 700 tokens were returned, so this fits immediately.
+        await limiter.acquire('m-model', 'k', 800)
+        limiter.penalize('m-model', 'k', retry_after=0.05)
+        start = time.monotonic()
+        with pytest.raises(RateLimitTimeout):
+            await limiter.acquire('m-model', 'k', 1, max_wait=0.01)
+        await limiter.acquire('m-model', 'k', 1, max_wait=1)
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) >= 0.04
+
+def test_oversized_request_refunds_what_was_charged():
+    limiter = RateLimiter(limits={'m-model': (0, 1000, 0)})
+
+    async def run():
+        permit = await limiter.acquire('m-model', 'k', 5000)
+        assert permit.tokens == 1000
+        permit.release(actual_tokens=100)
+        # 900 came back, not 4900: a 950-token request still has to wait.
+        with pytest.raises(RateLimitTimeout):
+            await limiter.acquire('m-model', 'k', 950, max_wait=0.01)
+        await limiter.acquire('m-model', 'k', 850, max_wait=0.01)
+
+    asyncio.run(run())
+
+def test_sqlite_backend_is_shared(tmp_path):
+    path = str(tmp_path / 'limits.db')
+    first = RateLimiter(limits={'m-model': (2, 0, 0)}, backend=SQLiteBackend(path), max_wait=0.05)
+    second = RateLimiter(limits={'m-model': (2, 0, 0)}, backend=SQLiteBackend(path), max_wait=0.05)
+
+    async def run():
+        await first.acquire('m-model', 'k', 1)
+        await second.acquire('m-model', 'k', 1)
+        with pytest.raises(RateLimitTimeout):
+            await first.acquire('m-model', 'k', 1)
+
+    asyncio.run(run())
+
+@pytest.fixture
+def groq_env(monkeypatch):
+    monkeypatch.setenv('GROQ_API_KEY', 'test-key')
+    reset_handlers()
+    yield
+    reset_handlers()
+    http_client._async_clients.clear()
+
+def test_groq_429_is_typed_with_retry_after(groq_env):
+    def handler(request):
+        return httpx.Response(429, headers={'retry-after': '3'}, json={'error': {'message': 'Rate limit reached'}})
+    http_client._async_clients['groq'] = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    with pytest.raises(RateLimitError) as info:
+        asyncio.run(GroqHandler(model_override='llama-3.1-8b-instant').agenerate('x'))
+    assert info.value.retry_after == 3.0
+
+def test_call_model_waits_out_retry_after_then_retries(groq_env):
+    from utils.dispatch import call_model
+    calls = []
+
+    async def fake_generate(self, prompt):
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            raise RateLimitError('Rate limit reached', retry_after=0.05)
+        return 'ok', 3
+
+    with patch.object(GroqHandler, 'agenerate', fake_generate):
+        result = asyncio.run(call_model('llama-3.1-8b-instant', 'hi'))
+    assert result['response_text'] == 'ok'
+    assert calls[1] - calls[0] >= 0.04
+
+def test_queue_metrics_are_exported():
+    limiter = RateLimiter(limits={'metrics-model': (0, 0, 1)}, max_wait=0.05)
+    timeouts = metrics.ratelimit_timeouts.series.get(('metrics-model',), 0)
+    depths = []
+
+    async def run():
+        held = await limiter.acquire('metrics-model', 'k', 1)
+        waiter = asyncio.ensure_future(limiter.acquire('metrics-model', 'k', 1))
+        await asyncio.sleep(0.01)
+        depths.append(metrics.ratelimit_queue_depth.series[('metrics-model',)])
+        with pytest.raises(RateLimitTimeout):
+            await waiter
+        held.release()
+
+    asyncio.run(run())
+    assert depths == [1] and metrics.ratelimit_queue_depth.series[('metrics-model',)] == 0
+    assert metrics.ratelimit_timeouts.series[('metrics-model',)] == timeouts + 1
+    text = metrics.registry.render()
+    assert '# TYPE llm_router_ratelimit_queue_depth gauge' in text
+    assert 'llm_router_ratelimit_queue_depth{model="metrics-model"} 0' in text
+    assert 'llm_router_ratelimit_wait_seconds_count{model="metrics-model",outcome="timeout"} 1' in text
+    assert 'llm_router_ratelimit_wait_seconds_count{model="metrics-model",outcome="admitted"} 1' in text
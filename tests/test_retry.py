@@ -0,0 +1,88 @@
+import asyncio
+import httpx
+import pytest
+from fastapi import HTTPException
+from unittest.mock import patch
+from models import http_client
+from models.errors import (RateLimitError, TransientError, AuthError, InvalidRequestError, SafetyBlockError, classify,
+                           TRANSIENT, UNKNOWN)
+from models.groq_handler import GroqHandler
+from models.registry import reset_handlers
+from utils import retry
+from utils.retry import RetryBudget
+from utils.dispatch import generate_response
+from utils.routing import router
+
+@pytest.fixture
+def groq_env(monkeypatch):
+    monkeypatch.setenv('GROQ_API_KEY', 'test-key')
+    monkeypatch.setattr(retry, 'RETRY_BASE_DELAY', 0.001)
+    reset_handlers()
+    yield
+    reset_handlers()
+    http_client._async_clients.clear()
+
+@pytest.mark.parametrize('status, error', [
+    (500, TransientError), (503, TransientError), (408, TransientError),
+    (401, AuthError), (403, AuthError), (400, InvalidRequestError), (413, InvalidRequestError), (429, RateLimitError),
+])
+def test_groq_status_is_typed(groq_env, status, error):
+    http_client._async_clients['groq'] = httpx.AsyncClient(transport=httpx.MockTransport(
+        lambda request: httpx.Response(status, json={'error': {'message': 'nope'}})))
+    with pytest.raises(error):
+        asyncio.run(GroqHandler(model_override='llama-3.1-8b-instant').agenerate('x'))
+
+def test_classify_untyped_errors():
+    assert classify(asyncio.TimeoutError()) == TRANSIENT
+    assert classify(ConnectionResetError()) == TRANSIENT
+    assert classify(RuntimeError('boom')) == UNKNOWN
+
+def _generate(responses):
+    # agenerate stand-in replaying a per-model list of results/exceptions.
+    calls = []
+
+    async def agenerate(self, prompt):
+        calls.append(self.model)
+        result = responses[self.model].pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+    return agenerate, calls
+
+def test_transient_error_retries_same_model(groq_env):
+    agenerate, calls = _generate({'llama-3.3-70b-versatile': [TransientError('503'), TransientError('503'), ('ok', 5)]})
+    with patch.object(GroqHandler, 'agenerate', agenerate):
+        result = asyncio.run(generate_response('hi', 'llama-3.3-70b-versatile', 'groq', store=False))
+    assert result['model_used'] == 'llama-3.3-70b-versatile'
+    assert result['retries'] == 2
+    assert router.health['llama-3.3-70b-versatile'].consecutive_failures == 0
+
+def test_retries_exhausted_then_fallback(groq_env):
+    agenerate, calls = _generate({'llama-3.3-70b-versatile': [TransientError('503')] * 3,
+                                  'llama-3.1-8b-instant': [('fallback', 5)]})
+    with patch.object(GroqHandler, 'agenerate', agenerate):
+        result = asyncio.run(generate_response('hi', 'llama-3.3-70b-versatile', 'groq', store=False))
+    assert calls == ['llama-3.3-70b-versatile'] * 3 + ['llama-3.1-8b-instant']
+    assert result['model_used'] == 'llama-3.1-8b-instant' and result['retries'] == 2
+
+@pytest.mark.parametrize('error, status', [(InvalidRequestError('bad prompt', 400), 400), (SafetyBlockError('blocked'), 400),
+                                           (AuthError('bad key', 401), 500)])
+def test_no_retry_or_fallback_that_cannot_help(groq_env, error, status):
+    agenerate, calls = _generate({'llama-3.3-70b-versatile': [error], 'llama-3.1-8b-instant': [('fallback', 5)]})
+    with patch.object(GroqHandler, 'agenerate', agenerate):
+        with pytest.raises(HTTPException) as info:
+            asyncio.run(generate_response('hi', 'llama-3.3-70b-versatile', 'groq', store=False))
+    assert calls == ['llama-3.3-70b-versatile']
+    assert info.value.status_code == status
+    # Rejected requests say nothing about the model's health.
+    failures = router.health['llama-3.3-70b-versatile'].consecutive_failures
+    assert failures == (1 if isinstance(error, AuthError) else 0)
+
+def test_budget_bounds_retries():
+    budget = RetryBudget(budget=0.0)
+    assert budget.retry_delay(TransientError('503'), 0) is None
+    budget = RetryBudget(budget=10, max_attempts=2)
+    assert budget.retry_delay(RateLimitError('429', retry_after=1.5), 0) == 1.5
+    assert budget.retry_delay(TransientError('503'), 1) is None
+    assert budget.retry_delay(RuntimeError('boom'), 0) is None
+    assert 0 <= retry.backoff(3, base=0.1, cap=0.5) <= 0.5
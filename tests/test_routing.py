@@ -0,0 +1,160 @@
+import time
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+from models.groq_handler import GroqHandler
+from models.registry import reset_handlers
+from utils import routing
+from utils.routing import Router, OPEN, HALF_OPEN, CLOSED
+
+def test_circuit_opens_after_consecutive_failures():
+    r = Router()
+    for _ in range(routing.FAILURE_THRESHOLD):
+        assert r.allow('m')
+        r.record_failure('m', RuntimeError('boom'))
+    assert r.health['m'].state == OPEN
+    assert not r.allow('m')
+
+def test_half_open_allows_single_probe():
+    r = Router()
+    for _ in range(routing.FAILURE_THRESHOLD):
+        r.record_failure('m', RuntimeError('boom'))
+    later = time.time() + routing.BASE_COOLDOWN + 1
+    assert r.allow('m', now=later)
+    assert r.health['m'].state == HALF_OPEN
+    assert not r.allow('m', now=later)
+    r.record_success('m', 100)
+    assert r.health['m'].state == CLOSED
+    assert r.allow('m')
+
+def test_failed_probe_doubles_cooldown():
+    r = Router()
+    for _ in range(routing.FAILURE_THRESHOLD):
+        r.record_failure('m', RuntimeError('boom'))
+    assert r.allow('m', now=time.time() + routing.BASE_COOLDOWN + 1)
+    r.record_failure('m', RuntimeError('still down'))
+    assert r.health['m'].cooldown == routing.BASE_COOLDOWN * 2
+
+def test_rate_limit_parks_model_without_tripping_breaker():
+    r = Router()
+    r.record_failure('m', RuntimeError('Groq API error: Rate limit reached'), retry_after=30)
+    assert r.health['m'].state == CLOSED
+    assert not r.allow('m')
+    assert r.allow('m', now=time.time() + 31)
+
+def test_attempt_timeout_tracks_p95():
+    r = Router()
+    assert r.attempt_timeout('m') == routing.MAX_ATTEMPT_TIMEOUT
+    for _ in range(routing.MIN_SAMPLES_FOR_TIMEOUT):
+        r.record_success('m', 2000)
+    assert r.attempt_timeout('m') == pytest.approx(8.0)
+
+def test_fallbacks_ordered_by_expected_latency(monkeypatch):
+    monkeypatch.setitem(routing.FALLBACKS, 'groq', ['llama-3.1-8b-instant', 'llama-3.3-70b-versatile'])
+    r = Router()
+    r.record_success('llama-3.1-8b-instant', 900)
+    r.record_success('llama-3.3-70b-versatile', 300)
+    assert r.candidates('mistral-saba-24b') == ['mistral-saba-24b', 'llama-3.3-70b-versatile', 'llama-3.1-8b-instant']
+
+def test_rank_auto_prefers_fast_cheap_well_rated(monkeypatch):
+    monkeypatch.setenv('GROQ_API_KEY', 'k')
+    monkeypatch.delenv('GEMINI_API_KEY', raising=False)
+    r = Router()
+    r.record_success('llama-3.1-8b-instant', 200)
+    r.record_success('llama-3.3-70b-versatile', 3000)
+    ranked = r.rank_auto(['llama-3.1-8b-instant', 'llama-3.3-70b-versatile', 'gemini-2.5-pro'])
+    assert ranked == ['llama-3.1-8b-instant', 'llama-3.3-70b-versatile']
+
+def test_rank_auto_costs_come_from_accounting_prices(monkeypatch):
+    from utils import accounting
+    monkeypatch.setenv('GROQ_API_KEY', 'k')
+    monkeypatch.setitem(routing.AUTO_WEIGHTS, 'latency', 0.0)
+    monkeypatch.setitem(routing.AUTO_WEIGHTS, 'rating', 0.0)
+    models = ['llama-3.1-8b-instant', 'llama-3.3-70b-versatile']
+    assert Router().rank_auto(models) == models
+    # A price change reorders model=auto just like budget-aware candidates().
+    monkeypatch.setitem(accounting.PRICES, 'llama-3.3-70b-versatile', (0.01, 0.01))
+    assert Router().rank_auto(models) == models[::-1]
+
+def test_chat_skips_open_circuit(monkeypatch):
+    from main import app
+    from utils.routing import router
+    monkeypatch.setenv('GROQ_API_KEY', 'test-key')
+    reset_handlers()
+    for _ in range(routing.FAILURE_THRESHOLD):
+        router.record_failure('llama-3.3-70b-versatile', RuntimeError('down'))
+    called = []
+
+    async def fake_generate(self, prompt):
+        called.append(self.model)
+        return 'from fallback', 3
+
+    with patch.object(GroqHandler, 'agenerate', fake_generate), \
+            patch('utils.dispatch.store_response'), patch('main.log_interaction'):
+        resp = TestClient(app).post('/chat?model=llama-3.3-70b-versatile&ignore_cache=true', json={'prompt': 'q'})
+    reset_handlers()
+    assert resp.status_code == 200
+    assert called == ['llama-3.1-8b-instant']
+    assert resp.json()['fallback_used'] is True
+
+def _cooled_down(router, model):
+    for _ in range(routing.FAILURE_THRESHOLD):
+        router.record_failure(model, RuntimeError('down'))
+    router.health[model].open_until = time.time() - 1
+
+def test_release_only_frees_its_own_probe():
+    r = Router()
+    earlier = r.allow('m')
+    assert earlier is True
+    _cooled_down(r, 'm')
+    probe = r.allow('m')
+    assert probe and r.health['m'].state == HALF_OPEN
+    # A request admitted while closed ends without a verdict: the probe stays taken.
+    r.release('m', earlier)
+    assert not r.allow('m')
+    r.release('m', probe)
+    assert r.allow('m')
+
+def test_unused_fallback_keeps_its_probe(monkeypatch):
+    import asyncio
+    from utils.dispatch import generate_response
+    from utils.routing import router
+    monkeypatch.setenv('GROQ_API_KEY', 'test-key')
+    reset_handlers()
+    _cooled_down(router, 'llama-3.1-8b-instant')
+
+    async def fake_generate(self, prompt):
+        await asyncio.sleep(0.2 if self.model == 'llama-3.3-70b-versatile' else 0)
+        return f'from {self.model}', 3
+
+    with patch.object(GroqHandler, 'agenerate', fake_generate):
+        for _ in range(3):
+            asyncio.run(generate_response('q', 'llama-3.3-70b-versatile', 'groq', store=False))
+        # Only checked, never called: the half-open probe is still available.
+        probe = router.allow('llama-3.1-8b-instant')
+        assert probe
+        router.release('llama-3.1-8b-instant', probe)
+        # A half-open primary that loses a hedge gives its probe back.
+        _cooled_down(router, 'llama-3.3-70b-versatile')
+        result = asyncio.run(generate_response('q', 'llama-3.3-70b-versatile', 'groq', hedge_after=0.01, store=False))
+    reset_handlers()
+    assert result['model_used'] == 'llama-3.1-8b-instant'
+    assert router.health['llama-3.3-70b-versatile'].state == HALF_OPEN
+    assert router.allow('llama-3.3-70b-versatile')
+
+def test_shared_health_propagates_between_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(routing, 'HEALTH_SYNC_INTERVAL', 0)
+    path = str(tmp_path / 'shared.db')
+    a, b = Router(path), Router(path)
+    for _ in range(routing.FAILURE_THRESHOLD):
+        a.record_failure('m', RuntimeError('boom'))
+    assert not b.allow('m')
+    assert b.health['m'].state == OPEN
+    a.record_failure('other', RuntimeError('Rate limit reached'), retry_after=30)
+    assert not b.allow('other')
+    # A successful probe in one worker closes the circuit everywhere.
+    later = time.time() + routing.BASE_COOLDOWN + 1
+    assert a.allow('m', now=later)
+    a.record_success('m', 100)
+    assert b.allow('m')
+    assert b.health['m'].state == CLOSED
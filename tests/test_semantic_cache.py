@@ -0,0 +1,121 @@
+import time
+import numpy as np
+from utils.cache import ResponseCache
+from utils.semantic_cache import SemanticCache, SemanticIndex, embed
+
+def test_near_duplicates_are_similar():
+    a = embed('What is the capital of France?')
+    b = embed("what's the capital of france")
+    c = embed('Write a haiku about autumn leaves')
+    assert float(a @ b) > 0.9
+    assert float(a @ c) < 0.5
+
+def test_lookup_respects_threshold_and_model():
+    cache = SemanticCache()
+    cache.add('What is the capital of France?', 'm', 'Paris')
+    response, _, score = cache.lookup("what's the capital of france", 'm')
+    assert response == 'Paris' and score > 0.9
+    assert cache.lookup('what is the capital city of france', 'm', threshold=0.95)[0] is None
+    assert cache.lookup('What is the capital of Germany?', 'm')[0] is None
+    assert cache.lookup("what's the capital of france", 'other')[0] is None
+
+def test_near_miss_prompts_do_not_hit():
+    cache = SemanticCache()
+    cache.add('Explain quantum computing in simple terms for a 10 year old child', 'm', 'for ten year olds')
+    cache.add('Is it safe to eat raw eggs?', 'm', 'mostly')
+    near_misses = ['Explain quantum computing in simple terms for a 12 year old child', "Isn't it safe to eat raw eggs?"]
+    for prompt, (response, _, _) in zip(near_misses, cache.lookup_many(near_misses, 'm')):
+        assert response is None and cache.lookup(prompt, 'm')[0] is None
+    assert cache.lookup('explain quantum computing in simple terms for a 10 year old child', 'm')[0] == 'for ten year olds'
+
+def test_lookup_falls_through_to_next_neighbour():
+    cache = SemanticCache()
+    # The closest two fail the expiry and number checks; the third one serves.
+    cache.add('how many legs does a spider have', 'm', 'stale', expires_at=time.time() - 1)
+    cache.add('how many legs does a spider have 2', 'm', 'wrong number')
+    cache.add('how many legs do spiders have', 'm', 'eight')
+    response, _, score = cache.lookup('how many legs does a spider have', 'm', threshold=0.5)
+    assert response == 'eight' and score < 1.0
+    assert cache.lookup_many(['how many legs does a spider have'], 'm', threshold=0.5)[0][0] == 'eight'
+
+def test_compaction_leaves_scored_matrix_intact():
+    # Lookups score a view of the matrix outside the lock; compaction must not
+    # shift rows under them.
+    index = SemanticIndex(dim=8, max_entries=4)
+    for i in range(4):
+        vec = np.zeros(8, dtype=np.float32)
+        vec[i] = 1
+        index.add(vec, i)
+    view = index.vectors[:index.count]
+    before = view.copy()
+    index.add(np.ones(8, dtype=np.float32) / np.sqrt(8), 4)
+    assert np.array_equal(view, before)
+    assert [p for p, _ in index.nearest_many(np.eye(8, dtype=np.float32)[[3]], 2)[0]][0] == 3
+
+def test_lookup_many_matches_single_lookups():
+    cache = SemanticCache()
+    for i in range(50):
+        cache.add(f'question number {i} about topic {i * 7}', 'm', f'answer {i}')
+    queries = [f'question number {i} about topic {i * 7}' for i in (3, 17, 42)]
+    assert [r[0] for r in cache.lookup_many(queries, 'm')] == ['answer 3', 'answer 17', 'answer 42']
+
+def test_expired_entries_miss():
+    cache = SemanticCache()
+    cache.add('hello there', 'm', 'hi', expires_at=time.time() - 1)
+    assert cache.lookup('hello there', 'm')[0] is None
+
+def test_index_compacts_when_full():
+    index = SemanticIndex(dim=8, max_entries=4)
+    for i in range(6):
+        vec = np.zeros(8, dtype=np.float32)
+        vec[i % 8] = 1
+        index.add(vec, i)
+    assert index.count <= 4
+    assert index.payloads[-1] == 5
+
+def test_response_cache_semantic_tier(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache.db'), semantic=True)
+    cache.put('What is the capital of France?', 'm', 'Paris')
+    cache.flush(timeout=5)
+    assert cache.get("what's the capital of france", 'm') == (None, None)
+    assert cache.get_semantic("what's the capital of france", 'm')[0] == 'Paris'
+    assert cache.get_semantic("what's the capital of france", 'm', params={'temperature': 0})[0] is None
+
+def test_cleared_and_evicted_entries_leave_semantic_tier(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache.db'), max_bytes=400, semantic=True)
+    cache.put('What is the capital of France?', 'm', 'Paris')
+    cache.flush(timeout=5)
+    cache.put('Summarise the plot of Hamlet', 'm', 'x' * 400)
+    cache.flush(timeout=5)
+    assert cache.get_semantic("what's the capital of france", 'm')[0] is None
+    cache.put('What is the capital of France?', 'm', 'Paris')
+    cache.flush(timeout=5)
+    assert cache.get_semantic("what's the capital of france", 'm')[0] == 'Paris'
+    cache.clear()
+    assert cache.get_semantic("what's the capital of france", 'm')[0] is None
+
+def test_discarded_key_stops_matching():
+    cache = SemanticCache()
+    cache.add('hello there', 'm', 'hi', key='k1')
+    cache.add('hello there', 'm', 'hello', key='k1')
+    assert cache.lookup('hello there', 'm')[0] == 'hello'
+    cache.discard([('m', 'k1')])
+    assert cache.lookup('hello there', 'm')[0] is None
+
+def test_ann_index_used_when_available(monkeypatch):
+    import pytest
+    from utils import semantic_cache
+    if semantic_cache.faiss is None:
+        pytest.skip('faiss not installed')
+    monkeypatch.setattr(semantic_cache, 'ANN_MIN_ENTRIES', 64)
+    index = SemanticIndex(dim=32)
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((200, 32)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    for i, vec in enumerate(vectors):
+        index.add(vec, i)
+    deadline = time.time() + 10
+    while index._ann is None and time.time() < deadline:
+        time.sleep(0.01)
+    assert index._ann is not None and index._ann.ntotal == 200
+    assert index.search(vectors[150])[0] == 150
@@ -0,0 +1,91 @@
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+from main import app
+from models.gemini_handler import _contents
+from models.registry import reset_handlers
+from utils import sessions
+from utils.sessions import SessionStore, build_messages
+
+client = TestClient(app)
+
+@pytest.fixture
+def store(monkeypatch):
+    fresh = SessionStore(path='')
+    monkeypatch.setattr(sessions, 'store', fresh)
+    return fresh
+
+def test_build_messages_trims_oldest_turns():
+    history = [('user', 'one ' * 50), ('assistant', 'two ' * 50), ('user', 'three'), ('assistant', 'four')]
+    assert build_messages([], 'hi', 'llama-3.1-8b-instant') == 'hi'
+    full = build_messages(history, 'five', 'llama-3.1-8b-instant')
+    assert [m['content'] for m in full][-3:] == ['three', 'four', 'five']
+    assert len(full) == 5
+    trimmed = build_messages(history, 'five', 'llama-3.1-8b-instant', max_context_tokens=40)
+    assert trimmed == [{'role': 'user', 'content': 'three'}, {'role': 'assistant', 'content': 'four'}, {'role': 'user', 'content': 'five'}]
+    # A kept assistant turn never leads the conversation.
+    assert build_messages(history, 'five', 'llama-3.1-8b-instant', max_context_tokens=12)[0]['role'] == 'user'
+
+def test_gemini_contents():
+    messages = [{'role': 'user', 'content': 'a'}, {'role': 'assistant', 'content': 'b'}, {'role': 'user', 'content': 'c'}]
+    assert [c['role'] for c in _contents(messages)] == ['user', 'model', 'user']
+    assert _contents('plain') == 'plain'
+
+def test_lru_eviction_and_prefix_hash():
+    store = SessionStore(path='', max_sessions=2)
+    first = store.append('a', 'hi', 'hello')
+    store.append('b', 'hi', 'hello')
+    assert store.history('b')[1] == first
+    store.append('c', 'x', 'y')
+    assert 'a' not in store.sessions
+    assert store.history('a') == ([], '')
+
+def test_sqlite_store_is_shared(tmp_path):
+    path = str(tmp_path / 'sessions.db')
+    first, second = SessionStore(path), SessionStore(path)
+    first.append('s', 'hi', 'hello')
+    second.history('s')
+    second.append('s', 'more', 'sure')
+    turns, prefix = first.history('s')
+    assert [content for _, content in turns] == ['hi', 'hello', 'more', 'sure']
+    assert prefix == second.history('s')[1]
+    assert first.delete('s')
+    assert SessionStore(path).history('s') == ([], '')
+
+@pytest.fixture
+def groq(monkeypatch):
+    monkeypatch.setenv('GROQ_API_KEY', 'test-key')
+    reset_handlers()
+    sent = []
+
+    async def agenerate(self, prompt):
+        sent.append(prompt)
+        return f'answer {len(sent)}', 10
+    with patch('models.groq_handler.GroqHandler.agenerate', agenerate):
+        yield sent
+    reset_handlers()
+
+def test_chat_session_sends_history_and_shares_cache(store, groq):
+    url = '/chat?model=llama-3.1-8b-instant'
+    first = client.post(url, json={'prompt': 'session hello', 'session_id': 's1'}).json()
+    assert first['session_id'] == 's1' and first['context_turns'] == 0
+    second = client.post(url, json={'prompt': 'and then?', 'session_id': 's1'}).json()
+    assert second['context_turns'] == 2
+    assert groq[-1] == [{'role': 'user', 'content': 'session hello'}, {'role': 'assistant', 'content': first['response_text']},
+                        {'role': 'user', 'content': 'and then?'}]
+    # Same conversation in another session: both turns come from the cache.
+    client.post(url, json={'prompt': 'session hello', 'session_id': 's2'})
+    replay = client.post(url, json={'prompt': 'and then?', 'session_id': 's2'}).json()
+    assert replay['from_cache'] is True and replay['response_text'] == second['response_text']
+    assert len(groq) == 2
+    turns = client.get('/sessions/s2').json()['turns']
+    assert [t['role'] for t in turns] == ['user', 'assistant', 'user', 'assistant']
+    # Without a session the same prompt is a different cache entry.
+    client.post(url, json={'prompt': 'and then?'})
+    assert len(groq) == 3
+    assert client.delete('/sessions/s2').status_code == 200
+    assert client.delete('/sessions/s2').status_code == 404
+
+def test_invalid_session_id(store):
+    resp = client.post('/chat?model=llama-3.1-8b-instant', json={'prompt': 'x', 'session_id': 42})
+    assert resp.status_code == 400
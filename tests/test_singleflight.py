@@ -0,0 +1,81 @@
+import asyncio
+import httpx
+import pytest
+from unittest.mock import patch
+from models.groq_handler import GroqHandler
+from models.registry import reset_handlers
+from utils.singleflight import SingleFlight
+
+def test_concurrent_calls_share_one_execution():
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return 'done'
+
+    async def run():
+        flight = SingleFlight()
+        results = await asyncio.gather(*[flight.do('k', work) for _ in range(10)])
+        assert flight.in_flight() == 0
+        return results
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert [r for r, _ in results] == ['done'] * 10
+    assert sum(shared for _, shared in results) == 9
+
+def test_errors_reach_every_caller():
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError('upstream down')
+
+    async def run():
+        flight = SingleFlight()
+        return await asyncio.gather(*[flight.do('k', fail) for _ in range(3)], return_exceptions=True)
+
+    assert all(isinstance(r, RuntimeError) for r in asyncio.run(run()))
+
+def test_cancelled_caller_does_not_cancel_others():
+    async def work():
+        await asyncio.sleep(0.05)
+        return 'ok'
+
+    async def run():
+        flight = SingleFlight()
+        first = asyncio.ensure_future(flight.do('k', work))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(flight.do('k', work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run()) == ('ok', True)
+
+def test_chat_coalesces_identical_prompts(monkeypatch):
+    from main import app
+    monkeypatch.setenv('GROQ_API_KEY', 'test-key')
+    reset_handlers()
+    calls = []
+
+    async def slow_generate(self, prompt):
+        calls.append(prompt)
+        await asyncio.sleep(0.1)
+        return 'shared answer', 7
+
+    async def fire():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return await asyncio.gather(*[
+                client.post('/chat?model=llama-3.1-8b-instant&ignore_cache=true', json={'prompt': 'burst prompt'})
+                for _ in range(5)
+            ])
+
+    with patch.object(GroqHandler, 'agenerate', slow_generate), \
+            patch('utils.dispatch.store_response') as store, patch('main.log_interaction'):
+        responses = asyncio.run(fire())
+    reset_handlers()
+    assert len(calls) == 1
+    assert store.call_count == 1
+    assert [r.json()['response_text'] for r in responses] == ['shared answer'] * 5
+    assert sum(r.json()['coalesced'] for r in responses) == 4
@@ -0,0 +1,74 @@
+import sys
+import asyncio
+import subprocess
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from main import app
+from models import http_client
+from models.registry import reset_handlers, _handlers
+from utils import startup
+from utils.templates import TemplateRegistry
+
+client = TestClient(app)
+
+@pytest.fixture
+def state(monkeypatch):
+    fresh = startup.Readiness()
+    monkeypatch.setattr(startup, 'state', fresh)
+    monkeypatch.delenv('GROQ_API_KEY', raising=False)
+    monkeypatch.delenv('GEMINI_API_KEY', raising=False)
+    reset_handlers()
+    yield fresh
+    reset_handlers()
+    http_client._async_clients.clear()
+
+def test_import_is_lazy():
+    # Importing the app neither loads a provider SDK or requests nor opens cache.db.
+    code = 'import sys, main; print("google.generativeai" in sys.modules, "requests" in sys.modules, main.response_cache.write_engine is None)'
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert out.stdout.split() == ['False', 'False', 'True']
+
+def test_ready_after_prewarm(state):
+    assert client.get('/healthz').json() == {'status': 'ok'}
+    assert client.get('/readyz').status_code == 503
+    asyncio.run(startup.prewarm())
+    resp = client.get('/readyz')
+    assert resp.status_code == 200
+    assert set(resp.json()['checks']) == {'cache', 'tokenizers', 'templates'}
+
+def test_prewarm_builds_handlers_and_connects(state, monkeypatch):
+    monkeypatch.setenv('GROQ_API_KEY', 'test-key')
+    seen = []
+    http_client._async_clients['groq'] = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: seen.append(request.method) or httpx.Response(405)))
+    snapshot = asyncio.run(startup.prewarm())
+    assert snapshot['checks']['provider:groq']['ok'] and seen == ['HEAD']
+    assert snapshot['checks']['provider:groq']['connected'] is True
+    assert 'llama-3.1-8b-instant' in _handlers and 'gemini-2.5-flash' not in _handlers
+
+def test_provider_failures_do_not_block_readiness(state, monkeypatch):
+    monkeypatch.setenv('GROQ_API_KEY', 'test-key')
+
+    def refuse(request):
+        raise httpx.ConnectError('refused')
+    http_client._async_clients['groq'] = httpx.AsyncClient(transport=httpx.MockTransport(refuse))
+    snapshot = asyncio.run(startup.prewarm())
+    assert snapshot['status'] == 'ready'
+    assert 'ConnectError' in snapshot['checks']['provider:groq']['error']
+
+def test_broken_templates_are_reported(tmp_path):
+    path = tmp_path / 'templates.json'
+    path.write_text('[{"id": "t", "prompt": "hi {{name}}"}]')
+    registry = TemplateRegistry(str(path))
+    assert registry.error is None
+    path.write_text('[{"id": ')
+    registry.reload()
+    assert 'JSONDecodeError' in registry.error and registry.get('t') is not None
+
+def test_gemini_warmup_reports_no_connection(state, monkeypatch):
+    # The Gemini SDK connects on its first call; the check must not claim otherwise.
+    pytest.importorskip('google.generativeai')
+    monkeypatch.setenv('GEMINI_API_KEY', 'test-key')
+    snapshot = asyncio.run(startup.prewarm())
+    check = snapshot['checks']['provider:gemini']
+    assert check['ok'] and check['connected'] is False and check['handlers'] >= 1
@@ -0,0 +1,39 @@
+import random
+from utils.stats import LatencySketch, StatsAggregator
+
+def test_sketch_quantiles_within_relative_accuracy():
+    values = [random.uniform(50, 5000) for _ in range(10000)]
+    sketch = LatencySketch(relative_accuracy=0.01)
+    for v in values:
+        sketch.add(v)
+    values.sort()
+    for q in (0.5, 0.95, 0.99):
+        exact = values[int(q * (len(values) - 1))]
+        assert abs(sketch.quantile(q) - exact) / exact < 0.02
+
+def test_sketch_merge_matches_single_sketch():
+    a, b, both = LatencySketch(), LatencySketch(), LatencySketch()
+    for i in range(1, 1001):
+        (a if i % 2 else b).add(i)
+        both.add(i)
+    a.merge(b)
+    assert a.count == both.count
+    assert a.quantile(0.99) == both.quantile(0.99)
+
+def test_aggregator_rebuild_then_incremental():
+    agg = StatsAggregator()
+    agg.record_interaction({'model': 'm', 'latency_ms': 100})  # ignored until loaded
+    agg.rebuild(
+        [{'model': 'm', 'latency_ms': 100}, {'model': 'm', 'latency_ms': 0, 'from_cache': True}],
+        [{'model': 'm', 'rating': 4}, {'model': 'only-rated', 'rating': 1}]
+    )
+    agg.record_interaction({'model': 'm', 'latency_ms': 300, 'fallback_used': True})
+    agg.record_rating({'model': 'm', 'rating': 2})
+    stats = agg.snapshot()
+    assert stats['model_usage'] == {'m': 3}
+    assert stats['total_prompts'] == 3
+    assert stats['total_cache_hits'] == 1
+    assert stats['total_fallbacks'] == 1
+    assert stats['avg_latency']['m'] == 0.2
+    assert stats['avg_rating']['m'] == 3
+    assert 0.099 < stats['latency_percentiles']['m']['p50'] < 0.101
@@ -0,0 +1,100 @@
+import asyncio
+import json
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+from models import http_client
+from models.groq_handler import GroqHandler
+from models.registry import reset_handlers
+from models.usage import TokenUsage
+
+@pytest.fixture
+def groq_env(monkeypatch):
+    monkeypatch.setenv('GROQ_API_KEY', 'test-key')
+    reset_handlers()
+    yield
+    reset_handlers()
+    http_client._async_clients.clear()
+
+def _events(body):
+    events = []
+    for block in body.strip().split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.splitlines())
+        events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+def test_groq_astream_parses_sse(groq_env):
+    chunks = [
+        {'choices': [{'delta': {'role': 'assistant'}}]},
+        {'choices': [{'delta': {'content': 'Hel'}}]},
+        {'choices': [{'delta': {'content': 'lo'}}]},
+        {'choices': [], 'x_groq': {'usage': {'total_tokens': 9}}},
+    ]
+    body = ''.join(f'data: {json.dumps(c)}\n\n' for c in chunks) + 'data: [DONE]\n\n'
+
+    def handler(request):
+        assert json.loads(request.content)['stream'] is True
+        return httpx.Response(200, text=body, headers={'content-type': 'text/event-stream'})
+    http_client._async_clients['groq'] = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    async def collect():
+        return [c async for c in GroqHandler(model_override='llama-3.1-8b-instant').astream('hi')]
+    assert asyncio.run(collect()) == [('Hel', None), ('lo', None), ('', TokenUsage(total_tokens=9))]
+
+def test_chat_stream_relays_tokens_and_logs(groq_env):
+    from main import app
+
+    async def fake_stream(self, prompt):
+        for piece in ['The ', 'answer']:
+            yield piece, None
+        yield '', 5
+
+    with patch.object(GroqHandler, 'astream', fake_stream), \
+            patch('main.store_response') as store, patch('main.log_interaction') as log:
+        resp = TestClient(app).post('/chat?model=llama-3.1-8b-instant&ignore_cache=true&stream=true', json={'prompt': 'q'})
+    assert resp.headers['content-type'].startswith('text/event-stream')
+    events = _events(resp.text)
+    assert [e for e, _ in events] == ['token', 'token', 'done']
+    done = events[-1][1]
+    assert done['token_count'] == 5 and done['model_used'] == 'llama-3.1-8b-instant'
+    assert 'ttft_ms' in done and 'tokens_per_sec' in done
+    store.assert_called_once()
+    assert store.call_args[0][2] == 'The answer'
+    assert 'ttft_ms' in log.call_args.kwargs
+
+def test_chat_stream_falls_back_before_first_token(groq_env):
+    from main import app
+
+    async def fake_stream(self, prompt):
+        if self.model != 'llama-3.1-8b-instant':
+            raise RuntimeError('primary down')
+        yield 'fallback text', None
+
+    with patch.object(GroqHandler, 'astream', fake_stream), \
+            patch('main.store_response'), patch('main.log_interaction'):
+        resp = TestClient(app).post('/chat/stream?model=llama-3.3-70b-versatile&ignore_cache=true', json={'prompt': 'q'})
+    events = _events(resp.text)
+    assert events[0] == ('token', {'text': 'fallback text'})
+    assert events[-1][1]['fallback_used'] is True
+
+def test_chat_stream_retries_same_model_before_first_token(groq_env, monkeypatch):
+    from main import app
+    from models.errors import TransientError
+    from utils import retry
+    monkeypatch.setattr(retry, 'RETRY_BASE_DELAY', 0.001)
+    calls = []
+
+    async def fake_stream(self, prompt):
+        calls.append(self.model)
+        if len(calls) < 3:
+            raise TransientError('503')
+        yield 'primary text', None
+
+    with patch.object(GroqHandler, 'astream', fake_stream), \
+            patch('main.store_response'), patch('main.log_interaction') as log:
+        resp = TestClient(app).post('/chat/stream?model=llama-3.3-70b-versatile&ignore_cache=true', json={'prompt': 'q'})
+    done = _events(resp.text)[-1][1]
+    assert calls == ['llama-3.3-70b-versatile'] * 3
+    assert done['model_used'] == 'llama-3.3-70b-versatile' and done['fallback_used'] is False
+    assert done['retries'] == 2 and log.call_args.kwargs['retries'] == 2
@@ -0,0 +1,53 @@
+import json
+import os
+import pytest
+from fastapi.testclient import TestClient
+from utils.templates import TemplateRegistry, TemplateError
+
+TEMPLATES = [
+    {'id': 'story', 'title': 'Story', 'prompt': 'A story about a {{ character }} and a {{object}}, {{character}}!', 'tags': ['Creative'], 'category': 'writing'},
+    {'id': 'eli5', 'title': 'ELI5', 'prompt': "Explain this like I'm 5: {{concept}}", 'tags': ['explain'], 'category': 'education'}
+]
+
+@pytest.fixture
+def registry(tmp_path):
+    path = tmp_path / 'templates.json'
+    path.write_text(json.dumps(TEMPLATES), encoding='utf-8')
+    return TemplateRegistry(str(path), reload_interval=0)
+
+def test_render_plan_and_validation(registry):
+    story = registry.get('story')
+    assert story.vars == ['character', 'object']
+    assert story.render({'character': 'cat', 'object': 'key'}) == 'A story about a cat and a key, cat!'
+    with pytest.raises(TemplateError, match='object'):
+        story.render({'character': 'cat'})
+
+def test_indexes(registry):
+    assert [t.id for t in registry.find(category='Education')] == ['eli5']
+    assert [t.id for t in registry.find(tag='creative')] == ['story']
+    assert registry.find(category='writing', tag='explain') == []
+    assert len(registry.find()) == 2
+
+def test_hot_reload_keeps_last_good_file(registry):
+    path = registry.path
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(TEMPLATES + [{'id': 'new', 'prompt': 'Hi {{name}}'}], f)
+    os.utime(path, ns=(1, 10 ** 18))
+    assert registry.get('new').render({'name': 'Ann'}) == 'Hi Ann'
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('[{"id": ')
+    os.utime(path, ns=(1, 2 * 10 ** 18))
+    assert registry.get('new') is not None
+
+def test_chat_renders_templates_and_lists_them(monkeypatch, registry):
+    import main
+    from utils import dispatch
+    monkeypatch.setattr(dispatch, 'templates', registry)
+    monkeypatch.setattr(main, 'templates', registry)
+    assert dispatch.resolve_prompt({'template': 'eli5', 'prompt': 'gravity'}) == "Explain this like I'm 5: gravity"
+    client = TestClient(main.app)
+    resp = client.post('/chat?model=no-such-model', json={'template_id': 'story', 'template_vars': {'character': 'cat'}})
+    assert resp.status_code == 400 and 'object' in resp.json()['detail']
+    listed = client.get('/templates?category=education').json()
+    assert [t['id'] for t in listed] == ['eli5'] and listed[0]['vars'] == ['concept']
+    assert client.get('/templates/missing').status_code == 404
@@ -0,0 +1,49 @@
+import pytest
+from utils import tokens
+
+class FakeEncoding:
+    def __init__(self):
+        self.calls = 0
+        self.batch_threads = None
+
+    def encode_ordinary(self, text):
+        self.calls += 1
+        return text.split()
+
+    def encode_ordinary_batch(self, texts, num_threads=1):
+        self.batch_threads = num_threads
+        return [t.split() for t in texts]
+
+@pytest.fixture
+def fake_encoding(monkeypatch):
+    enc = FakeEncoding()
+    monkeypatch.setattr(tokens, 'tiktoken', object())
+    monkeypatch.setattr(tokens, '_encodings', {'cl100k_base': enc})
+    tokens._count_memo.cache_clear()
+    yield enc
+    tokens._count_memo.cache_clear()
+
+def test_heuristic_always_returns_int(monkeypatch):
+    monkeypatch.setattr(tokens, 'tiktoken', None)
+    tokens._count_memo.cache_clear()
+    count = tokens.count_tokens('x' * 10, model='gemini-2.5-flash')
+    assert count == 3 and isinstance(count, int)
+    assert tokens.count_tokens('x' * 10, model='llama-3.1-8b-instant') == 3
+    assert tokens.count_tokens('', model='gemini-2.5-flash') == 0
+    tokens._count_memo.cache_clear()
+
+def test_short_texts_are_memoized(fake_encoding):
+    for _ in range(3):
+        assert tokens.count_tokens('summarize this please', model='llama-3.1-8b-instant') == 3
+    assert fake_encoding.calls == 1
+    long_text = 'word ' * 5000
+    tokens.count_tokens(long_text)
+    tokens.count_tokens(long_text)
+    assert fake_encoding.calls == 3
+
+def test_count_tokens_many_batches_large_inputs(fake_encoding):
+    small = tokens.count_tokens_many(['a b', 'c'])
+    assert small == [2, 1] and fake_encoding.batch_threads is None
+    texts = [f'text number {i}' for i in range(tokens.BATCH_THREAD_THRESHOLD)]
+    assert tokens.count_tokens_many(texts, model='gemini-2.0-flash') == [3] * len(texts)
+    assert fake_encoding.batch_threads == tokens.BATCH_THREADS
@@ -0,0 +1,132 @@
+import json
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+from models.groq_handler import GroqHandler
+from models.registry import reset_handlers
+from utils import tracing
+from utils.logger import flush_logs
+
+@pytest.fixture
+def groq_env(monkeypatch):
+    monkeypatch.setenv('GROQ_API_KEY', 'test-key')
+    reset_handlers()
+    yield
+    reset_handlers()
+
+def _post(query, failures=(), headers=None):
+    from main import app
+
+    async def fake_generate(self, prompt):
+        if self.model in failures:
+            raise RuntimeError(f'{self.model} failed')
+        return f'answer from {self.model}', 4
+
+    with patch.object(GroqHandler, 'agenerate', fake_generate), \
+            patch('utils.dispatch.store_response'), patch('main.log_interaction'):
+        return TestClient(app).post(f'/chat?model=llama-3.3-70b-versatile&ignore_cache=true&{query}',
+                                    json={'prompt': 'trace me'}, headers=headers or {})
+
+def test_timings_only_when_requested(groq_env):
+    resp = _post('')
+    assert 'timings' not in resp.json()
+    assert 'server-timing' not in resp.headers
+
+def test_timings_cover_failed_fallback_attempts(groq_env):
+    resp = _post('timings=true', failures=('llama-3.3-70b-versatile',))
+    data = resp.json()
+    assert data['model_used'] == 'llama-3.1-8b-instant'
+    timings = data['timings']
+    attempts = timings['attempts']
+    assert [a['model'] for a in attempts] == ['llama-3.3-70b-versatile', 'llama-3.1-8b-instant']
+    assert attempts[0]['ok'] is False and 'failed' in attempts[0]['error']
+    assert attempts[1]['ok'] is True
+    for stage in ('parse_ms', 'dispatch_ms', 'upstream_ms', 'log_ms'):
+        assert timings[stage] <= timings['total_ms']
+    header = resp.headers['server-timing']
+    assert 'upstream;dur=' in header and 'total;dur=' in header
+
+def test_otlp_export_joins_incoming_trace(groq_env, tmp_path, monkeypatch):
+    path = tmp_path / 'traces.jsonl'
+    monkeypatch.setattr(tracing, 'TRACE_FILE', str(path))
+    trace_id = '4bf92f3577b34da6a3ce929d0e0e4736'
+    resp = _post('', headers={'traceparent': f'00-{trace_id}-00f067aa0ba902b7-01'})
+    assert resp.status_code == 200
+    flush_logs()
+    record = json.loads(path.read_text(encoding='utf-8').splitlines()[-1])
+    spans = record['resourceSpans'][0]['scopeSpans'][0]['spans']
+    root = spans[0]
+    assert root['name'] == 'POST /chat' and root['kind'] == 2
+    assert root['parentSpanId'] == '00f067aa0ba902b7'
+    assert {s['traceId'] for s in spans} == {trace_id}
+    by_id = {s['spanId']: s for s in spans}
+    upstream = next(s for s in spans if s['name'] == 'upstream')
+    assert by_id[upstream['parentSpanId']]['name'] == 'dispatch'
+    assert {'key': 'llm.model', 'value': {'stringValue': 'llama-3.3-70b-versatile'}} in upstream['attributes']
+
+def test_span_outside_trace_is_noop():
+    with tracing.span('anything') as s:
+        assert s is None
+
+def test_stream_reports_timings_on_done(groq_env):
+    from main import app
+
+    async def fake_stream(self, prompt):
+        if self.model == 'llama-3.3-70b-versatile':
+            raise RuntimeError('down')
+        yield 'streamed', None
+        yield '', 3
+
+    with patch.object(GroqHandler, 'astream', fake_stream), \
+            patch('main.store_response'), patch('main.log_interaction'):
+        resp = TestClient(app).post('/chat/stream?model=llama-3.3-70b-versatile&ignore_cache=true&timings=true',
+                                    json={'prompt': 'trace me'})
+    done = json.loads(resp.text.strip().split('\n\n')[-1].split('data: ', 1)[1])
+    attempts = done['timings']['attempts']
+    assert [a['model'] for a in attempts] == ['llama-3.3-70b-versatile', 'llama-3.1-8b-instant']
+    assert attempts[0]['ok'] is False and attempts[1]['ok'] is True
+    assert tracing.current_trace() is None
+
+def test_batch_exports_a_trace(groq_env, tmp_path, monkeypatch):
+    from main import app
+    path = tmp_path / 'traces.jsonl'
+    monkeypatch.setattr(tracing, 'TRACE_FILE', str(path))
+
+    async def fake_generate(self, prompt):
+        return f'answer to {prompt}', 4
+
+    with patch.object(GroqHandler, 'agenerate', fake_generate), \
+            patch('main.store_responses'), patch('main.log_interactions'):
+        resp = TestClient(app).post('/chat/batch?model=llama-3.1-8b-instant&ignore_cache=true',
+                                    json={'items': [{'prompt': 'a'}, {'prompt': 'b'}]})
+    assert resp.status_code == 200
+    flush_logs()
+    record = json.loads(path.read_text(encoding='utf-8').splitlines()[-1])
+    spans = record['resourceSpans'][0]['scopeSpans'][0]['spans']
+    assert spans[0]['name'] == 'POST /chat/batch'
+    by_id = {s['spanId']: s for s in spans}
+    upstream = [s for s in spans if s['name'] == 'upstream']
+    assert len(upstream) == 2
+    assert {by_id[s['parentSpanId']]['name'] for s in upstream} == {'dispatch'}
+
+def test_coalesced_follower_records_its_wait():
+    import asyncio
+    from utils.singleflight import SingleFlight
+    flight = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.01)
+        return 'done'
+
+    async def caller():
+        trace = tracing.start_trace('caller')
+        result = await flight.do('key', work)
+        tracing.end_trace(trace)
+        return trace, result
+
+    async def main():
+        return await asyncio.gather(caller(), caller())
+    (leader, _), (follower, shared) = asyncio.run(main())
+    assert shared == ('done', True)
+    assert [s.name for s in leader.spans] == []
+    assert [s.name for s in follower.spans] == ['coalesced']
@@ -0,0 +1,225 @@
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+from datetime import datetime
+from models.registry import provider_for
+from utils.logger import LOG_DIR
+
+# USD per million tokens (input, output), from the providers' published price
+# lists. Override or extend with LLM_ROUTER_PRICES="llama-3.1-8b-instant=0.05/0.08,...".
+DEFAULT_PRICES = {
+    'llama-3.1-8b-instant': (0.05, 0.08),
+    'llama-3.3-70b-versatile': (0.59, 0.79),
+    'deepseek-r1-distill-llama-70b': (0.75, 0.99),
+    'meta-llama/llama-4-maverick-17b-128e-instruct': (0.20, 0.60),
+    'meta-llama/llama-4-scout-17b-16e-instruct': (0.11, 0.34),
+    'mistral-saba-24b': (0.79, 0.79),
+    'moonshotai/kimi-k2-instruct': (1.00, 3.00),
+    'gemini-2.5-pro': (1.25, 10.00),
+    'gemini-2.5-flash': (0.30, 2.50),
+    'gemini-2.5-flash-lite-preview-06-17': (0.10, 0.40),
+    'gemini-2.0-flash': (0.10, 0.40),
+    'gemini-2.0-flash-lite': (0.075, 0.30),
+}
+
+def _parse_prices(value):
+    prices = {}
+    for item in filter(None, (v.strip() for v in value.split(','))):
+        name, _, spec = item.rpartition('=')
+        if not name:
+            continue
+        fields = [float(f) for f in spec.split('/')]
+        prices[name] = (fields[0], fields[1] if len(fields) > 1 else fields[0])
+    return prices
+
+def _parse_budgets(value):
+    # "total=50,groq=20,gemini-2.5-pro=10": USD per UTC day for everything, a
+    # provider (i.e. its API key) or a single model.
+    budgets = {}
+    for item in filter(None, (v.strip() for v in value.split(','))):
+        name, _, limit = item.rpartition('=')
+        if name:
+            budgets[name] = float(limit)
+    return budgets
+
+PRICES = {**DEFAULT_PRICES, **_parse_prices(os.getenv('LLM_ROUTER_PRICES', ''))}
+BUDGETS = _parse_budgets(os.getenv('LLM_ROUTER_DAILY_BUDGETS', ''))
+# Past this fraction of a budget the router prefers cheaper models.
+BUDGET_SOFT_LIMIT = float(os.getenv('LLM_ROUTER_BUDGET_SOFT_LIMIT', '0.8'))
+LEDGER_DB = os.getenv('LLM_ROUTER_LEDGER_DB', os.path.join(LOG_DIR, 'ledger.db'))
+FLUSH_INTERVAL = float(os.getenv('LLM_ROUTER_LEDGER_FLUSH_SECONDS', '5'))
+
+def price(model):
+    return PRICES.get(model)
+
+def blended_price(model):
+    # One number to sort models by; unpriced models sort last.
+    rates = PRICES.get(model)
+    return rates[0] + rates[1] if rates else float('inf')
+
+def cost(model, prompt_tokens, completion_tokens):
+    rates = PRICES.get(model)
+    if rates is None:
+        return 0.0
+    return (prompt_tokens * rates[0] + completion_tokens * rates[1]) / 1_000_000
+
+def key_id(api_key):
+    # Same short hash the rate limiter uses; raw keys never reach the ledger.
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:8] if api_key else 'nokey'
+
+def _today():
+    return datetime.utcnow().strftime('%Y-%m-%d')
+
+FIELDS = ('requests', 'prompt_tokens', 'completion_tokens', 'cost_usd')
+
+class Ledger:
+    # Per-(day, key, model) token and spend counters. record() only touches
+    # in-memory dicts; a background thread adds the pending deltas into SQLite
+    # and reads back the day's totals, which include other workers' spend.
+    # Budget checks are a few dict lookups against those totals.
+    def __init__(self, path=LEDGER_DB, budgets=None):
+        self.path = path
+        self.budgets = BUDGETS if budgets is None else budgets
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._thread = None
+        self.day = _today()
+        self.flushed = {}
+        self.pending = {}
+        # Spend per budget scope for `day`: 'total', provider and model.
+        self.spent = {}
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS spend (day TEXT, key_id TEXT, model TEXT, requests INTEGER, prompt_tokens INTEGER, '
+                         'completion_tokens INTEGER, cost_usd REAL, PRIMARY KEY (day, key_id, model))')
+            self._local.conn = conn
+        return conn
+
+    def record(self, model, api_key, prompt_tokens, completion_tokens):
+        amount = cost(model, prompt_tokens, completion_tokens)
+        day = _today()
+        key = (day, key_id(api_key), model)
+        with self._lock:
+            if day != self.day:
+                self._roll(day)
+            row = self.pending.setdefault(key, [0, 0, 0, 0.0])
+            row[0] += 1
+            row[1] += prompt_tokens
+            row[2] += completion_tokens
+            row[3] += amount
+            self._add_spent(model, amount)
+        return amount
+
+    def _roll(self, day):
+        # New UTC day: budgets start over. Yesterday's pending deltas still flush.
+        self.day = day
+        self.spent = {}
+        self.flushed = {k: v for k, v in self.flushed.items() if k[0] == day}
+
+    def pressure(self, model):
+        # Highest spent/limit ratio among the budgets covering `model`.
+        if not self.budgets:
+            return 0.0
+        ratio = 0.0
+        for scope in ('total', provider_for(model), model):
+            limit = self.budgets.get(scope)
+            if limit is not None:
+                ratio = max(ratio, self.spent.get(scope, 0.0) / limit if limit > 0 else 1.0)
+        return ratio
+
+    def allow(self, model):
+        return self.pressure(model) < 1.0
+
+    def near_budget(self, model):
+        return self.pressure(model) >= BUDGET_SOFT_LIMIT
+
+    def flush(self):
+        with self._lock:
+            pending, self.pending = self.pending, {}
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(
+                'INSERT INTO spend (day, key_id, model, requests, prompt_tokens, completion_tokens, cost_usd) VALUES (?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (day, key_id, model) DO UPDATE SET requests = requests + excluded.requests, '
+                'prompt_tokens = prompt_tokens + excluded.prompt_tokens, completion_tokens = completion_tokens + excluded.completion_tokens, '
+                'cost_usd = cost_usd + excluded.cost_usd',
+                [key + tuple(row) for key, row in pending.items()])
+            rows = conn.execute('SELECT day, key_id, model, requests, prompt_tokens, completion_tokens, cost_usd FROM spend WHERE day = ?',
+                                (self.day,)).fetchall()
+        except Exception:
+            conn.execute('ROLLBACK')
+            with self._lock:
+                # Keep the deltas for the next attempt.
+                for key, row in pending.items():
+                    current = self.pending.setdefault(key, [0, 0, 0, 0.0])
+                    for i, value in enumerate(row):
+                        current[i] += value
+            raise
+        conn.execute('COMMIT')
+        with self._lock:
+            self.flushed = {tuple(r[:3]): list(r[3:]) for r in rows if r[0] == self.day}
+            self.spent = {}
+            for (day, _, model), row in self.flushed.items():
+                self._add_spent(model, row[3])
+            for (day, _, model), row in self.pending.items():
+                if day == self.day:
+                    self._add_spent(model, row[3])
+
+    def _add_spent(self, model, amount):
+        for scope in ('total', provider_for(model), model):
+            self.spent[scope] = self.spent.get(scope, 0.0) + amount
+
+    def start(self):
+        if self._thread is not None:
+            return
+        try:
+            self.flush()
+        except sqlite3.Error:
+            pass
+        self._thread = threading.Thread(target=self._run, name='ledger-flush', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except sqlite3.Error:
+                pass
+
+    def snapshot(self):
+        # Today's totals (flushed from every worker plus this one's pending)
+        # by model and by key, and each budget's standing.
+        with self._lock:
+            rows = {k: list(v) for k, v in self.flushed.items()}
+            for key, row in self.pending.items():
+                if key[0] == self.day:
+                    current = rows.setdefault(key, [0, 0, 0, 0.0])
+                    for i, value in enumerate(row):
+                        current[i] += value
+            spent = dict(self.spent)
+        total = dict.fromkeys(FIELDS, 0)
+        by_model, by_key = {}, {}
+        for (_, key, model), row in rows.items():
+            for bucket in (total, by_model.setdefault(model, dict.fromkeys(FIELDS, 0)), by_key.setdefault(key, dict.fromkeys(FIELDS, 0))):
+                for name, value in zip(FIELDS, row):
+                    bucket[name] += value
+        for bucket in [total, *by_model.values(), *by_key.values()]:
+            bucket['cost_usd'] = round(bucket['cost_usd'], 6)
+        budgets = {
+            scope: {'limit_usd': limit, 'spent_usd': round(spent.get(scope, 0.0), 6),
+                    'remaining_usd': round(max(0.0, limit - spent.get(scope, 0.0)), 6)}
+            for scope, limit in self.budgets.items()
+        }
+        return {'day': self.day, **total, 'by_model': by_model, 'by_key': by_key, 'budgets': budgets}
+
+ledger = Ledger()
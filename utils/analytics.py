@@ -0,0 +1,331 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from datetime import datetime, timezone
+import numpy as np
+from utils import logger
+
+# Interaction and rating events are compacted from the JSON-lines logs into
+# this indexed SQLite table (one narrow row per event, no prompt/response
+# text), so analytics queries never re-read the logs.
+ANALYTICS_DB = os.getenv('LLM_ROUTER_ANALYTICS_DB', os.path.join(logger.LOG_DIR, 'analytics.db'))
+COMPACT_INTERVAL = float(os.getenv('LLM_ROUTER_ANALYTICS_COMPACT_SECONDS', '60'))
+# Queries compact first when the last run is older than this.
+QUERY_STALENESS = float(os.getenv('LLM_ROUTER_ANALYTICS_STALENESS_SECONDS', '5'))
+INSERT_BATCH = 5000
+
+GROUP_COLUMNS = {
+    'model': 'model',
+    'template': 'template',
+    'cache': 'cache',
+    'fallback': 'fallback',
+    'day': "strftime('%Y-%m-%d', ts, 'unixepoch')",
+    'hour': "strftime('%Y-%m-%dT%H:00', ts, 'unixepoch')",
+}
+CACHE_VALUES = ('exact', 'semantic', 'miss')
+PERCENTILES = (50, 95, 99)
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS interactions (ts REAL, model TEXT, template TEXT, cache TEXT, fallback INTEGER, '
+    'latency_ms REAL, token_count INTEGER, stream INTEGER, batch INTEGER, prompt_id TEXT, rating REAL)',
+    'CREATE INDEX IF NOT EXISTS interactions_ts ON interactions (ts)',
+    'CREATE INDEX IF NOT EXISTS interactions_model_ts ON interactions (model, ts)',
+    'CREATE INDEX IF NOT EXISTS interactions_template_ts ON interactions (template, ts)',
+    'CREATE INDEX IF NOT EXISTS interactions_prompt_id ON interactions (prompt_id)',
+    'CREATE TABLE IF NOT EXISTS ratings (prompt_id TEXT, ts REAL, model TEXT, rating REAL)',
+    'CREATE INDEX IF NOT EXISTS ratings_prompt_id ON ratings (prompt_id, ts)',
+    # Read position per log file, keyed by inode so a rotated (renamed)
+    # segment continues where its active file left off.
+    'CREATE TABLE IF NOT EXISTS log_offsets (dev INTEGER, inode INTEGER, path TEXT, offset INTEGER, PRIMARY KEY (dev, inode))',
+]
+
+class AnalyticsError(ValueError):
+    pass
+
+def _epoch(value):
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        parsed = datetime.fromisoformat(str(value))
+    except ValueError:
+        raise AnalyticsError(f'Invalid timestamp: {value}')
+    # Log timestamps are naive UTC.
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+def _cache_value(from_cache):
+    if from_cache == 'semantic':
+        return 'semantic'
+    return 'exact' if from_cache else 'miss'
+
+def _interaction_row(entry):
+    # Cache hits carry the cached answer's timestamp; served_at is when the hit happened.
+    return (
+        _safe_epoch(entry.get('served_at') or entry.get('timestamp')),
+        entry.get('model'),
+        entry.get('template'),
+        _cache_value(entry.get('from_cache')),
+        1 if entry.get('fallback_used') else 0,
+        entry.get('latency_ms'),
+        entry.get('token_count'),
+        1 if entry.get('stream') else 0,
+        1 if entry.get('batch') or entry.get('job') else 0,
+        entry.get('prompt_id'),
+    )
+
+def _rating_row(entry):
+    return (entry.get('prompt_id'), _safe_epoch(entry.get('timestamp')), entry.get('model'), entry.get('rating'))
+
+def _safe_epoch(value):
+    try:
+        return _epoch(value)
+    except AnalyticsError:
+        return None
+
+class AnalyticsStore:
+    def __init__(self, path=ANALYTICS_DB):
+        self.path = path
+        self._local = threading.local()
+        self.compacted_at = 0.0
+        self._compact_lock = threading.Lock()
+        self._thread = None
+        conn = self._conn()
+        for statement in SCHEMA:
+            conn.execute(statement)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def compact(self, prompts_log=None, ratings_log=None):
+        # Appends log lines written since the last run. Offsets advance in the
+        # same transaction as the rows, so every line lands exactly once even
+        # with several workers compacting the same logs.
+        prompts_log = prompts_log or logger.PROMPTS_LOG
+        ratings_log = ratings_log or logger.RATINGS_LOG
+        with self._compact_lock:
+            added = {'interactions': 0, 'ratings': 0}
+            rated = set()
+            first_new = self._conn().execute('SELECT COALESCE(MAX(rowid), 0) + 1 FROM interactions').fetchone()[0]
+            for path in logger.segment_paths(prompts_log):
+                added['interactions'] += self._compact_file(path, 'interactions', _interaction_row, rated)
+            for path in logger.segment_paths(ratings_log):
+                added['ratings'] += self._compact_file(path, 'ratings', _rating_row, rated)
+            if added['interactions'] or rated:
+                self._apply_ratings(rated, first_new if added['interactions'] else None)
+            self.compacted_at = time.time()
+            return added
+
+    def _compact_file(self, path, table, to_row, rated):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return 0
+        conn = self._conn()
+        row = conn.execute('SELECT offset FROM log_offsets WHERE dev = ? AND inode = ?', (st.st_dev, st.st_ino)).fetchone()
+        offset = row[0] if row else 0
+        if offset > st.st_size:
+            # Inode reused by a different file.
+            offset = 0
+        if offset == st.st_size:
+            return 0
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT offset FROM log_offsets WHERE dev = ? AND inode = ?', (st.st_dev, st.st_ino)).fetchone()
+            if row and row[0] <= st.st_size:
+                offset = row[0]
+            count = 0
+            rows = []
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        # Partially written line; picked up next time.
+                        break
+                    offset += len(line)
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    rows.append(to_row(entry))
+                    if len(rows) >= INSERT_BATCH:
+                        count += self._insert(conn, table, rows, rated)
+                        rows = []
+            count += self._insert(conn, table, rows, rated)
+            conn.execute('INSERT OR REPLACE INTO log_offsets (dev, inode, path, offset) VALUES (?, ?, ?, ?)',
+                         (st.st_dev, st.st_ino, path, offset))
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return count
+
+    def _insert(self, conn, table, rows, rated):
+        if not rows:
+            return 0
+        if table == 'interactions':
+            conn.executemany('INSERT INTO interactions (ts, model, template, cache, fallback, latency_ms, token_count, stream, batch, prompt_id) '
+                             'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        else:
+            conn.executemany('INSERT INTO ratings (prompt_id, ts, model, rating) VALUES (?, ?, ?, ?)', rows)
+            rated.update(r[0] for r in rows if r[0])
+        return len(rows)
+
+    def _apply_ratings(self, prompt_ids, first_new=None):
+        # The latest rating for a prompt_id wins, as in /stats. New ratings
+        # update their interactions; new interactions pick up ratings that
+        # were compacted before them.
+        latest = 'SELECT r.rating FROM ratings r WHERE r.prompt_id = interactions.prompt_id ORDER BY r.ts DESC LIMIT 1'
+        conn = self._conn()
+        ids = list(prompt_ids)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if first_new is not None:
+                conn.execute(f'UPDATE interactions SET rating = ({latest}) WHERE rowid >= ? '
+                             'AND prompt_id IN (SELECT prompt_id FROM ratings)', (first_new,))
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                marks = ','.join('?' * len(chunk))
+                conn.execute(f'UPDATE interactions SET rating = ({latest}) WHERE prompt_id IN ({marks})', chunk)
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def maybe_compact(self):
+        if time.time() - self.compacted_at >= QUERY_STALENESS:
+            logger.flush_logs(timeout=5)
+            self.compact()
+
+    def start(self):
+        # Background compaction so the first query after a quiet period is
+        # not the one that catches up.
+        if self._thread is not None or COMPACT_INTERVAL <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, name='analytics-compact', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.compact()
+            except (OSError, sqlite3.Error):
+                pass
+            time.sleep(COMPACT_INTERVAL)
+
+    def query(self, start=None, end=None, models=None, templates=None, cache=None, fallback=None,
+              group_by=(), percentiles=False):
+        where, params = [], []
+        if start is not None:
+            where.append('ts >= ?')
+            params.append(_epoch(start))
+        if end is not None:
+            where.append('ts < ?')
+            params.append(_epoch(end))
+        if models:
+            where.append(f"model IN ({','.join('?' * len(models))})")
+            params.extend(models)
+        if templates:
+            where.append(f"template IN ({','.join('?' * len(templates))})")
+            params.extend(templates)
+        if cache:
+            unknown = set(cache) - set(CACHE_VALUES) - {'hit'}
+            if unknown:
+                raise AnalyticsError(f'Unknown cache filter: {sorted(unknown)}; use exact, semantic, hit or miss')
+            values = sorted({v for c in cache for v in (('exact', 'semantic') if c == 'hit' else (c,))})
+            where.append(f"cache IN ({','.join('?' * len(values))})")
+            params.extend(values)
+        if fallback is not None:
+            where.append('fallback = ?')
+            params.append(1 if fallback else 0)
+        unknown = [g for g in group_by if g not in GROUP_COLUMNS]
+        if unknown:
+            raise AnalyticsError(f'Unknown group_by: {unknown}; use {", ".join(GROUP_COLUMNS)}')
+        keys = [GROUP_COLUMNS[g] for g in group_by]
+        clause = f"WHERE {' AND '.join(where)}" if where else ''
+        select_keys = ''.join(f'{k} AS g{i}, ' for i, k in enumerate(keys))
+        group = f"GROUP BY {', '.join(f'g{i}' for i in range(len(keys)))} ORDER BY {', '.join(f'g{i}' for i in range(len(keys)))}" if keys else ''
+        # Latency figures exclude cache hits, matching /stats.
+        sql = (
+            f"SELECT {select_keys}COUNT(*), "
+            "SUM(cache != 'miss'), SUM(fallback), COALESCE(SUM(token_count), 0), "
+            "AVG(CASE WHEN cache = 'miss' THEN latency_ms END), MAX(CASE WHEN cache = 'miss' THEN latency_ms END), "
+            "AVG(rating), COUNT(rating), MIN(ts), MAX(ts) "
+            f"FROM interactions {clause} {group}"
+        )
+        conn = self._conn()
+        rows = []
+        for record in conn.execute(sql, params):
+            values = record[len(keys):]
+            row = {g: record[i] for i, g in enumerate(group_by)}
+            if values[0] == 0:
+                continue
+            row.update({
+                'requests': values[0],
+                'cache_hits': values[1] or 0,
+                'fallbacks': values[2] or 0,
+                'tokens': values[3],
+                'avg_latency_ms': round(values[4], 1) if values[4] is not None else None,
+                'max_latency_ms': values[5],
+                'avg_rating': round(values[6], 3) if values[6] is not None else None,
+                'ratings': values[7],
+                'first': datetime.utcfromtimestamp(values[8]).isoformat() if values[8] is not None else None,
+                'last': datetime.utcfromtimestamp(values[9]).isoformat() if values[9] is not None else None,
+            })
+            rows.append(row)
+        if percentiles and rows:
+            self._add_percentiles(conn, rows, group_by, keys, clause, params)
+        return rows
+
+    def _add_percentiles(self, conn, rows, group_by, keys, clause, params):
+        # One scan of the matching latencies, then per-group percentiles with
+        # NumPy: sort by (group, latency) and index into each group's run.
+        miss = "cache = 'miss' AND latency_ms IS NOT NULL"
+        clause = f'{clause} AND {miss}' if clause else f'WHERE {miss}'
+        select_keys = ''.join(f'{k}, ' for k in keys)
+        data = conn.execute(f'SELECT {select_keys}latency_ms FROM interactions {clause}', params).fetchall()
+        if not data:
+            return
+        latencies = np.fromiter((r[-1] for r in data), dtype=np.float64, count=len(data))
+        group_ids = {}
+        codes = np.fromiter((group_ids.setdefault(tuple(r[:-1]), len(group_ids)) for r in data), dtype=np.int64, count=len(data))
+        order = np.lexsort((latencies, codes))
+        codes, latencies = codes[order], latencies[order]
+        starts = np.searchsorted(codes, np.arange(len(group_ids)), side='left')
+        ends = np.searchsorted(codes, np.arange(len(group_ids)), side='right')
+        counts = ends - starts
+        results = {}
+        for p in PERCENTILES:
+            # Nearest-rank index within each group's sorted run.
+            index = starts + np.maximum(np.ceil(p / 100 * counts).astype(np.int64) - 1, 0)
+            results[p] = latencies[np.minimum(index, ends - 1)]
+        for row in rows:
+            code = group_ids.get(tuple(row[g] for g in group_by))
+            for p in PERCENTILES:
+                row[f'p{p}_latency_ms'] = float(results[p][code]) if code is not None else None
+
+store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    global store
+    if store is None:
+        with _store_lock:
+            if store is None:
+                store = AnalyticsStore()
+    return store
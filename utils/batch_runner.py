@@ -0,0 +1,188 @@
+# Offline job mode: streams a JSONL file of /chat-style requests through the
+# same templating, routing and caching code as the HTTP endpoint and writes
+# one JSONL result per request, in input order.
+#
+#   python -m utils.batch_runner in.jsonl out.jsonl [--model M] [--concurrency 8] [--rpm groq=30,gemini=15]
+#
+# Progress is checkpointed to <out>.checkpoint; rerunning the same command
+# resumes after the last written line (--restart starts over).
+import os
+import json
+import time
+import asyncio
+import argparse
+from collections import deque
+from datetime import datetime
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from utils.cache import aget_cached_response, cache_key, flush_cache
+from utils.dispatch import resolve_prompt, resolve_model, generate_response, inflight, usage_fields
+from utils.accounting import ledger
+from utils.logger import log_interaction, get_prompt_id, flush_logs
+from utils.ratelimit import TokenBucket
+from models.http_client import aclose_async_client
+from models.registry import provider_for
+
+DEFAULT_CONCURRENCY = int(os.getenv('LLM_ROUTER_BATCH_CONCURRENCY', '8'))
+DEFAULT_RPM = os.getenv('LLM_ROUTER_BATCH_RPM', '')
+CHECKPOINT_EVERY = 100
+
+def parse_rpm(value):
+    # "groq=30,gemini=15" -> requests per minute per provider
+    limits = {}
+    for item in filter(None, (v.strip() for v in value.split(','))):
+        provider, _, rpm = item.partition('=')
+        limits[provider] = float(rpm)
+    return limits
+
+def read_requests(path, offset=0, line_no=0):
+    # Yields (line_no, end_offset, raw_line) lazily, starting at a byte offset,
+    # so memory does not depend on the input size.
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        for raw in f:
+            offset += len(raw)
+            line_no += 1
+            if raw.strip():
+                yield line_no, offset, raw
+
+def load_checkpoint(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_checkpoint(path, state):
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+async def process_line(raw, line_no, default_model, ignore_cache, buckets, semaphore, job):
+    result = {'line': line_no}
+    try:
+        body = json.loads(raw)
+        if not isinstance(body, dict):
+            raise ValueError('expected a JSON object')
+    except ValueError as e:
+        return {**result, 'error': f'Invalid request: {e}', 'status_code': 400}
+    if 'id' in body:
+        result['id'] = body['id']
+    try:
+        prompt = resolve_prompt(body)
+        model = body.get('model') or default_model
+        if not model:
+            raise HTTPException(status_code=400, detail='Missing model')
+        model = resolve_model(model)
+        provider = provider_for(model)
+        if provider is None:
+            raise HTTPException(status_code=400, detail=f'Unknown model provider for model: {model}')
+        if not ignore_cache:
+            cached_response, cached_timestamp = await aget_cached_response(prompt, model)
+            if cached_response is not None:
+                timestamp = cached_timestamp.isoformat() if cached_timestamp else None
+                prompt_id = get_prompt_id(timestamp, prompt, model)
+                log_interaction(timestamp, prompt, model, cached_response, 0, None, prompt_id, from_cache=True, job=job)
+                return {**result, 'prompt_id': prompt_id, 'model_used': model, 'response_text': cached_response,
+                        'latency_ms': 0, 'token_count': None, 'from_cache': True, 'fallback_used': False}
+        async with semaphore:
+            bucket = buckets.get(provider)
+            if bucket is not None:
+                await bucket.acquire()
+            response, _ = await inflight.do(cache_key(prompt, model), lambda: generate_response(prompt, model, provider))
+    except HTTPException as e:
+        return {**result, 'error': e.detail, 'status_code': e.status_code}
+    model_used = response['model_used']
+    timestamp = datetime.utcnow().isoformat()
+    prompt_id = get_prompt_id(timestamp, prompt, model_used)
+    fallback_used = model_used != model
+    log_interaction(timestamp, prompt, model_used, response['response_text'], response['latency_ms'], response['token_count'], prompt_id,
+                    from_cache=False, fallback_used=fallback_used, job=job, retries=response['retries'], **usage_fields(response))
+    return {**result, 'prompt_id': prompt_id, 'model_used': model_used, 'response_text': response['response_text'],
+            'latency_ms': response['latency_ms'], 'token_count': response['token_count'], 'from_cache': False, 'fallback_used': fallback_used,
+            'retries': response['retries'], **usage_fields(response)}
+
+async def run(input_path, output_path, model=None, concurrency=DEFAULT_CONCURRENCY, rpm=None, ignore_cache=False, restart=False):
+    # At most `concurrency` upstream calls run at once and at most
+    # 4 * concurrency lines are read ahead; results are written in input
+    # order so the checkpoint is simply "everything before this offset is done".
+    checkpoint_path = output_path + '.checkpoint'
+    state = None if restart else load_checkpoint(checkpoint_path)
+    if state is None:
+        state = {'input_offset': 0, 'line': 0, 'output_size': 0, 'completed': 0, 'errors': 0}
+    buckets = {provider: TokenBucket(limit / 60.0) for provider, limit in (rpm or {}).items() if limit > 0}
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    job = os.path.basename(input_path)
+    window = deque()
+    written = 0
+    started = time.time()
+    mode = 'r+b' if os.path.exists(output_path) else 'wb'
+    with open(output_path, mode) as out:
+        # Drop anything written after the last checkpoint; it will be redone.
+        out.truncate(state['output_size'])
+        out.seek(state['output_size'])
+
+        async def write_head():
+            nonlocal written
+            line_no, end_offset, task = window.popleft()
+            result = await task
+            out.write((json.dumps(result, ensure_ascii=False) + '\n').encode('utf-8'))
+            state['input_offset'] = end_offset
+            state['line'] = line_no
+            state['completed'] += 1
+            state['errors'] += 'error' in result
+            written += 1
+            if written % CHECKPOINT_EVERY == 0:
+                checkpoint()
+
+        def checkpoint():
+            out.flush()
+            os.fsync(out.fileno())
+            state['output_size'] = out.tell()
+            save_checkpoint(checkpoint_path, state)
+
+        try:
+            for line_no, end_offset, raw in read_requests(input_path, state['input_offset'], state['line']):
+                task = asyncio.ensure_future(process_line(raw, line_no, model, ignore_cache, buckets, semaphore, job))
+                window.append((line_no, end_offset, task))
+                while window and (len(window) >= 4 * concurrency or window[0][2].done()):
+                    await write_head()
+            while window:
+                await write_head()
+        finally:
+            for _, _, task in window:
+                task.cancel()
+            checkpoint()
+    flush_cache()
+    flush_logs()
+    ledger.flush()
+    state['elapsed_s'] = round(time.time() - started, 2)
+    state['written'] = written
+    return state
+
+async def _main(args):
+    # Today's spend from the server and earlier runs, so budgets apply here too.
+    ledger.flush()
+    try:
+        return await run(args.input, args.output, model=args.model, concurrency=args.concurrency, rpm=parse_rpm(args.rpm),
+                         ignore_cache=args.ignore_cache, restart=args.restart)
+    finally:
+        await aclose_async_client()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a JSONL file of chat requests through the router.')
+    parser.add_argument('input', help='JSONL requests: {"prompt" | "template_id" + "template_vars", "model", "id"}')
+    parser.add_argument('output', help='JSONL results, one per request, in input order')
+    parser.add_argument('--model', help='Model for requests that do not name one (auto is allowed)')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument('--rpm', default=DEFAULT_RPM, help='Requests per minute per provider, e.g. groq=30,gemini=15')
+    parser.add_argument('--ignore-cache', action='store_true')
+    parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint and start from the first line')
+    args = parser.parse_args(argv)
+    load_dotenv()
+    state = asyncio.run(_main(args))
+    print(f"{args.input}: wrote {state['written']} results ({state['completed']} total, {state['errors']} errors) in {state['elapsed_s']}s")
+
+if __name__ == '__main__':
+    main()
@@ -1,36 +1,504 @@
 import os
-from sqlalchemy import create_engine, Column, String, Text, DateTime, Boolean
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+import json
+import time
+import queue
+import atexit
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
 from datetime import datetime
+from sqlalchemy import create_engine, event, inspect, select, delete, func, text, Column, String, Text, DateTime, Float, Integer
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import declarative_base
+
+DB_PATH = os.getenv('LLM_ROUTER_CACHE_DB', os.path.join(os.path.dirname(__file__), '..', 'cache.db'))
+# 0 disables expiry / the size bound respectively.
+CACHE_TTL_SECONDS = float(os.getenv('LLM_ROUTER_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))
+CACHE_MAX_BYTES = int(os.getenv('LLM_ROUTER_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+LRU_MAX_ENTRIES = int(os.getenv('LLM_ROUTER_CACHE_LRU_ENTRIES', '10000'))
+LRU_MAX_BYTES = int(os.getenv('LLM_ROUTER_CACHE_LRU_BYTES', str(64 * 1024 * 1024)))
+WRITE_BATCH_SIZE = 256
+WRITE_FLUSH_INTERVAL = 0.05
+# Other worker processes write to the same file, so the running size total is
+# re-read from SQLite this often instead of only being tracked locally.
+SIZE_RESYNC_INTERVAL = 30.0
+# The optional near-duplicate tier; numpy (and faiss) are only imported when it is on.
+SEMANTIC_CACHE_ENABLED = os.getenv('LLM_ROUTER_SEMANTIC_CACHE', '0') == '1'
 
-DB_PATH = os.path.join(os.path.dirname(__file__), '..', 'cache.db')
-engine = create_engine(f'sqlite:///{DB_PATH}', connect_args={"check_same_thread": False})
 Base = declarative_base()
-SessionLocal = sessionmaker(bind=engine)
 
 class CacheEntry(Base):
-    __tablename__ = 'cache'
-    prompt = Column(Text, primary_key=True)
-    model = Column(String, primary_key=True)
+    __tablename__ = 'response_cache'
+    key = Column(String(64), primary_key=True)
+    model = Column(String, index=True)
+    prompt = Column(Text)
     response = Column(Text)
-    timestamp = Column(DateTime)
-
-Base.metadata.create_all(bind=engine)
-
-def get_cached_response(prompt, model):
-    session = SessionLocal()
-    entry = session.query(CacheEntry).filter_by(prompt=prompt, model=model).first()
-    session.close()
-    if entry:
-        return entry.response, entry.timestamp
-    return None, None
-
-def store_response(prompt, model, response, timestamp=None):
-    session = SessionLocal()
-    if timestamp is None:
-        timestamp = datetime.utcnow()
-    entry = CacheEntry(prompt=prompt, model=model, response=response, timestamp=timestamp)
-    session.merge(entry)
-    session.commit()
-    session.close() 
\ No newline at end of file
+    timestamp = Column(DateTime, index=True)
+    expires_at = Column(Float, index=True)
+    size = Column(Integer)
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # WAL lets readers proceed while the writer thread commits a batch.
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA busy_timeout=5000')
+    cursor.close()
+
+def _autocommit(dbapi_connection, connection_record):
+    # Leave transaction control to the 'begin' listener below.
+    dbapi_connection.isolation_level = None
+
+def _begin_immediate(conn):
+    # Take the write lock up front. A deferred transaction that reads and then
+    # writes fails with "database is locked" instead of waiting when another
+    # process commits in between; BEGIN IMMEDIATE waits on busy_timeout.
+    conn.exec_driver_sql('BEGIN IMMEDIATE')
+
+def _make_engine(path, writer=False):
+    if writer:
+        engine = create_engine(f'sqlite:///{path}', connect_args={'check_same_thread': False}, pool_size=2, max_overflow=0)
+        event.listen(engine, 'connect', _sqlite_pragmas)
+        event.listen(engine, 'connect', _autocommit)
+        event.listen(engine, 'begin', _begin_immediate)
+        return engine
+    engine = create_engine(f'sqlite:///{path}', connect_args={'check_same_thread': False}, pool_size=8, max_overflow=8)
+    event.listen(engine, 'connect', _sqlite_pragmas)
+    return engine
+
+def normalize_prompt(prompt):
+    return ' '.join(prompt.split())
+
+def cache_key(prompt, model, params=None):
+    # Fixed-size key, so index lookups cost the same for a 20-char and a 20k-char prompt.
+    base = json.dumps([normalize_prompt(prompt), model, params or {}], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(base.encode('utf-8')).hexdigest()
+
+def _entry_size(prompt, response):
+    return len(prompt.encode('utf-8')) + len(response.encode('utf-8'))
+
+class LRUCache:
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            if item['expires_at'] and item['expires_at'] <= time.time():
+                self._pop(key)
+                return None
+            self._data.move_to_end(key)
+            return item
+
+    def put(self, key, item):
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+            self._data[key] = item
+            self._bytes += item['size']
+            while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+                self._pop(next(iter(self._data)))
+
+    def _pop(self, key):
+        item = self._data.pop(key)
+        self._bytes -= item['size']
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+class ResponseCache:
+    # In-process LRU in front of SQLite. Writes go to the LRU immediately and
+    # are committed to SQLite in batches by a background thread, so the
+    # request path never waits on a disk commit. The database is opened on
+    # first use (or by the startup prewarm), not at import.
+    def __init__(self, path=DB_PATH, ttl_seconds=CACHE_TTL_SECONDS, max_bytes=CACHE_MAX_BYTES, semantic=SEMANTIC_CACHE_ENABLED):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.engine = None
+        # Every write goes through write_engine (the writer thread, migrations, clear()).
+        self.write_engine = None
+        self.lru = LRUCache(LRU_MAX_ENTRIES, LRU_MAX_BYTES)
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._open_lock = threading.Lock()
+        self._total_bytes = 0
+        self._size_synced = 0.0
+        # Optional near-duplicate tier, filled from SQLite in the background once opened.
+        self.semantic = None
+        if semantic:
+            from utils import semantic_cache
+            if semantic_cache.np is not None:
+                self.semantic = semantic_cache.SemanticCache()
+
+    def open(self):
+        if self.write_engine is not None:
+            return
+        with self._open_lock:
+            if self.write_engine is not None:
+                return
+            self.engine = _make_engine(self.path)
+            write_engine = _make_engine(self.path, writer=True)
+            self._init_schema(write_engine)
+            with self.engine.connect() as conn:
+                self._total_bytes = conn.execute(select(func.coalesce(func.sum(CacheEntry.size), 0))).scalar()
+            self._size_synced = time.time()
+            # Published last: other threads only skip the lock once everything is set.
+            self.write_engine = write_engine
+            if self.semantic is not None:
+                threading.Thread(target=self._load_semantic, name='semantic-cache-load', daemon=True).start()
+
+    def _load_semantic(self):
+        now = time.time()
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(CacheEntry.key, CacheEntry.prompt, CacheEntry.model, CacheEntry.response, CacheEntry.timestamp, CacheEntry.expires_at)
+                .where((CacheEntry.expires_at == None) | (CacheEntry.expires_at > now))  # noqa: E711
+                .order_by(CacheEntry.timestamp)
+            )
+            for row in rows:
+                self.semantic.add(row.prompt, row.model, row.response, row.timestamp, row.expires_at, row.key)
+
+    def _init_schema(self, write_engine):
+        # Workers start together; if another process created or migrated the
+        # tables between our check and our write, look again.
+        for attempt in range(3):
+            try:
+                Base.metadata.create_all(bind=write_engine)
+                self._migrate_legacy_table(write_engine)
+                return
+            except OperationalError:
+                if attempt == 2:
+                    raise
+                time.sleep(0.1)
+
+    def _migrate_legacy_table(self, write_engine):
+        # Earlier versions keyed the `cache` table on the full prompt text.
+        if 'cache' not in inspect(self.engine).get_table_names():
+            return
+        with write_engine.begin() as conn:
+            rows = conn.execute(text('SELECT prompt, model, response, timestamp FROM cache')).fetchall()
+            now = time.time()
+            for prompt, model, response, timestamp in rows:
+                if prompt is None or response is None:
+                    continue
+                conn.execute(CacheEntry.__table__.insert().prefix_with('OR REPLACE'), self._row(prompt, model, response, _parse_timestamp(timestamp), None, now))
+            conn.execute(text('DROP TABLE cache'))
+
+    def _row(self, prompt, model, response, timestamp, params, now):
+        return {
+            'key': cache_key(prompt, model, params),
+            'model': model,
+            'prompt': prompt,
+            'response': response,
+            'timestamp': timestamp,
+            'expires_at': now + self.ttl_seconds if self.ttl_seconds else None,
+            'size': _entry_size(prompt, response)
+        }
+
+    def get(self, prompt, model, params=None):
+        key = cache_key(prompt, model, params)
+        item = self.lru.get(key)
+        if item is not None:
+            return item['response'], item['timestamp']
+        self.open()
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                select(CacheEntry.response, CacheEntry.timestamp, CacheEntry.expires_at, CacheEntry.size).where(CacheEntry.key == key)
+            ).first()
+        if row is None or (row.expires_at and row.expires_at <= time.time()):
+            return None, None
+        self.lru.put(key, {'response': row.response, 'timestamp': row.timestamp, 'expires_at': row.expires_at, 'size': row.size})
+        return row.response, row.timestamp
+
+    def get_many(self, pairs):
+        # Bulk exact lookup for [(prompt, model), ...]: LRU first, then one
+        # SQLite query per 500 misses. Returns [(response, timestamp), ...].
+        keys = [cache_key(prompt, model) for prompt, model in pairs]
+        results = {}
+        missing = []
+        for key in keys:
+            item = self.lru.get(key)
+            if item is not None:
+                results[key] = (item['response'], item['timestamp'])
+            else:
+                missing.append(key)
+        missing = list(dict.fromkeys(missing))
+        if not missing:
+            return [results[key] for key in keys]
+        self.open()
+        now = time.time()
+        with self.engine.connect() as conn:
+            for start in range(0, len(missing), 500):
+                rows = conn.execute(
+                    select(CacheEntry.key, CacheEntry.response, CacheEntry.timestamp, CacheEntry.expires_at, CacheEntry.size)
+                    .where(CacheEntry.key.in_(missing[start:start + 500]))
+                )
+                for row in rows:
+                    if row.expires_at and row.expires_at <= now:
+                        continue
+                    self.lru.put(row.key, {'response': row.response, 'timestamp': row.timestamp, 'expires_at': row.expires_at, 'size': row.size})
+                    results[row.key] = (row.response, row.timestamp)
+        return [results.get(key, (None, None)) for key in keys]
+
+    async def aget_many(self, pairs):
+        return await asyncio.to_thread(self.get_many, pairs)
+
+    def get_semantic_many(self, prompts, model):
+        if self.semantic is None:
+            return [(None, None, 0.0)] * len(prompts)
+        return self.semantic.lookup_many(prompts, model)
+
+    async def aget_semantic_many(self, prompts, model):
+        if self.semantic is None:
+            return [(None, None, 0.0)] * len(prompts)
+        return await asyncio.to_thread(self.semantic.lookup_many, prompts, model)
+
+    def get_semantic(self, prompt, model, params=None):
+        # Returns (response, timestamp, similarity); misses have a None response.
+        if self.semantic is None or params:
+            return None, None, 0.0
+        return self.semantic.lookup(prompt, model)
+
+    async def aget_semantic(self, prompt, model, params=None):
+        if self.semantic is None or params:
+            return None, None, 0.0
+        return await asyncio.to_thread(self.semantic.lookup, prompt, model)
+
+    async def aget(self, prompt, model, params=None):
+        key = cache_key(prompt, model, params)
+        item = self.lru.get(key)
+        if item is not None:
+            return item['response'], item['timestamp']
+        return await asyncio.to_thread(self.get, prompt, model, params)
+
+    def put(self, prompt, model, response, timestamp=None, params=None):
+        self._ensure_started()
+        # Parameterized generations are only served from the exact-match tier.
+        self._queue.put((self._stage(prompt, model, response, timestamp, params), not params))
+
+    def put_many(self, entries):
+        # [(prompt, model, response, timestamp), ...] queued as a single item.
+        if not entries:
+            return
+        self._ensure_started()
+        self._queue.put([(self._stage(prompt, model, response, timestamp, None), True) for prompt, model, response, timestamp in entries])
+
+    def _stage(self, prompt, model, response, timestamp, params):
+        if timestamp is None:
+            timestamp = datetime.utcnow()
+        row = self._row(prompt, model, response, timestamp, params, time.time())
+        self.lru.put(row['key'], {'response': response, 'timestamp': timestamp, 'expires_at': row['expires_at'], 'size': row['size']})
+        return row
+
+    def flush(self, timeout=None):
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def clear(self):
+        self.flush()
+        self.lru.clear()
+        self.open()
+        with self.write_engine.begin() as conn:
+            conn.execute(delete(CacheEntry))
+        self._total_bytes = 0
+        if self.semantic is not None:
+            self.semantic.clear()
+
+    def export_rows(self):
+        # Every live entry, oldest first, as plain dicts (see utils.cache_warm).
+        self.open()
+        now = time.time()
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(CacheEntry.key, CacheEntry.model, CacheEntry.prompt, CacheEntry.response, CacheEntry.timestamp, CacheEntry.expires_at)
+                .where((CacheEntry.expires_at == None) | (CacheEntry.expires_at > now))  # noqa: E711
+                .order_by(CacheEntry.timestamp)
+            )
+            for row in rows:
+                yield {'key': row.key, 'model': row.model, 'prompt': row.prompt, 'response': row.response,
+                       'timestamp': row.timestamp.isoformat() if row.timestamp else None, 'expires_at': row.expires_at}
+
+    def import_rows(self, rows, batch_size=500):
+        # Inverse of export_rows(): keys and expiry are kept as exported, and
+        # rows already expired are dropped. Goes through _commit() so the size
+        # bound still holds. Returns the number of rows written.
+        self.flush()
+        self.open()
+        now = time.time()
+        written = 0
+        batch = []
+        for row in rows:
+            if row.get('expires_at') and row['expires_at'] <= now:
+                continue
+            batch.append({'key': row['key'], 'model': row['model'], 'prompt': row['prompt'], 'response': row['response'],
+                          'timestamp': _parse_timestamp(row.get('timestamp')), 'expires_at': row.get('expires_at'),
+                          'size': _entry_size(row['prompt'], row['response'])})
+            if len(batch) >= batch_size:
+                written += self._import_batch(batch)
+                batch = []
+        if batch:
+            written += self._import_batch(batch)
+        # Imported keys may shadow answers this process still holds.
+        self.lru.clear()
+        return written
+
+    def _import_batch(self, rows):
+        self._commit(rows)
+        self._index_semantic(rows)
+        return len(rows)
+
+    def backup(self, target_path):
+        # Consistent copy of the whole database through SQLite's online backup
+        # API; safe while other workers keep writing.
+        self.flush()
+        self.open()
+        source = sqlite3.connect(self.path)
+        target = sqlite3.connect(target_path)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='cache-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            deadline = time.time() + WRITE_FLUSH_INTERVAL
+            while len(batch) < WRITE_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get(timeout=max(0, deadline - time.time())))
+                except queue.Empty:
+                    break
+                if isinstance(batch[-1], threading.Event):
+                    break
+            rows = {}
+            waiters = []
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                elif isinstance(item, list):
+                    rows.update((entry[0]['key'], entry) for entry in item)
+                else:
+                    rows[item[0]['key']] = item
+            try:
+                if rows:
+                    self._commit([row for row, _ in rows.values()])
+                    self._index_semantic([row for row, semantic in rows.values() if semantic])
+            except Exception:
+                # A failed batch only costs cache hits; keep the writer alive.
+                pass
+            for waiter in waiters:
+                waiter.set()
+
+    def _index_semantic(self, rows):
+        # Embedding runs here rather than in put() to keep it off the request path.
+        if self.semantic is None:
+            return
+        for row in rows:
+            self.semantic.add(row['prompt'], row['model'], row['response'], row['timestamp'], row['expires_at'], row['key'])
+
+    def _commit(self, rows):
+        self.open()
+        keys = [r['key'] for r in rows]
+        with self.write_engine.begin() as conn:
+            now = time.time()
+            if now - self._size_synced >= SIZE_RESYNC_INTERVAL:
+                conn.execute(CacheEntry.__table__.insert().prefix_with('OR REPLACE'), rows)
+                self._total_bytes = conn.execute(select(func.coalesce(func.sum(CacheEntry.size), 0))).scalar()
+                self._size_synced = now
+            else:
+                replaced = conn.execute(select(func.coalesce(func.sum(CacheEntry.size), 0)).where(CacheEntry.key.in_(keys))).scalar()
+                conn.execute(CacheEntry.__table__.insert().prefix_with('OR REPLACE'), rows)
+                self._total_bytes += sum(r['size'] for r in rows) - replaced
+            removed = self._evict(conn)
+        if removed and self.semantic is not None:
+            # Deleted rows would otherwise keep taking semantic lookups' top-k slots.
+            self.semantic.discard(removed)
+
+    def _evict(self, conn):
+        # Returns the (model, key) of every deleted entry.
+        now = time.time()
+        removed = []
+        expired = conn.execute(
+            select(CacheEntry.model, CacheEntry.key, CacheEntry.size).where(CacheEntry.expires_at <= now)
+        ).all()
+        if expired:
+            conn.execute(delete(CacheEntry).where(CacheEntry.expires_at <= now))
+            self._total_bytes -= sum(size for _, _, size in expired)
+            removed.extend((model, key) for model, key, _ in expired)
+        if not self.max_bytes or self._total_bytes <= self.max_bytes:
+            return removed
+        # Drop the oldest entries until we are 10% under the bound, so eviction
+        # does not run on every subsequent batch.
+        target = self.max_bytes * 0.9
+        freed = 0
+        victims = []
+        for model, key, size in conn.execute(select(CacheEntry.model, CacheEntry.key, CacheEntry.size).order_by(CacheEntry.timestamp)):
+            if self._total_bytes - freed <= target:
+                break
+            victims.append(key)
+            removed.append((model, key))
+            freed += size
+        for start in range(0, len(victims), 500):
+            conn.execute(delete(CacheEntry).where(CacheEntry.key.in_(victims[start:start + 500])))
+        self._total_bytes -= freed
+        return removed
+
+def _parse_timestamp(value):
+    if isinstance(value, datetime) or value is None:
+        return value
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+response_cache = ResponseCache()
+atexit.register(response_cache.flush, 5)
+
+def get_cached_response(prompt, model, params=None):
+    return response_cache.get(prompt, model, params)
+
+async def aget_cached_response(prompt, model, params=None):
+    return await response_cache.aget(prompt, model, params)
+
+async def aget_semantic_response(prompt, model, params=None):
+    return await response_cache.aget_semantic(prompt, model, params)
+
+async def aget_cached_responses(pairs):
+    return await response_cache.aget_many(pairs)
+
+async def aget_semantic_responses(prompts, model):
+    return await response_cache.aget_semantic_many(prompts, model)
+
+def store_response(prompt, model, response, timestamp=None, params=None):
+    response_cache.put(prompt, model, response, timestamp, params)
+
+def store_responses(entries):
+    response_cache.put_many(entries)
+
+def flush_cache(timeout=None):
+    return response_cache.flush(timeout)
@@ -0,0 +1,248 @@
+# Cache warm-up for fresh nodes and deploys: mines the interaction logs for
+# the most requested (prompt, model) pairs, and moves whole caches between
+# nodes.
+#
+#   python -m utils.cache_warm top [--top 1000] [--log PATH ...]
+#   python -m utils.cache_warm preload [--top 1000] [--log PATH ...]
+#   python -m utils.cache_warm precompute [--top 1000] [--concurrency 4] [--rpm groq=30,gemini=15]
+#   python -m utils.cache_warm export cache-export.jsonl.gz   (.jsonl, .jsonl.gz, .jsonl.zst or .db)
+#   python -m utils.cache_warm import cache-export.jsonl.gz
+#
+# preload stores the answers already in the logs (no upstream calls);
+# precompute asks the models again, for pairs the cache does not hold.
+import io
+import os
+import csv
+import gzip
+import json
+import time
+import heapq
+import sqlite3
+import asyncio
+import argparse
+import threading
+from collections import Counter
+from datetime import timezone
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from utils import logger
+from utils.cache import response_cache, cache_key, flush_cache, _parse_timestamp
+from utils.dispatch import generate_response
+from utils.accounting import ledger
+from utils.ratelimit import TokenBucket
+from utils.batch_runner import parse_rpm
+from models.http_client import aclose_async_client
+from models.registry import provider_for
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DEFAULT_TOP_N = 1000
+DEFAULT_CONCURRENCY = 4
+# With this set, each worker preloads the top N logged pairs in the background at startup.
+WARM_ON_STARTUP_TOP_N = int(os.getenv('LLM_ROUTER_CACHE_WARM_TOP_N', '0'))
+
+def _read_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        yield from json.load(f)
+
+def _read_csv(path):
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        yield from csv.DictReader(f)
+
+def _read_jsonl(path):
+    # A rotated base path also covers its segments and per-worker files.
+    for segment in logger.segment_paths(path):
+        yield from logger._iter_jsonl(segment)
+
+# Log readers by file extension; anything else is read as JSON lines.
+READERS = {'.json': _read_json, '.csv': _read_csv, '.jsonl': _read_jsonl}
+
+def iter_entries(paths=None):
+    # Interaction entries from the given log files, or from the server's own
+    # logs (JSON-lines segments and the legacy prompts.json) by default.
+    if not paths:
+        yield from logger.iter_interactions()
+        return
+    for path in paths:
+        yield from READERS.get(os.path.splitext(path)[1], _read_jsonl)(path)
+
+def _warmable(entry):
+    # Session turns are cached under their conversation's context, which a
+    # replay from the log can't reproduce.
+    return bool(entry.get('prompt')) and bool(entry.get('model')) and not entry.get('session_id')
+
+def top_pairs(top_n=DEFAULT_TOP_N, paths=None):
+    # Two passes over the logs: count every request (cache hits included) per
+    # cache key, then collect prompt text and the newest logged answer for the
+    # top N keys only, so memory doesn't grow with the log size.
+    counts = Counter(cache_key(e['prompt'], e['model']) for e in iter_entries(paths) if _warmable(e))
+    top = dict(heapq.nlargest(top_n, counts.items(), key=lambda item: item[1]))
+    found = {}
+    for entry in iter_entries(paths):
+        if not _warmable(entry):
+            continue
+        key = cache_key(entry['prompt'], entry['model'])
+        if key in top:
+            pair = found.get(key)
+            if pair is None or (entry.get('response') and str(entry.get('timestamp') or '') >= str(pair['timestamp'] or '')):
+                found[key] = {'prompt': entry['prompt'], 'model': entry['model'], 'response': entry.get('response') or None,
+                              'timestamp': entry.get('timestamp'), 'count': top[key]}
+    return sorted(found.values(), key=lambda pair: -pair['count'])
+
+def _missing(pairs):
+    cached = response_cache.get_many([(pair['prompt'], pair['model']) for pair in pairs])
+    return [pair for pair, (response, _) in zip(pairs, cached) if response is None]
+
+def _logged_expiry(timestamp):
+    # An answer expires a TTL after it was logged, not after it was preloaded.
+    # Log timestamps are naive UTC.
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.timestamp() + response_cache.ttl_seconds if response_cache.ttl_seconds else None
+
+def preload(top_n=DEFAULT_TOP_N, paths=None):
+    # Logged answers for the top pairs the cache doesn't hold; nothing already
+    # cached is overwritten. Answers without a readable timestamp are skipped,
+    # and import_rows() drops those already past their TTL.
+    rows = []
+    for pair in _missing(top_pairs(top_n, paths)):
+        timestamp = _parse_timestamp(pair['timestamp'])
+        if not pair['response'] or timestamp is None:
+            continue
+        rows.append({'key': cache_key(pair['prompt'], pair['model']), 'model': pair['model'], 'prompt': pair['prompt'],
+                     'response': pair['response'], 'timestamp': timestamp, 'expires_at': _logged_expiry(timestamp)})
+    return response_cache.import_rows(rows)
+
+async def precompute(top_n=DEFAULT_TOP_N, paths=None, concurrency=DEFAULT_CONCURRENCY, rpm=None):
+    # Fresh answers for the top pairs the cache doesn't hold, at most
+    # `concurrency` upstream calls at a time and under the per-provider rpm.
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    buckets = {provider: TokenBucket(limit / 60.0) for provider, limit in (rpm or {}).items() if limit > 0}
+    stats = {'pairs': 0, 'generated': 0, 'errors': 0}
+
+    async def generate(pair):
+        provider = provider_for(pair['model'])
+        if provider is None:
+            stats['errors'] += 1
+            return
+        async with semaphore:
+            bucket = buckets.get(provider)
+            if bucket is not None:
+                await bucket.acquire()
+            try:
+                await generate_response(pair['prompt'], pair['model'], provider)
+                stats['generated'] += 1
+            except HTTPException:
+                stats['errors'] += 1
+
+    pairs = _missing(top_pairs(top_n, paths))
+    stats['pairs'] = len(pairs)
+    await asyncio.gather(*(generate(pair) for pair in pairs))
+    flush_cache()
+    return stats
+
+def _open_text(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise RuntimeError('zstandard is not installed; use a .jsonl.gz or .db file instead')
+        codec = zstandard.ZstdCompressor() if mode == 'w' else zstandard.ZstdDecompressor()
+        stream = codec.stream_writer(open(path, 'wb')) if mode == 'w' else codec.stream_reader(open(path, 'rb'))
+        return io.TextIOWrapper(stream, encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+def export_cache(path):
+    # .db: a SQLite copy made with the online backup API, which a new node can
+    # use directly as its LLM_ROUTER_CACHE_DB. Otherwise one JSON object per
+    # live entry, compressed by extension.
+    if path.endswith('.db'):
+        response_cache.backup(path)
+        conn = sqlite3.connect(path)
+        try:
+            return conn.execute('SELECT COUNT(*) FROM response_cache').fetchone()[0]
+        finally:
+            conn.close()
+    response_cache.flush()
+    count = 0
+    with _open_text(path, 'w') as f:
+        for row in response_cache.export_rows():
+            f.write(json.dumps(row, ensure_ascii=False) + '\n')
+            count += 1
+    return count
+
+def _read_export(path):
+    if path.endswith('.db'):
+        conn = sqlite3.connect(path)
+        try:
+            for key, model, prompt, response, timestamp, expires_at in conn.execute(
+                    'SELECT key, model, prompt, response, timestamp, expires_at FROM response_cache ORDER BY timestamp'):
+                yield {'key': key, 'model': model, 'prompt': prompt, 'response': response, 'timestamp': timestamp, 'expires_at': expires_at}
+        finally:
+            conn.close()
+        return
+    with _open_text(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def import_cache(path):
+    return response_cache.import_rows(_read_export(path))
+
+def start_background_warm(top_n=WARM_ON_STARTUP_TOP_N):
+    # Startup hook: warming reads the whole log, so it runs off the event loop
+    # and the node serves (cold) in the meantime.
+    if top_n <= 0:
+        return None
+    thread = threading.Thread(target=preload, args=(top_n,), name='cache-warm', daemon=True)
+    thread.start()
+    return thread
+
+def _print_top(pairs):
+    for pair in pairs:
+        prompt = ' '.join(pair['prompt'].split())
+        print(f"{pair['count']:>8}  {pair['model']:<40}  {prompt[:80]}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Warm, export and import the response cache.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    for name, help_text in (('top', 'List the most requested (prompt, model) pairs'),
+                            ('preload', 'Store logged answers for the top pairs'),
+                            ('precompute', 'Generate answers for top pairs missing from the cache')):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('--top', type=int, default=DEFAULT_TOP_N)
+        command.add_argument('--log', action='append', help='Interaction log (.jsonl, .json or .csv); defaults to the server logs')
+        if name == 'precompute':
+            command.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY)
+            command.add_argument('--rpm', default='', help='Requests per minute per provider, e.g. groq=30,gemini=15')
+    commands.add_parser('export', help='Write the cache to .jsonl[.gz|.zst] or a .db copy').add_argument('path')
+    commands.add_parser('import', help='Load a file written by export').add_argument('path')
+    args = parser.parse_args(argv)
+    load_dotenv()
+    started = time.time()
+    if args.command == 'top':
+        _print_top(top_pairs(args.top, args.log))
+    elif args.command == 'preload':
+        print(f'preloaded {preload(args.top, args.log)} entries in {time.time() - started:.2f}s')
+    elif args.command == 'precompute':
+        stats = asyncio.run(_precompute(args, parse_rpm(args.rpm)))
+        print(f"generated {stats['generated']} of {stats['pairs']} missing pairs ({stats['errors']} errors) in {time.time() - started:.2f}s")
+    elif args.command == 'export':
+        print(f'{args.path}: exported {export_cache(args.path)} entries in {time.time() - started:.2f}s')
+    else:
+        print(f'{args.path}: imported {import_cache(args.path)} entries in {time.time() - started:.2f}s')
+
+async def _precompute(args, rpm):
+    # Today's spend, so budgets apply to the warm-up too.
+    ledger.flush()
+    try:
+        return await precompute(args.top, args.log, args.concurrency, rpm)
+    finally:
+        ledger.flush()
+        await aclose_async_client()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,304 @@
+import time
+import asyncio
+from datetime import datetime
+from fastapi import HTTPException
+from utils.tokens import count_tokens, count_message_tokens
+from utils.templates import registry as templates, TemplateError
+from utils.cache import store_response
+from utils import metrics, tracing
+from utils.singleflight import SingleFlight
+from models.registry import get_handler
+from models.usage import TokenUsage, total_tokens
+from models.errors import TransientError, classify, RATE_LIMIT, TRANSIENT, INVALID_REQUEST, SAFETY
+from utils.retry import RetryBudget
+from utils.accounting import ledger
+from utils import sessions
+from utils.sessions import build_messages
+from utils.ratelimit import limiter, EXPECTED_COMPLETION_TOKENS
+from utils.routing import router, PROVIDER_LABELS
+
+# Request dispatch shared by the HTTP endpoints and the offline job runner:
+# prompt/template resolution, model selection, and the upstream call path with
+# fallbacks and hedging.
+
+def resolve_prompt(body):
+    # `template_id` + `template_vars` renders a registered template. The older
+    # `template` field names a template too, with `prompt` filling its
+    # {{prompt}} slot (or its only variable, when it has just one).
+    prompt = body.get('prompt')
+    template_id = body.get('template_id') or body.get('template')
+    template_vars = body.get('template_vars') or {}
+    if template_id:
+        template = templates.get(template_id)
+        if template is None:
+            raise HTTPException(status_code=400, detail=f'Template id {template_id} not found')
+        if not isinstance(template_vars, dict):
+            raise HTTPException(status_code=400, detail='template_vars must be an object')
+        values = dict(template_vars)
+        if prompt is not None:
+            values.setdefault('prompt', prompt)
+            if len(template.vars) == 1:
+                values.setdefault(template.vars[0], prompt)
+        try:
+            with tracing.span('template', **{'template.id': template_id}):
+                render_started = time.perf_counter()
+                prompt = template.render(values)
+                metrics.template_render_duration.observe(time.perf_counter() - render_started)
+        except TemplateError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    if not prompt:
+        raise HTTPException(status_code=400, detail='Missing prompt')
+    return prompt
+
+def resolve_session(body):
+    # (session_id, history, cache params) for a `session_id` request, else
+    # (None, [], None). The params put the conversation prefix hash in the
+    # cache key, so identical prefixes share cache entries.
+    session_id = body.get('session_id')
+    if session_id is None:
+        return None, [], None
+    if not isinstance(session_id, str) or not session_id or len(session_id) > sessions.MAX_SESSION_ID_LENGTH:
+        raise HTTPException(status_code=400, detail=f'session_id must be a non-empty string of at most {sessions.MAX_SESSION_ID_LENGTH} characters')
+    history, prefix = sessions.store.history(session_id)
+    return session_id, history, ({'context': prefix} if history else None)
+
+def template_fields(body):
+    # Log fields naming the template a request used, if any.
+    template_id = body.get('template_id') or body.get('template')
+    return {'template': template_id} if template_id else {}
+
+# Concurrent identical requests share one upstream call.
+inflight = SingleFlight()
+
+# hedge=true without a p95 for the model yet waits this long before hedging.
+DEFAULT_HEDGE_AFTER_MS = 2000
+
+async def call_model(m, prompt, budget=None, history=None, admitted=True):
+    # One upstream call, bounded by the model's adaptive timeout and paced by
+    # the rate limiter, retried on the same model for transient failures and
+    # 429s while `budget` allows. Feeds the router; a cancelled attempt (lost
+    # hedge), a local queue timeout, or a failure caused by the request itself
+    # (invalid request, safety block) is not counted against the model.
+    # Session `history` is trimmed to this model's context budget.
+    # `admitted` is what router.allow() returned for this call.
+    try:
+        return await _call_model(m, prompt, budget or RetryBudget(), history)
+    finally:
+        # Those uncounted outcomes also hand back a half-open probe taken by
+        # allow(); after a success or a counted failure this is a no-op.
+        router.release(m, admitted)
+
+async def _call_model(m, prompt, budget, history):
+    try:
+        handler = get_handler(m)
+    except Exception as e:
+        router.record_failure(m, e)
+        raise
+    messages = build_messages(history, prompt, m)
+    prompt_tokens = count_message_tokens(messages, model=m)
+    estimated_tokens = prompt_tokens + EXPECTED_COMPLETION_TOKENS
+    attempt = 0
+    while True:
+        with tracing.span('ratelimit', **{'llm.model': m}):
+            permit = await limiter.acquire(m, handler.api_key, estimated_tokens, max_wait=min(limiter.max_wait, budget.remaining()))
+        timeout = min(router.attempt_timeout(m), budget.remaining())
+        start = time.time()
+        try:
+            with tracing.span('upstream', **{'llm.model': m, 'attempt': attempt}):
+                result = await asyncio.wait_for(handler.agenerate(messages), timeout=timeout)
+        except asyncio.CancelledError:
+            permit.release()
+            raise
+        except Exception as e:
+            permit.release()
+            error = e
+            if isinstance(e, asyncio.TimeoutError):
+                error = TransientError(f'Timed out after {timeout:.1f}s')
+            record_upstream_error(m, error, start)
+            kind = classify(error)
+            if kind == RATE_LIMIT:
+                limiter.penalize(m, handler.api_key, error.retry_after)
+            delay = budget.retry_delay(error, attempt)
+            if delay is not None and (kind != RATE_LIMIT or delay <= limiter.max_wait):
+                budget.record_retry(m)
+                metrics.retries.inc(m, kind)
+                attempt += 1
+                if kind == TRANSIENT:
+                    await asyncio.sleep(delay)
+                # A 429 retry queues behind the Retry-After block in acquire().
+                continue
+            if kind not in (INVALID_REQUEST, SAFETY):
+                router.record_failure(m, error, getattr(error, 'retry_after', None))
+            if error is e:
+                raise
+            raise error from e
+        break
+    if isinstance(result, tuple):
+        response_text, model_token_count = result
+    else:
+        response_text, model_token_count = result, None
+    permit.release(total_tokens(model_token_count))
+    elapsed = time.time() - start
+    latency_ms = int(elapsed * 1000)
+    router.record_success(m, latency_ms)
+    metrics.upstream_duration.observe(elapsed, m, 'ok')
+    usage = account_usage(m, handler.api_key, prompt_tokens, response_text, model_token_count)
+    result = {'response_text': response_text, 'model_used': m, 'latency_ms': latency_ms, **usage}
+    if history:
+        result['context_turns'] = len(messages) - 1
+    return result
+
+def account_usage(m, api_key, prompt_tokens, response_text, usage):
+    # Prompt/completion split from the provider's TokenUsage when it reported
+    # one, local token counts otherwise (a bare int is a total only). Charges
+    # the ledger and returns the token_count/prompt_tokens/completion_tokens/
+    # cost_usd result fields.
+    reported_prompt = usage.prompt_tokens if isinstance(usage, TokenUsage) else None
+    reported_completion = usage.completion_tokens if isinstance(usage, TokenUsage) else None
+    total = total_tokens(usage)
+    if reported_prompt is not None:
+        prompt_tokens = reported_prompt
+    if reported_completion is not None:
+        completion_tokens = reported_completion
+    elif total is not None:
+        completion_tokens = max(0, total - prompt_tokens)
+    else:
+        completion_tokens = count_tokens(response_text, model=m)
+    token_count = total if total is not None else prompt_tokens + completion_tokens
+    metrics.tokens.inc(m, 'in', amount=prompt_tokens)
+    metrics.tokens.inc(m, 'out', amount=completion_tokens)
+    cost_usd = ledger.record(m, api_key, prompt_tokens, completion_tokens)
+    return {'token_count': token_count, 'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens, 'cost_usd': round(cost_usd, 8)}
+
+def usage_fields(result):
+    # The accounting fields of a call_model result, for responses and logs.
+    return {k: result[k] for k in ('prompt_tokens', 'completion_tokens', 'cost_usd')}
+
+def worth_trying(m, budget):
+    # False once an earlier failure in this request shows `m` can't help:
+    # the request itself was rejected, its provider's key or content filter
+    # refused it, or the retry deadline has passed (see utils/retry.py).
+    return INVALID_REQUEST not in budget.kinds.values() and budget.can_help(m) and budget.remaining() > 0
+
+def record_upstream_error(m, error, start):
+    metrics.upstream_duration.observe(time.time() - start, m, 'error')
+    metrics.provider_errors.inc(m, type(error).__name__)
+
+async def hedged_call(primary, next_backup, prompt, hedge_after, budget, history=None, admitted=None):
+    # Starts `primary`; if it hasn't answered after `hedge_after` seconds, also
+    # starts the model next_backup() picks and returns whichever succeeds
+    # first, cancelling the other. If the primary fails before the deadline
+    # the backup runs as a plain fallback. The backup is only picked (and
+    # admitted by the router) when it is about to start; None means no
+    # candidate is worth calling. `admitted` maps a model to its allow() result.
+    admitted = admitted if admitted is not None else {}
+    start = time.time()
+    started = {primary: start}
+    tasks = {asyncio.ensure_future(call_model(primary, prompt, budget, history, admitted.get(primary, True))): primary}
+    hedge = {'fired': False, 'after_ms': int(hedge_after * 1000), 'winner': None, 'overhead_ms': 0}
+    errors = {}
+    pending = set(tasks)
+    backup_considered = False
+    while pending:
+        timeout = None if backup_considered else max(0.0, start + hedge_after - time.time())
+        done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            m = tasks[task]
+            if task.exception() is not None:
+                errors[m] = str(task.exception())
+                budget.record_failure(m, task.exception())
+                continue
+            now = time.time()
+            for loser in pending:
+                loser.cancel()
+            hedge['winner'] = m
+            # Upstream time spent on the request(s) that lost the race.
+            hedge['overhead_ms'] = sum(int((now - started[tasks[loser]]) * 1000) for loser in pending)
+            result = task.result()
+            result['latency_ms'] = int((now - start) * 1000)
+            result['hedge'] = hedge
+            return result, errors
+        if not backup_considered and (not done or not pending):
+            backup_considered = True
+            backup = next_backup()
+            if backup is None:
+                continue
+            hedge['fired'] = not done
+            started[backup] = time.time()
+            task = asyncio.ensure_future(call_model(backup, prompt, budget, history, admitted.get(backup, True)))
+            tasks[task] = backup
+            pending.add(task)
+    return None, errors
+
+async def generate_response(prompt, model, provider, hedge_after=None, store=True, history=None, params=None):
+    # Walks the router's candidates for `model`, skipping models whose circuit
+    # is open or that are rate limited, and models an earlier failure showed
+    # can't help (see utils/retry.py). With `hedge_after` (seconds) the first
+    # two usable candidates are raced instead of tried one after the other.
+    # store=False leaves the cache insert to the caller (/chat/batch).
+    # `history` is a session's earlier turns, and `params` the cache params
+    # from resolve_session().
+    errors = {}
+    skipped = []
+    candidates = list(dict.fromkeys(router.candidates(model)))
+    budget = RetryBudget()
+    admitted = {}
+
+    def next_candidate():
+        # allow() runs right before a model is called: for a half-open circuit
+        # it hands out the single probe, which only a call gives back.
+        while candidates:
+            m = candidates.pop(0)
+            admitted[m] = worth_trying(m, budget) and router.allow(m)
+            if admitted[m]:
+                return m
+            skipped.append(m)
+        return None
+
+    result = None
+    if hedge_after is not None and len(candidates) >= 2:
+        primary = next_candidate()
+        if primary is not None:
+            result, errors = await hedged_call(primary, next_candidate, prompt, hedge_after, budget, history, admitted)
+    while result is None:
+        m = next_candidate()
+        if m is None:
+            break
+        try:
+            result = await call_model(m, prompt, budget, history, admitted[m])
+        except Exception as e:
+            errors[m] = str(e)
+            budget.record_failure(m, e)
+    if result is not None:
+        if store:
+            store_response(prompt, result['model_used'], result['response_text'], datetime.utcnow(), params)
+        result['retries'] = budget.total_retries()
+        return result
+    if not errors:
+        raise HTTPException(status_code=503, detail=f"All candidate models are unavailable (circuit open, rate limited or over budget): {skipped}")
+    kinds = set(budget.kinds.values())
+    if INVALID_REQUEST in kinds or kinds == {SAFETY}:
+        # The request itself was refused; another model wouldn't change that.
+        raise HTTPException(status_code=400, detail=f"Request rejected by the provider. Errors: {errors}")
+    label = PROVIDER_LABELS.get(provider, 'candidate')
+    detail = f"All {label} models failed. Errors: {errors}"
+    raise HTTPException(status_code=500, detail=detail)
+
+def hedge_delay(model, hedge_after_ms, hedge):
+    # Explicit hedge_after_ms wins; hedge=true uses the model's rolling p95.
+    if hedge_after_ms is not None:
+        return max(0, hedge_after_ms) / 1000.0
+    if not hedge:
+        return None
+    health = router.health.get(model)
+    p95 = health.p95() if health else None
+    return (p95 if p95 is not None else DEFAULT_HEDGE_AFTER_MS) / 1000.0
+
+def resolve_model(model):
+    # model=auto picks the best configured model for the latency/cost/rating objective.
+    if model != 'auto':
+        return model
+    ranked = router.rank_auto()
+    if not ranked:
+        raise HTTPException(status_code=503, detail='No configured models available for model=auto')
+    return ranked[0]
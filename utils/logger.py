@@ -1,18 +1,309 @@
 import os
 import json
 import csv
-from threading import Lock
+import glob
+import time
+import queue
+import atexit
+import threading
 from datetime import datetime
+from utils.stats import aggregator
+from utils import metrics
 
-LOG_DIR = 'logs'
-JSON_LOG = os.path.join(LOG_DIR, 'prompts.json')
+LOG_DIR = os.getenv('LLM_ROUTER_LOG_DIR', 'logs')
+# Append-only JSON-lines logs; the active file is rotated into timestamped segments.
+PROMPTS_LOG = os.path.join(LOG_DIR, 'prompts.jsonl')
+RATINGS_LOG = os.path.join(LOG_DIR, 'ratings.jsonl')
 CSV_LOG = os.path.join(LOG_DIR, 'prompts.csv')
-RATINGS_JSON = os.path.join(LOG_DIR, 'ratings.json')
 RATINGS_CSV = os.path.join(LOG_DIR, 'ratings.csv')
+# Legacy JSON-array logs, still read until migrated with `python -m utils.migrate_logs`.
+JSON_LOG = os.path.join(LOG_DIR, 'prompts.json')
+RATINGS_JSON = os.path.join(LOG_DIR, 'ratings.json')
+
+ROTATE_MAX_BYTES = int(os.getenv('LLM_ROUTER_LOG_ROTATE_BYTES', str(64 * 1024 * 1024)))
+ROTATE_MAX_SECONDS = float(os.getenv('LLM_ROUTER_LOG_ROTATE_SECONDS', '86400'))
+FSYNC_INTERVAL = float(os.getenv('LLM_ROUTER_LOG_FSYNC_INTERVAL', '1.0'))
+BATCH_SIZE = 512
+# With several worker processes each one appends to its own active files
+# (prompts.w<pid>.jsonl, ...) instead of sharing one; readers merge them.
+LOG_PER_WORKER = os.getenv('LLM_ROUTER_LOG_PER_WORKER', '0') == '1'
+# ... and /stats follows every worker's files instead of counting only its own
+# events, so all workers report the same numbers. Followed on each /stats
+# call and at least this often.
+STATS_REFRESH_SECONDS = float(os.getenv('LLM_ROUTER_STATS_REFRESH_SECONDS', '5'))
+
+INTERACTION_FIELDS = ['timestamp', 'prompt', 'model', 'response', 'latency_ms', 'token_count', 'prompt_id', 'rating', 'from_cache', 'fallback_used']
+RATING_FIELDS = ['timestamp', 'prompt_id', 'model', 'rating', 'feedback']
+
+def worker_path(path):
+    if not LOG_PER_WORKER:
+        return path
+    base, ext = os.path.splitext(path)
+    return f'{base}.w{os.getpid()}{ext}'
+
+def segment_paths(path):
+    # Rotated segments (shared or per-worker) sort by their timestamp suffix;
+    # a migrated legacy segment always comes first and the active files last.
+    base, ext = os.path.splitext(path)
+    paths = []
+    legacy = f'{base}.legacy{ext}'
+    if os.path.exists(legacy):
+        paths.append(legacy)
+    rotated, active = [], []
+    for candidate in glob.glob(f'{base}.*{ext}'):
+        parts = candidate[len(base) + 1:len(candidate) - len(ext)].split('.')
+        if parts[-1][:1].isdigit():
+            rotated.append((parts[-1], candidate))
+        elif len(parts) == 1 and parts[0][:1] == 'w' and parts[0][1:].isdigit():
+            active.append(candidate)
+    paths.extend(candidate for _, candidate in sorted(rotated))
+    paths.extend(sorted(active))
+    if os.path.exists(path):
+        paths.append(path)
+    return paths
+
+def _iter_jsonl(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # A torn final line from a crash mid-write; skip it.
+                continue
+
+def _iter_legacy(path):
+    if path and os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            yield from json.load(f)
+
+def _read_new(path, offsets):
+    # Complete lines appended since the last call. Offsets are kept per
+    # (device, inode), so a segment renamed by rotation isn't read again.
+    try:
+        st = os.stat(path)
+    except OSError:
+        return []
+    key = (st.st_dev, st.st_ino)
+    offset = offsets.get(key, 0)
+    if offset > st.st_size:
+        offset = 0
+    entries = []
+    if offset < st.st_size:
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # Still being written; picked up next time.
+                    break
+                offset += len(line)
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue
+    offsets[key] = offset
+    return entries
+
+def iter_log(path, legacy_path=None):
+    yield from _iter_legacy(legacy_path)
+    for segment in segment_paths(path):
+        yield from _iter_jsonl(segment)
+
+def iter_interactions():
+    return iter_log(PROMPTS_LOG, JSON_LOG)
+
+def iter_ratings():
+    return iter_log(RATINGS_LOG, RATINGS_JSON)
+
+def _csv_header(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return next(csv.reader(f), None)
+
+class _Segment:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'a', encoding='utf-8')
+        self.size = self.file.tell()
+        self.opened_at = time.time()
+
+    def close(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+
+class LogWriter:
+    # Single background thread that owns every log file handle. Callers only
+    # enqueue, so a log call costs one queue.put regardless of history size.
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._segments = {}
+        self._csv_files = {}
+        self._last_fsync = time.time()
+        self._dirty = False
+
+    def submit(self, path, entry, csv_path=None, csv_fields=None):
+        self._ensure_started()
+        self._queue.put((path, entry, csv_path, csv_fields))
 
-log_lock = Lock()
+    def submit_many(self, items):
+        # One queue item for a whole batch of (path, entry, csv_path, csv_fields).
+        if items:
+            self._ensure_started()
+            self._queue.put(list(items))
 
-def log_interaction(timestamp, prompt, model, response, latency, token_count, prompt_id, from_cache=False):
+    def flush(self, timeout=None):
+        # Blocks until everything submitted so far is written and fsynced.
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=FSYNC_INTERVAL)
+            except queue.Empty:
+                self._sync(force=True)
+                continue
+            batch = [item]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            waiters = []
+            write_started = time.perf_counter()
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                elif isinstance(item, list):
+                    for entry in item:
+                        self._write(*entry)
+                else:
+                    self._write(*item)
+            sync_started = time.perf_counter()
+            metrics.log_write_duration.observe(sync_started - write_started, 'write')
+            self._sync(force=bool(waiters))
+            metrics.log_write_duration.observe(time.perf_counter() - sync_started, 'sync')
+            for waiter in waiters:
+                waiter.set()
+
+    def _segment(self, path):
+        path = worker_path(path)
+        segment = self._segments.get(path)
+        if segment is not None and (segment.size >= ROTATE_MAX_BYTES or time.time() - segment.opened_at >= ROTATE_MAX_SECONDS):
+            segment.close()
+            base, ext = os.path.splitext(path)
+            os.replace(path, f"{base}.{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}{ext}")
+            segment = None
+        if segment is None:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            segment = _Segment(path)
+            self._segments[path] = segment
+        return segment
+
+    def _write(self, path, entry, csv_path, csv_fields):
+        try:
+            segment = self._segment(path)
+            line = json.dumps(entry, ensure_ascii=False) + '\n'
+            segment.file.write(line)
+            segment.size += len(line.encode('utf-8'))
+            if csv_path:
+                csv_path = worker_path(csv_path)
+                f, fields = self._csv_files.get(csv_path, (None, None))
+                if f is None:
+                    # An existing file keeps the columns in its header, so rows
+                    # written after an upgrade still line up; columns added since
+                    # only appear in new files or after `python -m utils.migrate_logs`.
+                    fields = (_csv_header(csv_path) if os.path.exists(csv_path) else None) or csv_fields
+                    write_header = not os.path.exists(csv_path) or os.path.getsize(csv_path) == 0
+                    f = open(csv_path, 'a', newline='', encoding='utf-8')
+                    self._csv_files[csv_path] = (f, fields)
+                    if write_header:
+                        csv.DictWriter(f, fieldnames=fields).writeheader()
+                csv.DictWriter(f, fieldnames=fields, extrasaction='ignore').writerow(entry)
+            self._dirty = True
+        except OSError:
+            # Never let a full disk or a permissions problem kill the writer thread.
+            pass
+
+    def _sync(self, force=False):
+        if not self._dirty:
+            return
+        if not force and time.time() - self._last_fsync < FSYNC_INTERVAL:
+            return
+        for segment in self._segments.values():
+            segment.file.flush()
+            os.fsync(segment.file.fileno())
+        for f, _ in self._csv_files.values():
+            f.flush()
+        self._last_fsync = time.time()
+        self._dirty = False
+
+writer = LogWriter()
+atexit.register(writer.flush, 5)
+
+def flush_logs(timeout=None):
+    return writer.flush(timeout)
+
+_stats_offsets = {}
+_stats_follow_lock = threading.Lock()
+_stats_follower = None
+
+def _follow_stats():
+    # Per-worker logs: folds every worker's new log lines into the aggregates.
+    # This worker's own events are only counted from the log, like the others'.
+    writer.flush()
+    with _stats_follow_lock:
+        if not aggregator.loaded:
+            aggregator.rebuild(_iter_legacy(JSON_LOG), _iter_legacy(RATINGS_JSON))
+        interactions = [e for segment in segment_paths(PROMPTS_LOG) for e in _read_new(segment, _stats_offsets)]
+        ratings = [e for segment in segment_paths(RATINGS_LOG) for e in _read_new(segment, _stats_offsets)]
+        aggregator.extend(interactions, ratings)
+
+def _follow_loop():
+    while True:
+        time.sleep(STATS_REFRESH_SECONDS)
+        if LOG_PER_WORKER:
+            try:
+                _follow_stats()
+            except OSError:
+                pass
+
+def load_stats():
+    global _stats_follower
+    if LOG_PER_WORKER:
+        _follow_stats()
+        if _stats_follower is None:
+            # Keeps the ratings model=auto reads fresh between /stats calls.
+            _stats_follower = threading.Thread(target=_follow_loop, name='stats-follow', daemon=True)
+            _stats_follower.start()
+        return aggregator
+    # Rebuilds the /stats aggregates from the logs once per process. Logging
+    # holds the same lock while it records and enqueues, so every event is
+    # counted exactly once: either it is in the flushed log or it arrives after.
+    with aggregator.lock:
+        if not aggregator.loaded:
+            writer.flush()
+            aggregator.rebuild(iter_interactions(), iter_ratings())
+    return aggregator
+
+def interaction_entry(timestamp, prompt, model, response, latency, token_count, prompt_id, from_cache=False, fallback_used=False, **extra):
+    # `extra` carries optional per-request details (e.g. ttft_ms); they go to
+    # the JSON-lines log only, the CSV keeps its fixed columns.
     entry = {
         'timestamp': timestamp,
         'prompt': prompt,
@@ -22,54 +313,45 @@ def log_interaction(timestamp, prompt, model, response, latency, token_count, pr
         'token_count': token_count,
         'prompt_id': prompt_id,
         'rating': None,
-        'from_cache': from_cache
+        'from_cache': from_cache,
+        'fallback_used': fallback_used
     }
-    with log_lock:
-        # JSON log
-        if os.path.exists(JSON_LOG):
-            with open(JSON_LOG, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-        else:
-            data = []
-        data.append(entry)
-        with open(JSON_LOG, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        # CSV log
-        write_header = not os.path.exists(CSV_LOG)
-        with open(CSV_LOG, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=entry.keys())
-            if write_header:
-                writer.writeheader()
-            writer.writerow(entry)
+    if from_cache:
+        # `timestamp` is when the cached answer was generated; this is when it was served.
+        entry['served_at'] = datetime.utcnow().isoformat()
+    entry.update(extra)
+    return entry
+
+def log_interaction(timestamp, prompt, model, response, latency, token_count, prompt_id, from_cache=False, fallback_used=False, **extra):
+    entry = interaction_entry(timestamp, prompt, model, response, latency, token_count, prompt_id, from_cache, fallback_used, **extra)
+    with aggregator.lock:
+        if not LOG_PER_WORKER:
+            aggregator.record_interaction(entry)
+        writer.submit(PROMPTS_LOG, entry, CSV_LOG, INTERACTION_FIELDS)
+
+def log_interactions(entries):
+    # Bulk variant for entries built with interaction_entry(); one lock and
+    # one queue item for the whole batch.
+    with aggregator.lock:
+        if not LOG_PER_WORKER:
+            for entry in entries:
+                aggregator.record_interaction(entry)
+        writer.submit_many([(PROMPTS_LOG, entry, CSV_LOG, INTERACTION_FIELDS) for entry in entries])
 
 def log_rating(prompt_id, score, timestamp):
-    with log_lock:
-        # Update JSON log
-        if os.path.exists(JSON_LOG):
-            with open(JSON_LOG, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-        else:
-            data = []
-        for entry in data:
-            if entry['prompt_id'] == prompt_id:
-                entry['rating'] = score
-                entry['rating_timestamp'] = timestamp
-        with open(JSON_LOG, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        # Update CSV log
-        if os.path.exists(CSV_LOG):
-            rows = []
-            with open(CSV_LOG, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row['prompt_id'] == prompt_id:
-                        row['rating'] = score
-                        row['rating_timestamp'] = timestamp
-                    rows.append(row)
-            with open(CSV_LOG, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(f, fieldnames=rows[0].keys())
-                writer.writeheader()
-                writer.writerows(rows)
+    # Ratings are recorded as their own events and joined on prompt_id when
+    # read, instead of rewriting the interaction log in place.
+    entry = {
+        'timestamp': timestamp,
+        'prompt_id': prompt_id,
+        'model': None,
+        'rating': score,
+        'feedback': None
+    }
+    with aggregator.lock:
+        if not LOG_PER_WORKER:
+            aggregator.record_rating(entry)
+        writer.submit(RATINGS_LOG, entry, RATINGS_CSV, RATING_FIELDS)
 
 def log_rating_v2(prompt_id, model, rating, feedback, timestamp=None):
     if timestamp is None:
@@ -81,25 +363,12 @@ def log_rating_v2(prompt_id, model, rating, feedback, timestamp=None):
         'rating': rating,
         'feedback': feedback
     }
-    with log_lock:
-        # JSON log
-        if os.path.exists(RATINGS_JSON):
-            with open(RATINGS_JSON, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-        else:
-            data = []
-        data.append(entry)
-        with open(RATINGS_JSON, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        # CSV log
-        write_header = not os.path.exists(RATINGS_CSV)
-        with open(RATINGS_CSV, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=entry.keys())
-            if write_header:
-                writer.writeheader()
-            writer.writerow(entry)
+    with aggregator.lock:
+        if not LOG_PER_WORKER:
+            aggregator.record_rating(entry)
+        writer.submit(RATINGS_LOG, entry, RATINGS_CSV, RATING_FIELDS)
 
 def get_prompt_id(timestamp, prompt, model):
     import hashlib
     base = f'{timestamp}:{prompt}:{model}'
-    return hashlib.sha256(base.encode()).hexdigest()[:16] 
\ No newline at end of file
+    return hashlib.sha256(base.encode()).hexdigest()[:16]
@@ -0,0 +1,221 @@
+import os
+import json
+import glob
+import time
+import atexit
+import threading
+from bisect import bisect_left
+
+# Multiprocess mode: every worker snapshots its registry into this directory
+# and /metrics sums all snapshots, so any worker can answer a scrape.
+METRICS_DIR = os.getenv('LLM_ROUTER_METRICS_DIR', '')
+METRICS_FLUSH_INTERVAL = float(os.getenv('LLM_ROUTER_METRICS_FLUSH_SECONDS', '1'))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# For in-process stages that normally finish in micro- to milliseconds.
+FAST_BUCKETS = (0.00001, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5)
+
+# Updates come from the event loop and from the log writer, cache writer and
+# batch runner threads. A read-modify-write is not atomic under the GIL, so
+# each metric guards its series with its own lock; dump() copies under it.
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.series[label_values] = self.series.get(label_values, 0) + amount
+
+    def dump(self):
+        with self.lock:
+            return [[list(key), value] for key, value in self.series.items()]
+
+class Gauge(Counter):
+    # A value that goes up and down; worker snapshots still sum, so a queue
+    # depth reads as the total across workers.
+    kind = 'gauge'
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        bucket = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                # Per-bucket (not cumulative) counts, with a final +Inf slot, then sum.
+                series = self.series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bucket] += 1
+            series[-1] += value
+
+    def dump(self):
+        with self.lock:
+            return [[list(key), list(value)] for key, value in self.series.items()]
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, documentation, labels=()):
+        metric = Counter(name, documentation, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def gauge(self, name, documentation, labels=()):
+        metric = Gauge(name, documentation, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, documentation, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def snapshot(self):
+        return {m.name: m.dump() for m in self.metrics}
+
+    def merge(self, snapshots):
+        # Sums series across worker snapshots: counters add, histogram bucket
+        # counts and sums add element-wise.
+        merged = {m.name: {} for m in self.metrics}
+        for snapshot in snapshots:
+            for name, series in snapshot.items():
+                if name not in merged:
+                    continue
+                target = merged[name]
+                for key, value in series:
+                    key = tuple(key)
+                    if isinstance(value, list):
+                        current = target.get(key)
+                        target[key] = [a + b for a, b in zip(current, value)] if current else list(value)
+                    else:
+                        target[key] = target.get(key, 0) + value
+        return merged
+
+    def render(self, merged=None):
+        # Prometheus text exposition format (version 0.0.4).
+        if merged is None:
+            merged = {m.name: {tuple(key): value for key, value in m.dump()} for m in self.metrics}
+        lines = []
+        for m in self.metrics:
+            lines.append(f'# HELP {m.name} {m.documentation}')
+            lines.append(f'# TYPE {m.name} {m.kind}')
+            for key, value in sorted(merged.get(m.name, {}).items()):
+                labels = list(zip(m.labels, key))
+                if m.kind != 'histogram':
+                    lines.append(f'{m.name}{_labels(labels)} {_number(value)}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(m.buckets + (float('inf'),), value[:-1]):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else _number(bound)
+                    lines.append(f'{m.name}_bucket{_labels(labels + [("le", le)])} {cumulative}')
+                lines.append(f'{m.name}_sum{_labels(labels)} {_number(value[-1])}')
+                lines.append(f'{m.name}_count{_labels(labels)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+def _number(value):
+    return repr(value) if isinstance(value, float) else str(value)
+
+registry = Registry()
+
+request_duration = registry.histogram(
+    'llm_router_request_duration_seconds', 'End-to-end /chat latency.', ('endpoint', 'cache'))
+upstream_duration = registry.histogram(
+    'llm_router_upstream_duration_seconds', 'Provider call latency per model.', ('model', 'outcome'))
+cache_lookup_duration = registry.histogram(
+    'llm_router_cache_lookup_seconds', 'Response cache lookup time.', ('tier',), FAST_BUCKETS)
+log_write_duration = registry.histogram(
+    'llm_router_log_write_seconds', 'Log writer time per batch.', ('stage',), FAST_BUCKETS)
+template_render_duration = registry.histogram(
+    'llm_router_template_render_seconds', 'Prompt template render time.', (), FAST_BUCKETS)
+cache_requests = registry.counter(
+    'llm_router_cache_requests_total', 'Cache lookups by tier and result.', ('tier', 'result'))
+fallbacks = registry.counter(
+    'llm_router_fallbacks_total', 'Requests answered by a model other than the one requested.', ('requested', 'served'))
+provider_errors = registry.counter(
+    'llm_router_provider_errors_total', 'Failed provider calls by error class.', ('model', 'error'))
+retries = registry.counter(
+    'llm_router_retries_total', 'Same-model retries by error kind.', ('model', 'kind'))
+tokens = registry.counter(
+    'llm_router_tokens_total', 'Tokens sent to (in) and received from (out) each model.', ('model', 'direction'))
+ratelimit_queue_depth = registry.gauge(
+    'llm_router_ratelimit_queue_depth', 'Requests waiting in a rate limit queue.', ('model',))
+ratelimit_wait_duration = registry.histogram(
+    'llm_router_ratelimit_wait_seconds', 'Time spent in a rate limit queue, admitted or timed out.', ('model', 'outcome'))
+ratelimit_timeouts = registry.counter(
+    'llm_router_ratelimit_timeouts_total', 'Requests that gave up waiting in a rate limit queue.', ('model',))
+ratelimit_throttled = registry.counter(
+    'llm_router_ratelimit_throttled_total', 'Provider Retry-After penalties applied to a lane.', ('model',))
+
+def _snapshot_path(pid=None):
+    return os.path.join(METRICS_DIR, f'metrics-{pid or os.getpid()}.json')
+
+def write_snapshot():
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = _snapshot_path()
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(registry.snapshot(), f)
+    os.replace(tmp, path)
+
+def _flush_loop():
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        try:
+            write_snapshot()
+        except OSError:
+            pass
+
+_flusher = None
+_flusher_lock = threading.Lock()
+
+def start_multiprocess_flush():
+    global _flusher
+    if not METRICS_DIR or _flusher is not None:
+        return
+    with _flusher_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, name='metrics-flush', daemon=True)
+            _flusher.start()
+            atexit.register(write_snapshot)
+
+def render_metrics():
+    if not METRICS_DIR:
+        return registry.render()
+    # Our own numbers are always fresh; other workers' are at most one flush old.
+    write_snapshot()
+    snapshots = []
+    for path in glob.glob(os.path.join(METRICS_DIR, 'metrics-*.json')):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return registry.render(registry.merge(snapshots))
@@ -0,0 +1,63 @@
+# One-shot migration of the legacy JSON-array logs to the append-only
+# JSON-lines format read by utils.logger, and of CSV logs written before
+# columns were added to the current header. Run it with the server stopped.
+#
+#   python -m utils.migrate_logs [--log-dir logs]
+import os
+import csv
+import json
+import argparse
+from utils import logger
+
+def migrate(legacy_path, jsonl_path):
+    if not os.path.exists(legacy_path):
+        return 0
+    with open(legacy_path, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+    base, ext = os.path.splitext(jsonl_path)
+    target = f'{base}.legacy{ext}'
+    tmp = target + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, target)
+    # Keep the original around, but out of the reader's path so nothing is counted twice.
+    os.replace(legacy_path, legacy_path + '.migrated')
+    return len(entries)
+
+def migrate_csv(path, fields):
+    # Rewrites `path` with the `fields` header, leaving new columns empty on
+    # old rows. Returns the number of rows, or 0 when it was already current.
+    if not os.path.exists(path) or logger._csv_header(path) in (None, list(fields)):
+        return 0
+    tmp = path + '.tmp'
+    count = 0
+    with open(path, newline='', encoding='utf-8') as src, open(tmp, 'w', newline='', encoding='utf-8') as dst:
+        writer = csv.DictWriter(dst, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+        for row in csv.DictReader(src):
+            writer.writerow(row)
+            count += 1
+        dst.flush()
+        os.fsync(dst.fileno())
+    os.replace(tmp, path)
+    return count
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Migrate prompts.json/ratings.json to JSON-lines logs and old CSV logs to the current columns.')
+    parser.add_argument('--log-dir', default=logger.LOG_DIR)
+    args = parser.parse_args(argv)
+    for name in ('prompts', 'ratings'):
+        legacy = os.path.join(args.log_dir, f'{name}.json')
+        count = migrate(legacy, os.path.join(args.log_dir, f'{name}.jsonl'))
+        print(f'{legacy}: migrated {count} entries')
+    for name, fields in (('prompts', logger.INTERACTION_FIELDS), ('ratings', logger.RATING_FIELDS)):
+        for path in logger.segment_paths(os.path.join(args.log_dir, f'{name}.csv')):
+            count = migrate_csv(path, fields)
+            if count:
+                print(f'{path}: rewrote {count} rows with the current columns')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,363 @@
+import os
+import time
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from models.errors import RateLimitError
+from models.registry import provider_for
+from utils import metrics
+
+def _parse_limits(value):
+    # "groq=30/6000/8,gemini-2.5-pro=5/250000" -> requests per minute / tokens
+    # per minute / concurrent requests; 0 or a missing field means unlimited.
+    limits = {}
+    for item in filter(None, (v.strip() for v in value.split(','))):
+        name, _, spec = item.rpartition('=')
+        if not name:
+            continue
+        fields = [float(f) if f else 0.0 for f in spec.split('/')] + [0.0, 0.0, 0.0]
+        limits[name] = (fields[0], fields[1], int(fields[2]))
+    return limits
+
+# Entries may name a provider or a single model; model entries win. Limits
+# apply per (API key, model), matching how Groq and Gemini account usage.
+RATE_LIMITS = _parse_limits(os.getenv('LLM_ROUTER_RATE_LIMITS', ''))
+# How long a request may queue for a permit before the next fallback is tried.
+RATE_LIMIT_MAX_WAIT = float(os.getenv('LLM_ROUTER_RATE_LIMIT_MAX_WAIT', '10'))
+# Completion size is unknown up front; this much is reserved and settled afterwards.
+EXPECTED_COMPLETION_TOKENS = int(os.getenv('LLM_ROUTER_EXPECTED_COMPLETION_TOKENS', '512'))
+# Back-off after a 429 that did not say how long to wait.
+DEFAULT_PENALTY = 5.0
+# Set to share buckets between uvicorn workers on one host.
+RATE_LIMIT_DB = os.getenv('LLM_ROUTER_RATE_LIMIT_DB', '')
+
+class RateLimitTimeout(RateLimitError):
+    # Raised locally when a permit would not be granted before the deadline.
+    pass
+
+class TokenBucket:
+    # `rate` tokens per second with bursts up to `capacity`. acquire() waits
+    # for tokens instead of failing, so callers are paced rather than rejected.
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens=1):
+        # Returns 0 on success, otherwise the seconds until `tokens` are available.
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0.0
+            return (tokens - self.tokens) / self.rate
+
+    async def acquire(self, tokens=1):
+        tokens = min(tokens, self.capacity)
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+def _refilled(state, rate, capacity, now):
+    if state is None:
+        return capacity
+    tokens, updated = state
+    return min(capacity, tokens + (now - updated) * rate)
+
+class MemoryBackend:
+    # Bucket state for a single process.
+    blocking = False
+
+    def __init__(self):
+        self._buckets = {}
+        self._blocked = {}
+        self._lock = threading.Lock()
+
+    def take(self, lane, buckets):
+        # All-or-nothing: returns 0 after taking `amount` from every bucket,
+        # otherwise the seconds until that would succeed.
+        now = time.time()
+        with self._lock:
+            blocked = self._blocked.get(lane, 0.0)
+            if blocked > now:
+                return blocked - now
+            levels = []
+            wait = 0.0
+            for name, rate, capacity, amount in buckets:
+                tokens = _refilled(self._buckets.get(name), rate, capacity, now)
+                if tokens < amount:
+                    wait = max(wait, (amount - tokens) / rate)
+                levels.append((name, tokens - amount))
+            if not wait:
+                for name, tokens in levels:
+                    self._buckets[name] = (tokens, now)
+            return wait
+
+    def refund(self, name, rate, capacity, amount):
+        now = time.time()
+        with self._lock:
+            self._buckets[name] = (min(capacity, _refilled(self._buckets.get(name), rate, capacity, now) + amount), now)
+
+    def block(self, lane, until):
+        with self._lock:
+            self._blocked[lane] = max(until, self._blocked.get(lane, 0.0))
+
+    def blocked_until(self, lane):
+        return self._blocked.get(lane, 0.0)
+
+class SQLiteBackend:
+    # Same bucket math, stored in a local SQLite file so every worker on the
+    # host draws from one budget. BEGIN IMMEDIATE serializes the read-modify-write.
+    blocking = True
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute('CREATE TABLE IF NOT EXISTS rate_limit_buckets (name TEXT PRIMARY KEY, tokens REAL, updated REAL)')
+        conn.execute('CREATE TABLE IF NOT EXISTS rate_limit_blocks (lane TEXT PRIMARY KEY, until REAL)')
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self, fn):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            result = fn(conn, time.time())
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return result
+
+    def take(self, lane, buckets):
+        def run(conn, now):
+            row = conn.execute('SELECT until FROM rate_limit_blocks WHERE lane = ?', (lane,)).fetchone()
+            if row and row[0] > now:
+                return row[0] - now
+            levels = []
+            wait = 0.0
+            for name, rate, capacity, amount in buckets:
+                state = conn.execute('SELECT tokens, updated FROM rate_limit_buckets WHERE name = ?', (name,)).fetchone()
+                tokens = _refilled(state, rate, capacity, now)
+                if tokens < amount:
+                    wait = max(wait, (amount - tokens) / rate)
+                levels.append((name, tokens - amount, now))
+            if not wait:
+                conn.executemany('INSERT OR REPLACE INTO rate_limit_buckets (name, tokens, updated) VALUES (?, ?, ?)', levels)
+            return wait
+        return self._transaction(run)
+
+    def refund(self, name, rate, capacity, amount):
+        def run(conn, now):
+            state = conn.execute('SELECT tokens, updated FROM rate_limit_buckets WHERE name = ?', (name,)).fetchone()
+            tokens = min(capacity, _refilled(state, rate, capacity, now) + amount)
+            conn.execute('INSERT OR REPLACE INTO rate_limit_buckets (name, tokens, updated) VALUES (?, ?, ?)', (name, tokens, now))
+        self._transaction(run)
+
+    def block(self, lane, until):
+        self._transaction(lambda conn, now: conn.execute(
+            'INSERT INTO rate_limit_blocks (lane, until) VALUES (?, ?) '
+            'ON CONFLICT(lane) DO UPDATE SET until = max(until, excluded.until)', (lane, until)))
+
+    def blocked_until(self, lane):
+        row = self._conn().execute('SELECT until FROM rate_limit_blocks WHERE lane = ?', (lane,)).fetchone()
+        return row[0] if row else 0.0
+
+class Lane:
+    def __init__(self, name, model, key_id, rpm, tpm, concurrency):
+        self.name = name
+        self.model = model
+        self.key_id = key_id
+        self.rpm = rpm
+        self.tpm = tpm
+        self.concurrency = concurrency
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.timeouts = 0
+        self.throttled = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.release_waiters = []
+
+    def buckets(self, tokens):
+        buckets = []
+        if self.rpm:
+            buckets.append((f'{self.name}:rpm', self.rpm / 60.0, self.rpm, 1))
+        if self.tpm:
+            buckets.append((f'{self.name}:tpm', self.tpm / 60.0, self.tpm, min(tokens, self.tpm)))
+        return buckets
+
+class Permit:
+    def __init__(self, limiter, lane, tokens):
+        self.limiter = limiter
+        self.lane = lane
+        # What the tpm bucket was actually charged: one request never takes
+        # more than the bucket holds (see Lane.buckets).
+        self.tokens = min(tokens, lane.tpm) if lane.tpm else 0
+        self.released = False
+
+    def release(self, actual_tokens=None):
+        # Frees the concurrency slot and, when the real usage is known, returns
+        # (or charges) the difference from the up-front token estimate.
+        if self.released:
+            return
+        self.released = True
+        self.limiter._release(self.lane)
+        lane = self.lane
+        if not lane.tpm or actual_tokens is None:
+            return
+        actual_tokens = min(actual_tokens, lane.tpm)
+        if actual_tokens != self.tokens:
+            self.limiter.backend.refund(f'{lane.name}:tpm', lane.tpm / 60.0, lane.tpm, self.tokens - actual_tokens)
+
+class RateLimiter:
+    # Paces requests per (API key, model) with request and token buckets plus
+    # an optional concurrency cap. Callers queue for a permit up to a deadline
+    # instead of sending a request the provider would reject with a 429.
+    def __init__(self, limits=None, backend=None, max_wait=RATE_LIMIT_MAX_WAIT):
+        self.limits = RATE_LIMITS if limits is None else limits
+        self.backend = backend or (SQLiteBackend(RATE_LIMIT_DB) if RATE_LIMIT_DB else MemoryBackend())
+        self.max_wait = max_wait
+        self.lanes = {}
+        self._lock = threading.Lock()
+
+    def _lane(self, model, api_key):
+        key_id = hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:8] if api_key else 'nokey'
+        name = f'{key_id}:{model}'
+        lane = self.lanes.get(name)
+        if lane is None:
+            rpm, tpm, concurrency = self.limits.get(model) or self.limits.get(provider_for(model)) or (0.0, 0.0, 0)
+            with self._lock:
+                lane = self.lanes.setdefault(name, Lane(name, model, key_id, rpm, tpm, concurrency))
+        return lane
+
+    async def acquire(self, model, api_key, tokens, max_wait=None):
+        lane = self._lane(model, api_key)
+        max_wait = self.max_wait if max_wait is None else max_wait
+        buckets = lane.buckets(tokens)
+        start = time.monotonic()
+        deadline = start + max_wait
+        with self._lock:
+            lane.waiting += 1
+        metrics.ratelimit_queue_depth.inc(model)
+        try:
+            while True:
+                wait = await self._try_admit(lane, buckets)
+                if wait == 0:
+                    break
+                remaining = deadline - time.monotonic()
+                slot_wait = isinstance(wait, asyncio.Future)
+                if remaining <= 0 or (not slot_wait and wait > remaining):
+                    if slot_wait:
+                        wait.cancel()
+                    with self._lock:
+                        lane.timeouts += 1
+                    metrics.ratelimit_timeouts.inc(model)
+                    metrics.ratelimit_wait_duration.observe(time.monotonic() - start, model, 'timeout')
+                    raise RateLimitTimeout(
+                        f'Rate limit queue for {model} exceeded its {max_wait:.1f}s deadline',
+                        retry_after=None if slot_wait else wait
+                    )
+                if slot_wait:
+                    try:
+                        await asyncio.wait_for(wait, remaining)
+                    except asyncio.TimeoutError:
+                        pass
+                else:
+                    await asyncio.sleep(wait)
+        finally:
+            with self._lock:
+                lane.waiting -= 1
+            metrics.ratelimit_queue_depth.dec(model)
+        waited = time.monotonic() - start
+        metrics.ratelimit_wait_duration.observe(waited, model, 'admitted')
+        with self._lock:
+            lane.admitted += 1
+            lane.wait_total += waited
+            lane.wait_max = max(lane.wait_max, waited)
+        return Permit(self, lane, tokens)
+
+    async def _try_admit(self, lane, buckets):
+        # 0 when admitted; at the concurrency cap, a future resolved by the next
+        # release; otherwise the seconds until the buckets (or a Retry-After
+        # block) allow it.
+        with self._lock:
+            if lane.concurrency and lane.active >= lane.concurrency:
+                future = asyncio.get_running_loop().create_future()
+                lane.release_waiters.append(future)
+                return future
+            lane.active += 1
+        try:
+            if self.backend.blocking:
+                wait = await asyncio.to_thread(self.backend.take, lane.name, buckets)
+            else:
+                wait = self.backend.take(lane.name, buckets)
+        except BaseException:
+            self._release(lane)
+            raise
+        if wait:
+            self._release(lane)
+        return wait
+
+    def _release(self, lane):
+        with self._lock:
+            lane.active -= 1
+            waiters, lane.release_waiters = lane.release_waiters, []
+        # Waiters may belong to another thread's event loop.
+        for future in waiters:
+            if not future.done():
+                future.get_loop().call_soon_threadsafe(_resolve, future)
+
+    def penalize(self, model, api_key, retry_after=None):
+        # Honours a provider's Retry-After: nothing is admitted on this lane
+        # until it passes, so queued requests wait instead of collecting 429s.
+        lane = self._lane(model, api_key)
+        with self._lock:
+            lane.throttled += 1
+        metrics.ratelimit_throttled.inc(model)
+        self.backend.block(lane.name, time.time() + (retry_after if retry_after is not None else DEFAULT_PENALTY))
+
+    def snapshot(self):
+        now = time.time()
+        with self._lock:
+            lanes = list(self.lanes.values())
+        return {
+            lane.name: {
+                'model': lane.model,
+                'key': lane.key_id,
+                'limits': {'rpm': lane.rpm, 'tpm': lane.tpm, 'concurrency': lane.concurrency},
+                'active': lane.active,
+                'queue_depth': lane.waiting,
+                'admitted': lane.admitted,
+                'timeouts': lane.timeouts,
+                'throttled': lane.throttled,
+                'avg_wait_ms': round(lane.wait_total / lane.admitted * 1000, 1) if lane.admitted else 0.0,
+                'max_wait_ms': round(lane.wait_max * 1000, 1),
+                'blocked_for_s': round(max(0.0, self.backend.blocked_until(lane.name) - now), 1)
+            }
+            for lane in lanes
+        }
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+limiter = RateLimiter()
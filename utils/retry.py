@@ -0,0 +1,64 @@
+import os
+import time
+import random
+from models.errors import classify, RATE_LIMIT, TRANSIENT, AUTH, SAFETY
+from models.registry import provider_for
+
+# Same-model retries for transient failures and 429s, under one deadline per
+# request that fallbacks share. Auth failures and safety blocks rule out the
+# other models behind the same provider; invalid requests stop the request.
+RETRY_MAX_ATTEMPTS = int(os.getenv('LLM_ROUTER_RETRY_ATTEMPTS', '3'))
+RETRY_BASE_DELAY = float(os.getenv('LLM_ROUTER_RETRY_BASE_MS', '250')) / 1000
+RETRY_MAX_DELAY = float(os.getenv('LLM_ROUTER_RETRY_MAX_MS', '4000')) / 1000
+RETRY_BUDGET = float(os.getenv('LLM_ROUTER_RETRY_BUDGET_SECONDS', '30'))
+
+def backoff(attempt, base=None, cap=None):
+    # "Full jitter": uniform over [0, min(cap, base * 2^attempt)], so retries
+    # from concurrent requests don't arrive in lockstep.
+    base = RETRY_BASE_DELAY if base is None else base
+    cap = RETRY_MAX_DELAY if cap is None else cap
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+class RetryBudget:
+    # Per-request state shared by every attempt on every candidate model.
+    def __init__(self, budget=RETRY_BUDGET, max_attempts=RETRY_MAX_ATTEMPTS):
+        self.deadline = time.monotonic() + budget
+        self.max_attempts = max(1, max_attempts)
+        self.retries = {}
+        self.kinds = {}
+        self.ruled_out = set()
+
+    def remaining(self):
+        return max(0.0, self.deadline - time.monotonic())
+
+    def retry_delay(self, error, attempt):
+        # Seconds to wait before retrying the same model after its `attempt`-th
+        # failure (0-based), or None when it shouldn't be retried. For 429s the
+        # wait is left to the rate limiter, which holds the lane until Retry-After.
+        if attempt + 1 >= self.max_attempts:
+            return None
+        kind = classify(error)
+        if kind == RATE_LIMIT:
+            delay = getattr(error, 'retry_after', None) or 0.0
+        elif kind == TRANSIENT:
+            delay = backoff(attempt)
+        else:
+            return None
+        return delay if delay < self.remaining() else None
+
+    def record_retry(self, model):
+        self.retries[model] = self.retries.get(model, 0) + 1
+
+    def record_failure(self, model, error):
+        kind = classify(error)
+        self.kinds[model] = kind
+        if kind in (AUTH, SAFETY):
+            # Same key / same content filter: its sibling models fail the same way.
+            self.ruled_out.add(provider_for(model))
+        return kind
+
+    def can_help(self, model):
+        return provider_for(model) not in self.ruled_out
+
+    def total_retries(self):
+        return sum(self.retries.values())
@@ -0,0 +1,336 @@
+import os
+import time
+import sqlite3
+import threading
+from collections import deque
+from models.registry import AVAILABLE_MODELS, provider_for, provider_configured
+from models.errors import RateLimitError
+from utils.stats import aggregator
+from utils.accounting import ledger, blended_price
+
+# Fallback chains per provider, tried after the requested model. Override with
+# e.g. LLM_ROUTER_FALLBACKS_GROQ="llama-3.1-8b-instant,llama-3.3-70b-versatile".
+DEFAULT_FALLBACKS = {
+    'groq': ['llama-3.1-8b-instant'],
+    'gemini': ['gemini-2.5-flash']
+}
+FALLBACKS = {
+    provider: [m for m in os.getenv(f'LLM_ROUTER_FALLBACKS_{provider.upper()}', ','.join(models)).split(',') if m]
+    for provider, models in DEFAULT_FALLBACKS.items()
+}
+PROVIDER_LABELS = {'groq': 'Llama/Groq', 'gemini': 'Gemini/Google'}
+
+FAILURE_THRESHOLD = int(os.getenv('LLM_ROUTER_CIRCUIT_FAILURES', '3'))
+BASE_COOLDOWN = float(os.getenv('LLM_ROUTER_CIRCUIT_COOLDOWN', '10'))
+MAX_COOLDOWN = float(os.getenv('LLM_ROUTER_CIRCUIT_MAX_COOLDOWN', '300'))
+DEFAULT_RETRY_AFTER = 10.0
+LATENCY_WINDOW = 100
+DEFAULT_LATENCY_MS = 1500.0
+EWMA_ALPHA = 0.1
+# Per-attempt timeout: the provider's HTTP timeout until we have enough
+# samples, then a multiple of the model's rolling p95.
+MAX_ATTEMPT_TIMEOUT = float(os.getenv('LLM_ROUTER_HTTP_TIMEOUT', '30'))
+MIN_ATTEMPT_TIMEOUT = float(os.getenv('LLM_ROUTER_MIN_ATTEMPT_TIMEOUT', '5'))
+TIMEOUT_P95_MULTIPLIER = 4.0
+MIN_SAMPLES_FOR_TIMEOUT = 20
+
+def _parse_weights(value):
+    weights = {'latency': 1.0, 'cost': 0.5, 'rating': 1.0}
+    for item in filter(None, (v.strip() for v in value.split(','))):
+        name, _, weight = item.partition('=')
+        if name in weights:
+            weights[name] = float(weight)
+    return weights
+
+AUTO_WEIGHTS = _parse_weights(os.getenv('LLM_ROUTER_AUTO_WEIGHTS', ''))
+# Multiplier on the cost weight for models close to a spend budget.
+BUDGET_COST_BOOST = 4.0
+
+# Set to share open circuits and rate-limit parking between workers on one
+# host; latency and error-rate history stays per process.
+HEALTH_DB = os.getenv('LLM_ROUTER_HEALTH_DB', '')
+HEALTH_SYNC_INTERVAL = float(os.getenv('LLM_ROUTER_HEALTH_SYNC_SECONDS', '0.5'))
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+class Probe:
+    # allow()'s answer when it admits the single half-open probe; only the
+    # request holding it can hand it back with release().
+    __slots__ = ()
+
+def is_rate_limit_error(exc):
+    if isinstance(exc, RateLimitError):
+        return True
+    text = str(exc).lower()
+    return '429' in text or 'rate limit' in text or 'quota' in text or 'resource exhausted' in text
+
+class ModelHealth:
+    def __init__(self):
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.ewma_latency_ms = None
+        self.error_rate = 0.0
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.state = CLOSED
+        self.open_until = 0.0
+        self.cooldown = BASE_COOLDOWN
+        # The Probe handed out by allow() while half-open, if any.
+        self.probing = None
+        self.rate_limited_until = 0.0
+        self.synced = 0.0
+
+    def p95(self):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+class SharedHealth:
+    # Circuit and rate-limit deadlines in a local SQLite file. A worker that
+    # opens a circuit, gets throttled or closes a circuit again publishes it;
+    # the others pick it up on their next sync.
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._conn().execute('CREATE TABLE IF NOT EXISTS model_health '
+                             '(model TEXT PRIMARY KEY, open_until REAL, rate_limited_until REAL, updated REAL)')
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def publish(self, model, open_until=None, rate_limited_until=None):
+        # open_until=0 records that the circuit closed.
+        now = time.time()
+        conn = self._conn()
+        if open_until is not None:
+            conn.execute('INSERT INTO model_health (model, open_until, rate_limited_until, updated) VALUES (?, ?, 0, ?) '
+                         'ON CONFLICT(model) DO UPDATE SET open_until = excluded.open_until, updated = excluded.updated',
+                         (model, open_until, now))
+        if rate_limited_until is not None:
+            conn.execute('INSERT INTO model_health (model, open_until, rate_limited_until, updated) VALUES (?, 0, ?, ?) '
+                         'ON CONFLICT(model) DO UPDATE SET rate_limited_until = max(rate_limited_until, excluded.rate_limited_until), '
+                         'updated = excluded.updated', (model, rate_limited_until, now))
+
+    def read(self):
+        return self._conn().execute('SELECT model, open_until, rate_limited_until, updated FROM model_health').fetchall()
+
+class Router:
+    # Keeps rolling latency, error-rate, rate-limit and circuit-breaker state per
+    # model and turns it into an ordered list of candidates for each request.
+    def __init__(self, shared_path=HEALTH_DB):
+        self.health = {}
+        self._lock = threading.Lock()
+        self.shared = SharedHealth(shared_path) if shared_path else None
+        self._synced = 0.0
+
+    def _sync(self, now):
+        # Applies state other workers published since we last looked.
+        if self.shared is None or now - self._synced < HEALTH_SYNC_INTERVAL:
+            return
+        self._synced = now
+        try:
+            rows = self.shared.read()
+        except sqlite3.Error:
+            return
+        with self._lock:
+            for model, open_until, rate_limited_until, updated in rows:
+                health = self._health(model)
+                if updated <= health.synced:
+                    continue
+                health.synced = updated
+                health.rate_limited_until = max(health.rate_limited_until, rate_limited_until)
+                if open_until > now:
+                    if health.state == CLOSED or health.open_until < open_until:
+                        health.state = OPEN
+                        health.open_until = open_until
+                        health.probing = None
+                elif open_until == 0 and health.state != CLOSED:
+                    health.state = CLOSED
+                    health.consecutive_failures = 0
+                    health.cooldown = BASE_COOLDOWN
+                    health.probing = None
+
+    def _publish(self, model, **state):
+        if self.shared is None:
+            return
+        try:
+            self.shared.publish(model, **state)
+        except sqlite3.Error:
+            # Sharing is best effort; this worker's own view still applies.
+            pass
+
+    def _health(self, model):
+        health = self.health.get(model)
+        if health is None:
+            health = self.health.setdefault(model, ModelHealth())
+        return health
+
+    def allow(self, model, now=None):
+        # False while the circuit is open, the model is rate limited or a
+        # daily spend budget covering it is used up. After the cooldown a
+        # single probe request is let through (half-open) and gets a Probe
+        # instead of True; pass it to release().
+        if not ledger.allow(model):
+            return False
+        now = now or time.time()
+        self._sync(now)
+        with self._lock:
+            health = self._health(model)
+            if health.rate_limited_until > now:
+                return False
+            if health.state == OPEN:
+                if now < health.open_until:
+                    return False
+                health.state = HALF_OPEN
+                health.probing = None
+            if health.state == HALF_OPEN:
+                if health.probing is not None:
+                    return False
+                health.probing = Probe()
+                return health.probing
+            return True
+
+    def release(self, model, admitted):
+        # Hands back the half-open probe allow() gave out when the attempt
+        # ended without a verdict on the model (cancelled, queued too long,
+        # or the request itself was rejected). `admitted` is what allow()
+        # returned; requests that didn't get the probe can't free it.
+        if not isinstance(admitted, Probe):
+            return
+        with self._lock:
+            health = self.health.get(model)
+            if health is not None and health.probing is admitted:
+                health.probing = None
+
+    def record_success(self, model, latency_ms):
+        with self._lock:
+            health = self._health(model)
+            reopened = health.state != CLOSED
+            health.successes += 1
+            health.consecutive_failures = 0
+            health.latencies.append(latency_ms)
+            if health.ewma_latency_ms is None:
+                health.ewma_latency_ms = float(latency_ms)
+            else:
+                health.ewma_latency_ms += EWMA_ALPHA * (latency_ms - health.ewma_latency_ms)
+            health.error_rate *= (1 - EWMA_ALPHA)
+            health.state = CLOSED
+            health.probing = None
+            health.cooldown = BASE_COOLDOWN
+        if reopened:
+            self._publish(model, open_until=0)
+
+    def record_failure(self, model, error=None, retry_after=None):
+        now = time.time()
+        with self._lock:
+            health = self._health(model)
+            health.failures += 1
+            health.error_rate = health.error_rate * (1 - EWMA_ALPHA) + EWMA_ALPHA
+            if error is not None and is_rate_limit_error(error):
+                # Throttling says nothing about the model being broken; park it
+                # until the limit resets instead of tripping the breaker.
+                health.rate_limited_until = now + (retry_after or DEFAULT_RETRY_AFTER)
+                health.probing = None
+                published = {'rate_limited_until': health.rate_limited_until}
+            else:
+                health.consecutive_failures += 1
+                opened = health.state == HALF_OPEN or (health.state == CLOSED and health.consecutive_failures >= FAILURE_THRESHOLD)
+                if health.state == HALF_OPEN:
+                    health.cooldown = min(health.cooldown * 2, MAX_COOLDOWN)
+                    health.state = OPEN
+                    health.open_until = now + health.cooldown
+                elif health.consecutive_failures >= FAILURE_THRESHOLD:
+                    health.state = OPEN
+                    health.open_until = now + health.cooldown
+                health.probing = None
+                published = {'open_until': health.open_until} if opened else None
+        if published:
+            self._publish(model, **published)
+
+    def attempt_timeout(self, model):
+        health = self.health.get(model)
+        if health is None or len(health.latencies) < MIN_SAMPLES_FOR_TIMEOUT:
+            return MAX_ATTEMPT_TIMEOUT
+        p95 = health.p95() / 1000.0
+        return max(MIN_ATTEMPT_TIMEOUT, min(MAX_ATTEMPT_TIMEOUT, p95 * TIMEOUT_P95_MULTIPLIER))
+
+    def expected_latency(self, model):
+        health = self.health.get(model)
+        if health is None or health.ewma_latency_ms is None:
+            return DEFAULT_LATENCY_MS
+        # Penalize flaky models: a failed attempt costs roughly one more call.
+        return health.ewma_latency_ms * (1 + health.error_rate)
+
+    def candidates(self, model):
+        # Requested model first, then its provider's fallbacks ordered by
+        # expected latency. Close to a spend budget, the cheapest go first
+        # instead. Callers skip any candidate allow() rejects.
+        provider = provider_for(model)
+        fallbacks = [m for m in FALLBACKS.get(provider, []) if m != model]
+        fallbacks.sort(key=self.expected_latency)
+        if ledger.near_budget(model):
+            return sorted([model] + fallbacks, key=blended_price)
+        return [model] + fallbacks
+
+    def rank_auto(self, models=None):
+        # Lower score is better: normalized latency and cost, minus normalized
+        # average rating from /rate. Weights come from LLM_ROUTER_AUTO_WEIGHTS.
+        # Cost is the accounting price (utils/accounting.py), so auto ranking
+        # and budget-aware candidates() agree; unpriced models count as mid-priced.
+        models = [m for m in (models or AVAILABLE_MODELS) if provider_configured(provider_for(m))]
+        if not models:
+            return []
+        latencies = {m: self.expected_latency(m) for m in models}
+        max_latency = max(latencies.values()) or 1.0
+        prices = {m: blended_price(m) for m in models}
+        max_price = max((p for p in prices.values() if p != float('inf')), default=0.0) or 1.0
+        scores = {}
+        for m in models:
+            stats = aggregator.models.get(m)
+            rating = (stats.rating_sum / stats.rating_count) if stats and stats.rating_count else 3.0
+            # Cost counts for more once a budget covering the model is close.
+            cost_weight = AUTO_WEIGHTS['cost'] * (BUDGET_COST_BOOST if ledger.near_budget(m) else 1)
+            scores[m] = (
+                AUTO_WEIGHTS['latency'] * latencies[m] / max_latency
+                + cost_weight * (prices[m] / max_price if prices[m] != float('inf') else 0.5)
+                - AUTO_WEIGHTS['rating'] * rating / 5.0
+            )
+        now = time.time()
+        available = [m for m in models if self._available(m, now)]
+        return sorted(available or models, key=scores.get)
+
+    def _available(self, model, now):
+        if not ledger.allow(model):
+            return False
+        health = self.health.get(model)
+        if health is None:
+            return True
+        if health.rate_limited_until > now:
+            return False
+        return not (health.state == OPEN and now < health.open_until)
+
+    def snapshot(self):
+        now = time.time()
+        with self._lock:
+            return {
+                m: {
+                    'state': h.state if not (h.state == OPEN and now >= h.open_until) else HALF_OPEN,
+                    'ewma_latency_ms': round(h.ewma_latency_ms, 1) if h.ewma_latency_ms is not None else None,
+                    'p95_latency_ms': h.p95(),
+                    'error_rate': round(h.error_rate, 4),
+                    'successes': h.successes,
+                    'failures': h.failures,
+                    'rate_limited_for_s': round(max(0.0, h.rate_limited_until - now), 1),
+                    'open_for_s': round(max(0.0, h.open_until - now), 1) if h.state == OPEN else 0.0
+                }
+                for m, h in self.health.items()
+            }
+
+router = Router()
@@ -0,0 +1,272 @@
+import os
+import re
+import time
+import zlib
+import threading
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+SEMANTIC_CACHE_ENABLED = os.getenv('LLM_ROUTER_SEMANTIC_CACHE', '0') == '1' and np is not None
+EMBED_DIM = int(os.getenv('LLM_ROUTER_SEMANTIC_DIM', '256'))
+DEFAULT_THRESHOLD = float(os.getenv('LLM_ROUTER_SEMANTIC_THRESHOLD', '0.9'))
+MAX_ENTRIES_PER_MODEL = int(os.getenv('LLM_ROUTER_SEMANTIC_MAX_ENTRIES', '1000000'))
+# Below this size a brute-force matrix product beats building an ANN graph.
+ANN_MIN_ENTRIES = int(os.getenv('LLM_ROUTER_SEMANTIC_ANN_MIN_ENTRIES', '50000'))
+# Nearest neighbours checked per lookup: the best one may fail the exact-token
+# or expiry check while a slightly less similar one passes.
+SEARCH_K = int(os.getenv('LLM_ROUTER_SEMANTIC_SEARCH_K', '5'))
+
+def _parse_thresholds(value):
+    # "gemini-2.5-pro=0.95,llama-3.1-8b-instant=0.85"
+    thresholds = {}
+    for item in filter(None, (v.strip() for v in value.split(','))):
+        model, _, threshold = item.rpartition('=')
+        if model:
+            thresholds[model] = float(threshold)
+    return thresholds
+
+MODEL_THRESHOLDS = _parse_thresholds(os.getenv('LLM_ROUTER_SEMANTIC_THRESHOLDS', ''))
+
+_CONTRACTIONS = {
+    "what's": 'what is', "who's": 'who is', "where's": 'where is', "how's": 'how is',
+    "it's": 'it is', "that's": 'that is', "there's": 'there is', "i'm": 'i am',
+    "don't": 'do not', "doesn't": 'does not', "can't": 'can not', "won't": 'will not',
+    "isn't": 'is not', "aren't": 'are not', "you're": 'you are', "let's": 'let us'
+}
+_CONTRACTION_RE = re.compile('|'.join(re.escape(k) for k in _CONTRACTIONS))
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+# Tokens that change the answer however similar the rest of the prompt is
+# ("a 10 year old" vs "a 12 year old"): a hit needs the same set of them.
+_NEGATIONS = frozenset({'not', 'no', 'never', 'without'})
+
+def threshold_for(model):
+    return MODEL_THRESHOLDS.get(model, DEFAULT_THRESHOLD)
+
+def _tokens(text):
+    text = _CONTRACTION_RE.sub(lambda m: _CONTRACTIONS[m.group(0)], text.lower().replace('’', "'"))
+    return _TOKEN_RE.findall(text)
+
+def exact_tokens(text):
+    return frozenset(t for t in _tokens(text) if t in _NEGATIONS or any(c.isdigit() for c in t))
+
+def _features(text):
+    tokens = _tokens(text)
+    joined = f" {' '.join(tokens)} "
+    words = [f'w:{t}'.encode() for t in tokens]
+    trigrams = [joined[i:i + 3].encode() for i in range(len(joined) - 2)]
+    return words, trigrams
+
+def embed(text, dim=EMBED_DIM):
+    # Hashed word + character-trigram features, signed to reduce collision
+    # bias, then L2-normalized so a dot product is the cosine similarity.
+    words, trigrams = _features(text)
+    hashes = [zlib.crc32(f) for f in words + trigrams]
+    vec = np.zeros(dim, dtype=np.float32)
+    if not hashes:
+        return vec
+    hashes = np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+    weights = np.ones(len(hashes), dtype=np.float32)
+    weights[:len(words)] = 2.0
+    signs = np.where((hashes >> np.uint64(31)) & np.uint64(1), -1.0, 1.0).astype(np.float32)
+    vec += np.bincount((hashes % np.uint64(dim)).astype(np.int64), weights=weights * signs, minlength=dim).astype(np.float32)
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+def embed_many(texts, dim=EMBED_DIM):
+    matrix = np.zeros((len(texts), dim), dtype=np.float32)
+    for i, text in enumerate(texts):
+        matrix[i] = embed(text, dim)
+    return matrix
+
+class SemanticIndex:
+    # Embeddings for one model in a preallocated float32 matrix. Lookups are a
+    # single matrix-vector product, or an HNSW query when faiss is installed
+    # and the index is large enough for it to pay off.
+    def __init__(self, dim=EMBED_DIM, max_entries=MAX_ENTRIES_PER_MODEL):
+        self.dim = dim
+        self.max_entries = max_entries
+        self.vectors = np.zeros((min(1024, max_entries), dim), dtype=np.float32)
+        self.payloads = []
+        # Optional caller keys, parallel to payloads, so entries can be dropped.
+        self.row_keys = []
+        self.rows = {}
+        self.count = 0
+        self._ann = None
+        self._ann_building = False
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def add(self, vec, payload, key=None):
+        with self._lock:
+            if key is not None:
+                # A replaced entry must not keep answering with its old payload.
+                self._discard(key)
+            if self.count >= self.max_entries:
+                self._compact()
+            if self.count == len(self.vectors):
+                grown = np.zeros((min(len(self.vectors) * 2, self.max_entries), self.dim), dtype=np.float32)
+                grown[:self.count] = self.vectors[:self.count]
+                self.vectors = grown
+            self.vectors[self.count] = vec
+            self.payloads.append(payload)
+            self.row_keys.append(key)
+            if key is not None:
+                self.rows[key] = self.count
+            self.count += 1
+            if self._ann is not None:
+                self._ann.add(vec.reshape(1, -1))
+            else:
+                self._maybe_build_ann()
+
+    def discard(self, keys):
+        with self._lock:
+            for key in keys:
+                self._discard(key)
+
+    def _discard(self, key):
+        # The row stays (and stays in a faiss graph) but can no longer match:
+        # its vector scores 0 and lookups skip rows without a payload.
+        row = self.rows.pop(key, None)
+        if row is not None:
+            self.vectors[row] = 0
+            self.payloads[row] = None
+            self.row_keys[row] = None
+
+    def _compact(self):
+        # Drop the oldest half in one go so the amortized cost per insert stays O(1).
+        # Into a new matrix: lookups may still be scoring the old one.
+        keep = self.count // 2
+        vectors = np.zeros_like(self.vectors)
+        vectors[:keep] = self.vectors[self.count - keep:self.count]
+        self.vectors = vectors
+        self.payloads = self.payloads[self.count - keep:]
+        self.row_keys = self.row_keys[self.count - keep:]
+        self.rows = {key: row for row, key in enumerate(self.row_keys) if key is not None}
+        self.count = keep
+        self._ann = None
+        self._generation += 1
+        self._maybe_build_ann()
+
+    def _maybe_build_ann(self):
+        # Building the graph takes seconds at this size, so it happens on its
+        # own thread while lookups keep using the brute-force path.
+        if faiss is None or self._ann_building or self.count < ANN_MIN_ENTRIES:
+            return
+        self._ann_building = True
+        threading.Thread(
+            target=self._build_ann,
+            args=(self.vectors, self.count, self._generation),
+            name='semantic-ann-build',
+            daemon=True
+        ).start()
+
+    def _build_ann(self, vectors, count, generation):
+        index = faiss.IndexHNSWFlat(self.dim, 32, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efSearch = 64
+        index.add(vectors[:count])
+        with self._lock:
+            self._ann_building = False
+            if generation != self._generation:
+                # Compacted while building; the row ids no longer line up.
+                self._maybe_build_ann()
+                return
+            if self.count > count:
+                index.add(self.vectors[count:self.count])
+            self._ann = index
+
+    def search(self, vec):
+        best = self.search_many(vec.reshape(1, -1))
+        return best[0]
+
+    def search_many(self, matrix):
+        # Returns one (payload, score) per query row, (None, 0.0) when empty.
+        return [hits[0] if hits else (None, 0.0) for hits in self.nearest_many(matrix, 1)]
+
+    def nearest_many(self, matrix, k=SEARCH_K):
+        # Up to k (payload, score) per query row, most similar first.
+        with self._lock:
+            if self.count == 0:
+                return [[] for _ in range(len(matrix))]
+            if self._ann is not None:
+                # faiss indexes aren't safe to search while add() runs.
+                scores, ids = self._ann.search(np.ascontiguousarray(matrix, dtype=np.float32), k)
+                return [[(self.payloads[i], float(s)) for s, i in zip(row_scores, row_ids) if i >= 0 and self.payloads[i] is not None]
+                        for row_scores, row_ids in zip(scores, ids)]
+            # add() only writes rows past count and _compact() swaps in a new
+            # matrix, so this view stays valid while it is scored unlocked.
+            vectors, payloads = self.vectors[:self.count], self.payloads
+        scores = vectors @ matrix.T
+        k = min(k, len(vectors))
+        top = np.argpartition(-scores, k - 1, axis=0)[:k] if k < len(vectors) else np.argsort(-scores, axis=0)
+        results = []
+        for q in range(len(matrix)):
+            rows = sorted(top[:, q], key=lambda r: -scores[r, q])
+            results.append([(payloads[r], float(scores[r, q])) for r in rows if payloads[r] is not None])
+        return results
+
+class SemanticCache:
+    def __init__(self, dim=EMBED_DIM):
+        self.dim = dim
+        self.indexes = {}
+        self._lock = threading.Lock()
+
+    def _index(self, model):
+        index = self.indexes.get(model)
+        if index is None:
+            with self._lock:
+                index = self.indexes.setdefault(model, SemanticIndex(self.dim))
+        return index
+
+    def add(self, prompt, model, response, timestamp=None, expires_at=None, key=None):
+        # `key` (the response cache key) lets discard() drop the entry again.
+        self._index(model).add(embed(prompt, self.dim), (response, timestamp, expires_at, exact_tokens(prompt)), key)
+
+    def discard(self, entries):
+        # [(model, key), ...] deleted from the response cache.
+        by_model = {}
+        for model, key in entries:
+            by_model.setdefault(model, []).append(key)
+        for model, keys in by_model.items():
+            index = self.indexes.get(model)
+            if index is not None:
+                index.discard(keys)
+
+    def clear(self):
+        with self._lock:
+            self.indexes = {}
+
+    def lookup(self, prompt, model, threshold=None):
+        # Returns (response, timestamp, similarity) or (None, None, similarity).
+        index = self.indexes.get(model)
+        if index is None:
+            return None, None, 0.0
+        hits = index.nearest_many(embed(prompt, self.dim).reshape(1, -1))[0]
+        return self._accept(prompt, hits, model, threshold)
+
+    def lookup_many(self, prompts, model, threshold=None):
+        index = self.indexes.get(model)
+        if index is None:
+            return [(None, None, 0.0)] * len(prompts)
+        results = index.nearest_many(embed_many(prompts, self.dim))
+        return [self._accept(prompt, hits, model, threshold) for prompt, hits in zip(prompts, results)]
+
+    def _accept(self, prompt, hits, model, threshold):
+        # The most similar neighbour above the threshold that passes the
+        # exact-token and expiry checks; a miss reports the best similarity.
+        threshold = threshold_for(model) if threshold is None else threshold
+        exact, now = exact_tokens(prompt), time.time()
+        for payload, score in hits:
+            if score < threshold:
+                break
+            response, timestamp, expires_at, payload_exact = payload
+            if payload_exact == exact and not (expires_at and expires_at <= now):
+                return response, timestamp, score
+        return None, None, hits[0][1] if hits else 0.0
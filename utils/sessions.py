@@ -0,0 +1,144 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from utils.tokens import count_tokens, context_window, MESSAGE_OVERHEAD_TOKENS
+
+# Server-side conversation history for /chat and /chat/stream `session_id`s.
+# Sessions live in an LRU in memory; with LLM_ROUTER_SESSION_DB set, turns are
+# also written to SQLite so every worker (and a restarted one) sees them.
+SESSION_DB = os.getenv('LLM_ROUTER_SESSION_DB', '')
+MAX_SESSIONS = int(os.getenv('LLM_ROUTER_SESSIONS_MAX', '10000'))
+SESSION_TTL = float(os.getenv('LLM_ROUTER_SESSION_TTL_SECONDS', '86400'))
+# Upper bound on the history sent upstream, below each model's own window.
+MAX_CONTEXT_TOKENS = int(os.getenv('LLM_ROUTER_SESSION_MAX_CONTEXT_TOKENS', '8192'))
+# Room left for the answer; matches the handlers' max_tokens.
+COMPLETION_RESERVE = 512
+MAX_SESSION_ID_LENGTH = 128
+PURGE_EVERY = 1000
+
+def chain_hash(prefix, role, content):
+    # Rolling hash of the conversation so far: one step per turn, so the
+    # hash of a long history never has to be recomputed from the start.
+    return hashlib.sha256(f'{prefix}\x1f{role}\x1f{content}'.encode('utf-8')).hexdigest()
+
+class Session:
+    __slots__ = ('turns', 'prefix', 'updated')
+
+    def __init__(self):
+        # (role, content) pairs, oldest first; role is 'user' or 'assistant'.
+        self.turns = []
+        self.prefix = ''
+        self.updated = time.time()
+
+class SessionStore:
+    def __init__(self, path=SESSION_DB, max_sessions=MAX_SESSIONS, ttl=SESSION_TTL):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._appends = 0
+        if path:
+            self._conn()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS session_turns (session_id TEXT, seq INTEGER, role TEXT, content TEXT, '
+                         'prefix TEXT, ts REAL, PRIMARY KEY (session_id, seq))')
+            self._local.conn = conn
+        return conn
+
+    def _session(self, session_id, now):
+        # Caller holds the lock. Expired sessions start over.
+        session = self.sessions.get(session_id)
+        if session is not None and now - session.updated > self.ttl:
+            del self.sessions[session_id]
+            session = None
+        if session is None:
+            session = self.sessions[session_id] = Session()
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        else:
+            self.sessions.move_to_end(session_id)
+        return session
+
+    def _catch_up(self, session_id, session, now):
+        # Turns other workers appended since this one last looked.
+        rows = self._conn().execute('SELECT role, content, prefix, ts FROM session_turns WHERE session_id = ? AND seq >= ? ORDER BY seq',
+                                    (session_id, len(session.turns))).fetchall()
+        if rows and now - rows[-1][3] <= self.ttl:
+            session.turns.extend((role, content) for role, content, _, _ in rows)
+            session.prefix = rows[-1][2]
+            session.updated = rows[-1][3]
+
+    def history(self, session_id):
+        # (turns, prefix hash) as of now; turns is a copy.
+        now = time.time()
+        with self._lock:
+            session = self._session(session_id, now)
+            if self.path:
+                self._catch_up(session_id, session, now)
+            return list(session.turns), session.prefix
+
+    def append(self, session_id, prompt, response):
+        now = time.time()
+        with self._lock:
+            session = self._session(session_id, now)
+            if self.path:
+                self._catch_up(session_id, session, now)
+            rows = []
+            for role, content in (('user', prompt), ('assistant', response)):
+                session.prefix = chain_hash(session.prefix, role, content)
+                rows.append((session_id, len(session.turns), role, content, session.prefix, now))
+                session.turns.append((role, content))
+            session.updated = now
+            self._appends += 1
+            purge = self._appends % PURGE_EVERY == 0
+        if self.path:
+            conn = self._conn()
+            # OR IGNORE: a concurrent append from another worker took these
+            # seq numbers first; the next catch-up reads its version.
+            conn.executemany('INSERT OR IGNORE INTO session_turns (session_id, seq, role, content, prefix, ts) VALUES (?, ?, ?, ?, ?, ?)', rows)
+            if purge:
+                conn.execute('DELETE FROM session_turns WHERE session_id IN '
+                             '(SELECT session_id FROM session_turns GROUP BY session_id HAVING MAX(ts) < ?)', (now - self.ttl,))
+        return session.prefix
+
+    def delete(self, session_id):
+        with self._lock:
+            found = self.sessions.pop(session_id, None) is not None
+        if self.path:
+            found = self._conn().execute('DELETE FROM session_turns WHERE session_id = ?', (session_id,)).rowcount > 0 or found
+        return found
+
+def build_messages(history, prompt, model, max_context_tokens=None):
+    # The prompt for `model`: the plain prompt without history, otherwise
+    # chat messages ending with it. The oldest turns are dropped until the
+    # rest fits the model's context budget; the new prompt is always sent.
+    if not history:
+        return prompt
+    limit = MAX_CONTEXT_TOKENS if max_context_tokens is None else max_context_tokens
+    remaining = min(limit, context_window(model) - COMPLETION_RESERVE) - count_tokens(prompt, model) - MESSAGE_OVERHEAD_TOKENS
+    kept = []
+    for role, content in reversed(history):
+        cost = count_tokens(content, model) + MESSAGE_OVERHEAD_TOKENS
+        if cost > remaining:
+            break
+        remaining -= cost
+        kept.append({'role': role, 'content': content})
+    kept.reverse()
+    # Conversations start with a user turn (Gemini requires it).
+    while kept and kept[0]['role'] != 'user':
+        kept.pop(0)
+    return kept + [{'role': 'user', 'content': prompt}]
+
+store = SessionStore()
@@ -0,0 +1,34 @@
+import asyncio
+from utils import tracing
+
+class SingleFlight:
+    # Coalesces concurrent calls that share a key: the first caller starts the
+    # work as a task and everyone else awaits that same task. The task is
+    # shielded, so a caller disconnecting does not cancel it for the others.
+    # In-process only: under gunicorn each worker coalesces its own requests.
+    def __init__(self):
+        self._calls = {}
+
+    def in_flight(self):
+        return len(self._calls)
+
+    async def do(self, key, fn):
+        # Returns (result, shared); shared is True for callers that joined an
+        # existing flight. Exceptions are delivered to every caller.
+        task = self._calls.get(key)
+        if task is not None:
+            # The upstream spans belong to the leader's trace; followers record
+            # how long they waited on it.
+            with tracing.span('coalesced'):
+                return await asyncio.shield(task), True
+        task = asyncio.ensure_future(fn())
+        self._calls[key] = task
+        task.add_done_callback(lambda t: self._forget(key, t))
+        return await asyncio.shield(task), False
+
+    def _forget(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved even if every caller went away.
+            task.exception()
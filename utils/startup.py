@@ -0,0 +1,88 @@
+import os
+import time
+import asyncio
+from utils.cache import response_cache
+from utils.templates import registry as templates, TemplateError
+from utils.tokens import warmup as warmup_tokenizer
+from models.registry import get_handler, provider_for, provider_configured, AVAILABLE_MODELS, PROVIDER_KEYS
+
+# Startup prewarm, run by main's lifespan hook: everything the first requests
+# would otherwise pay for (cache database, tokenizer encodings, provider SDK
+# imports and handlers, pooled connections) is done in parallel while the
+# server already answers /healthz. /readyz passes once it has finished.
+# Providers without an API key are skipped, so their SDKs are never imported.
+PREWARM_TIMEOUT = float(os.getenv('LLM_ROUTER_PREWARM_TIMEOUT_SECONDS', '10'))
+# 0 skips opening connections to the providers (e.g. on a host without egress).
+PREWARM_CONNECTIONS = os.getenv('LLM_ROUTER_PREWARM_CONNECTIONS', '1') != '0'
+# Steps the node can't serve without; any other failure is only reported.
+REQUIRED_STEPS = {'cache'}
+
+class Readiness:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.done = False
+        self.startup_ms = None
+        # step -> {'ok', 'ms', 'error'} plus whatever the step reports
+        self.checks = {}
+
+    def record(self, name, started, error=None, details=None):
+        self.checks[name] = {'ok': error is None, 'ms': round((time.perf_counter() - started) * 1000, 1), **(details or {})}
+        if error is not None:
+            self.checks[name]['error'] = error
+
+    def finish(self):
+        self.done = True
+        self.startup_ms = round((time.monotonic() - self.started) * 1000, 1)
+
+    def ready(self):
+        return self.done and all(self.checks.get(name, {}).get('ok') for name in REQUIRED_STEPS)
+
+    def snapshot(self):
+        status = 'ready' if self.ready() else 'failed' if self.done else 'starting'
+        return {'status': status, 'startup_ms': self.startup_ms, 'checks': dict(self.checks)}
+
+state = Readiness()
+
+def _load_templates():
+    templates.reload()
+    if templates.error:
+        raise TemplateError(templates.error)
+
+async def warm_provider(provider, connect=None):
+    # Importing the SDK and building every model's handler happens on a
+    # worker thread; one connection per provider is enough, the pool is shared.
+    # Not every SDK can connect ahead of a call (Gemini's opens its channels on
+    # the first request), so `connected` says whether a connection is pooled.
+    models = [m for m in AVAILABLE_MODELS if provider_for(m) == provider]
+    handlers = await asyncio.to_thread(lambda: [get_handler(m) for m in models])
+    connected = False
+    if handlers and (PREWARM_CONNECTIONS if connect is None else connect):
+        connected = bool(await handlers[0].warmup())
+    return {'handlers': len(handlers), 'connected': connected}
+
+async def _step(name, make, timeout):
+    started = time.perf_counter()
+    try:
+        result = await asyncio.wait_for(make(), timeout)
+    except asyncio.TimeoutError:
+        state.record(name, started, f'timed out after {timeout}s')
+    except Exception as e:
+        state.record(name, started, f'{type(e).__name__}: {e}')
+    else:
+        state.record(name, started, details=result if isinstance(result, dict) else None)
+
+async def prewarm(timeout=None):
+    timeout = PREWARM_TIMEOUT if timeout is None else timeout
+    steps = {
+        'cache': lambda: asyncio.to_thread(response_cache.open),
+        'tokenizers': lambda: asyncio.to_thread(warmup_tokenizer),
+        'templates': lambda: asyncio.to_thread(_load_templates),
+    }
+    for provider in PROVIDER_KEYS:
+        if provider_configured(provider):
+            steps[f'provider:{provider}'] = lambda provider=provider: warm_provider(provider)
+    try:
+        await asyncio.gather(*(_step(name, make, timeout) for name, make in steps.items()))
+    finally:
+        state.finish()
+    return state.snapshot()
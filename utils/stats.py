@@ -0,0 +1,159 @@
+import math
+import threading
+from collections import defaultdict
+
+class LatencySketch:
+    # Log-bucketed quantile sketch (DDSketch-style): every quantile is within
+    # `relative_accuracy` of the true value, memory is bounded by the dynamic
+    # range rather than the sample count, and two sketches merge by adding
+    # bucket counts.
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets = defaultdict(int)
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value):
+        self.count += 1
+        if value <= 0:
+            self.zero_count += 1
+            return
+        self.buckets[math.ceil(math.log(value) / self._log_gamma)] += 1
+
+    def merge(self, other):
+        if other.gamma != self.gamma:
+            raise ValueError('Cannot merge sketches with different accuracy')
+        for index, count in other.buckets.items():
+            self.buckets[index] += count
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+    def quantile(self, q):
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+class ModelStats:
+    def __init__(self):
+        self.count = 0
+        self.latency_sum = 0.0
+        self.latency_count = 0
+        self.latency_sketch = LatencySketch()
+        self.rating_sum = 0.0
+        self.rating_count = 0
+        self.fallbacks = 0
+        self.cache_hits = 0
+
+class StatsAggregator:
+    # Running aggregates behind /stats. Updated as each event is logged and
+    # rebuilt from the logs once per process, so reads are O(#models).
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.loaded = False
+        self._reset()
+
+    def _reset(self):
+        self.models = defaultdict(ModelStats)
+        self.total_prompts = 0
+        self.total_fallbacks = 0
+        self.total_cache_hits = 0
+
+    def _apply_interaction(self, entry):
+        model = entry.get('model')
+        stats = self.models[model]
+        stats.count += 1
+        self.total_prompts += 1
+        if entry.get('from_cache'):
+            # Cache hits report 0ms and would drag every latency figure down.
+            stats.cache_hits += 1
+            self.total_cache_hits += 1
+        else:
+            latency = entry.get('latency_ms')
+            if latency is not None:
+                latency = float(latency)
+                stats.latency_sum += latency
+                stats.latency_count += 1
+                stats.latency_sketch.add(latency)
+        if entry.get('fallback_used'):
+            stats.fallbacks += 1
+            self.total_fallbacks += 1
+
+    def _apply_rating(self, entry):
+        model = entry.get('model')
+        rating = entry.get('rating')
+        if not model or rating is None:
+            return
+        try:
+            rating = float(rating)
+        except (TypeError, ValueError):
+            return
+        stats = self.models[model]
+        stats.rating_sum += rating
+        stats.rating_count += 1
+
+    def record_interaction(self, entry):
+        with self.lock:
+            if self.loaded:
+                self._apply_interaction(entry)
+
+    def record_rating(self, entry):
+        with self.lock:
+            if self.loaded:
+                self._apply_rating(entry)
+
+    def rebuild(self, interactions, ratings):
+        with self.lock:
+            self._reset()
+            for entry in interactions:
+                self._apply_interaction(entry)
+            for entry in ratings:
+                self._apply_rating(entry)
+            self.loaded = True
+
+    def extend(self, interactions, ratings):
+        # Folds in events read back from the logs (per-worker logs, see
+        # utils.logger.load_stats) instead of recorded as they happen.
+        with self.lock:
+            for entry in interactions:
+                self._apply_interaction(entry)
+            for entry in ratings:
+                self._apply_rating(entry)
+            self.loaded = True
+
+    def snapshot(self):
+        with self.lock:
+            # Models that were only ever rated (never served) stay out of the report.
+            models = {m: s for m, s in self.models.items() if s.count}
+            percentiles = {}
+            for m, s in models.items():
+                sketch = s.latency_sketch
+                percentiles[m] = {
+                    'p50': _seconds(sketch.quantile(0.50)),
+                    'p95': _seconds(sketch.quantile(0.95)),
+                    'p99': _seconds(sketch.quantile(0.99))
+                }
+            return {
+                'model_usage': {m: s.count for m, s in models.items()},
+                'avg_latency': {m: (s.latency_sum / s.latency_count / 1000.0) if s.latency_count else 0 for m, s in models.items()},
+                'latency_percentiles': percentiles,
+                'avg_rating': {m: (s.rating_sum / s.rating_count) if s.rating_count else 0 for m, s in models.items()},
+                'cache_hits': {m: s.cache_hits for m, s in models.items()},
+                'total_fallbacks': self.total_fallbacks,
+                'total_cache_hits': self.total_cache_hits,
+                'total_prompts': self.total_prompts
+            }
+
+def _seconds(ms):
+    return ms / 1000.0 if ms is not None else None
+
+aggregator = StatsAggregator()
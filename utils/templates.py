@@ -0,0 +1,130 @@
+import os
+import re
+import json
+import time
+import threading
+
+TEMPLATES_PATH = os.getenv('LLM_ROUTER_TEMPLATES', os.path.join(os.path.dirname(__file__), '..', 'prompt_templates.json'))
+# The file's mtime is checked at most this often; edits are picked up without a restart.
+RELOAD_INTERVAL = float(os.getenv('LLM_ROUTER_TEMPLATES_RELOAD_SECONDS', '1'))
+
+_VAR_RE = re.compile(r'\{\{(.*?)\}\}')
+
+class TemplateError(ValueError):
+    pass
+
+class Template:
+    # A template body split once into literal text and variable slots, so
+    # rendering is a single join instead of a regex pass per request.
+    def __init__(self, data):
+        self.id = data['id']
+        self.title = data.get('title', self.id)
+        self.prompt = data['prompt']
+        self.tags = list(data.get('tags', []))
+        self.category = data.get('category', 'Other')
+        parts = _VAR_RE.split(self.prompt)
+        self.literals = parts[0::2]
+        self.slots = [name.strip() for name in parts[1::2]]
+        self.vars = list(dict.fromkeys(self.slots))
+
+    def render(self, values):
+        missing = [name for name in self.vars if values.get(name) is None]
+        if missing:
+            raise TemplateError(f"Template {self.id} is missing variables: {', '.join(missing)}")
+        out = [self.literals[0]]
+        for name, literal in zip(self.slots, self.literals[1:]):
+            out.append(str(values[name]))
+            out.append(literal)
+        return ''.join(out)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'title': self.title,
+            'prompt': self.prompt,
+            'tags': self.tags,
+            'category': self.category,
+            'vars': self.vars
+        }
+
+class TemplateRegistry:
+    def __init__(self, path=TEMPLATES_PATH, reload_interval=RELOAD_INTERVAL):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.templates = []
+        self.by_id = {}
+        self.by_category = {}
+        self.by_tag = {}
+        self._mtime = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        # Why the file on disk could not be loaded, until a good version is; /readyz reports it.
+        self.error = None
+        self._maybe_reload(force=True)
+
+    def _maybe_reload(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._checked < self.reload_interval:
+            return
+        with self._lock:
+            self._checked = now
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError:
+                mtime = None
+            if mtime == self._mtime and not force:
+                return
+            try:
+                templates = self._load() if mtime is not None else []
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                # A half-saved or invalid file keeps the previous templates.
+                self.error = f'{self.path}: {type(e).__name__}: {e}'
+                return
+            self._index(templates)
+            self._mtime = mtime
+            self.error = None
+
+    def reload(self):
+        self._maybe_reload(force=True)
+
+    def _load(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        # Older files mapped names to "{prompt}" bodies.
+        if isinstance(data, dict):
+            data = [{'id': key, 'prompt': body.replace('{prompt}', '{{prompt}}')} for key, body in data.items()]
+        return [Template(item) for item in data]
+
+    def _index(self, templates):
+        by_id, by_category, by_tag = {}, {}, {}
+        for template in templates:
+            by_id[template.id] = template
+            by_category.setdefault(template.category.lower(), []).append(template)
+            for tag in template.tags:
+                by_tag.setdefault(tag.lower(), []).append(template)
+        # Swapped together so readers never see a half-built index.
+        self.templates, self.by_id, self.by_category, self.by_tag = templates, by_id, by_category, by_tag
+
+    def get(self, template_id):
+        self._maybe_reload()
+        return self.by_id.get(template_id)
+
+    def find(self, category=None, tag=None):
+        self._maybe_reload()
+        if category:
+            results = self.by_category.get(category.lower(), [])
+        elif tag:
+            results = self.by_tag.get(tag.lower(), [])
+        else:
+            results = self.templates
+        if category and tag:
+            results = [t for t in results if tag.lower() in (x.lower() for x in t.tags)]
+        return list(results)
+
+    def render(self, template_id, values):
+        template = self.get(template_id)
+        if template is None:
+            raise TemplateError(f'Template id {template_id} not found')
+        return template.render(values)
+
+registry = TemplateRegistry()
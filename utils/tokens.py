@@ -1,17 +1,114 @@
+import os
+import math
+import threading
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Per model family: (tiktoken encoding, chars per token when tiktoken is not
+# installed); first matching prefix wins. This table is a deliberate
+# approximation, not the models' real tokenizers: Llama 3 uses a 128k BPE
+# built on cl100k_base (so counts run slightly high), while Gemini and
+# Mistral use SentencePiece vocabularies tiktoken does not ship. cl100k_base
+# is the closest encoding available offline for all of them; exact counts
+# come from the provider's usage fields, which accounting prefers.
+MODEL_FAMILIES = [
+    ('gemini', 'cl100k_base', 3.5),
+    ('llama', 'cl100k_base', 4.0),
+    ('meta-llama/', 'cl100k_base', 4.0),
+]
+DEFAULT_FAMILY = ('cl100k_base', 4.0)
+# Context window in tokens per model prefix; first match wins.
+CONTEXT_WINDOWS = [
+    ('gemini', 1_048_576),
+    ('mistral-saba', 32_768),
+]
+DEFAULT_CONTEXT_WINDOW = 131_072
+# Chat formatting adds a few tokens per message (role markers, separators).
+MESSAGE_OVERHEAD_TOKENS = 4
+# Batches at least this large are encoded on tiktoken's thread pool.
+BATCH_THREAD_THRESHOLD = 64
+BATCH_THREADS = int(os.getenv('LLM_ROUTER_TOKENIZER_THREADS', str(min(8, os.cpu_count() or 1))))
+# Only short texts (prompts, template bodies) are memoized, so the cache
+# stays small even though responses are never repeated.
+MEMO_MAX_CHARS = 8192
+
+_encodings = {}
+_lock = threading.Lock()
+
+def family_for(model):
+    if model:
+        for prefix, encoding, chars_per_token in MODEL_FAMILIES:
+            if model.startswith(prefix):
+                return encoding, chars_per_token
+    return DEFAULT_FAMILY
+
+def context_window(model):
+    if model:
+        for prefix, window in CONTEXT_WINDOWS:
+            if model.startswith(prefix):
+                return window
+    return DEFAULT_CONTEXT_WINDOW
+
+def count_message_tokens(messages, model: str = None) -> int:
+    # A prompt string, or a list of {'role', 'content'} chat messages.
+    if isinstance(messages, str):
+        return count_tokens(messages, model)
+    return sum(count_tokens(m['content'], model) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+def get_encoding(name):
+    # Loaded once per process; None when tiktoken is unavailable or the
+    # encoding files cannot be fetched.
+    if tiktoken is None:
+        return None
+    if name in _encodings:
+        return _encodings[name]
+    with _lock:
+        if name not in _encodings:
+            try:
+                _encodings[name] = tiktoken.get_encoding(name)
+            except Exception:
+                _encodings[name] = None
+    return _encodings[name]
+
+def warmup():
+    for name in {encoding for _, encoding, _ in MODEL_FAMILIES} | {DEFAULT_FAMILY[0]}:
+        get_encoding(name)
+
+def _heuristic(text, chars_per_token):
+    return math.ceil(len(text) / chars_per_token) if text else 0
+
+@lru_cache(maxsize=4096)
+def _count_memo(text, encoding_name, chars_per_token):
+    return _count(text, encoding_name, chars_per_token)
+
+def _count(text, encoding_name, chars_per_token):
+    enc = get_encoding(encoding_name)
+    if enc is None:
+        return _heuristic(text, chars_per_token)
+    # encode_ordinary: user text may contain "<|endoftext|>" and similar,
+    # which encode() rejects.
+    return len(enc.encode_ordinary(text))
+
+def count_tokens(text: str, model: str = None) -> int:
+    if not text:
+        return 0
+    encoding_name, chars_per_token = family_for(model)
+    if len(text) <= MEMO_MAX_CHARS:
+        return _count_memo(text, encoding_name, chars_per_token)
+    return _count(text, encoding_name, chars_per_token)
+
+def count_tokens_many(texts, model: str = None):
+    texts = list(texts)
+    encoding_name, chars_per_token = family_for(model)
+    enc = get_encoding(encoding_name)
+    if enc is None or len(texts) < BATCH_THREAD_THRESHOLD:
+        return [count_tokens(text, model) for text in texts]
+    return [len(tokens) for tokens in enc.encode_ordinary_batch(texts, num_threads=BATCH_THREADS)]
+
+# Kept for existing callers.
 def estimate_token_count(text: str, model: str = None) -> int:
-    try:
-        import tiktoken
-        enc = tiktoken.get_encoding('cl100k_base')
-        return len(enc.encode(text))
-    except Exception:
-        # Model-specific heuristics by prefix
-        if model and model.startswith('gemini'):
-            # Gemini models: 1 token ≈ 3.5 chars (free tier)
-            return max(1, len(text) // 3.5)
-        elif model and model.startswith('llama-3.1-8b'):
-            # Llama-3.1-8b models: 1 token ≈ 4 chars
-            return max(1, len(text) // 4)
-        # Add more model heuristics here as needed
-        else:
-            # Default fallback
-            return max(1, len(text) // 4) 
\ No newline at end of file
+    return count_tokens(text, model)
@@ -0,0 +1,167 @@
+import os
+import re
+import time
+import secrets
+import contextvars
+from contextlib import contextmanager
+from utils.logger import writer
+
+# Finished traces are appended to this file as OTLP/JSON, one
+# ExportTraceServiceRequest per line, so an OpenTelemetry collector (or
+# anything that reads the OTLP JSON encoding) can pick them up. Unset keeps
+# traces in memory only, for the per-request timings.
+TRACE_FILE = os.getenv('LLM_ROUTER_TRACE_FILE', '')
+SERVICE_NAME = os.getenv('LLM_ROUTER_SERVICE_NAME', 'llm-router')
+# Adds the Server-Timing header and `timings` field to every /chat response,
+# not only to requests that ask with timings=true.
+SERVER_TIMING = os.getenv('LLM_ROUTER_SERVER_TIMING', '0') == '1'
+
+_TRACEPARENT_RE = re.compile(r'^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$')
+
+_trace = contextvars.ContextVar('llm_router_trace', default=None)
+_span = contextvars.ContextVar('llm_router_span', default=None)
+
+class Span:
+    __slots__ = ('name', 'span_id', 'parent_id', 'start_ns', 'end_ns', 'attributes', 'error')
+
+    def __init__(self, name, parent_id, attributes):
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def fail(self, error):
+        self.error = f'{type(error).__name__}: {error}' if str(error) else type(error).__name__
+
+    def duration_ms(self):
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+class Trace:
+    # One request: a root span plus every stage span opened while it is the
+    # current trace, including those in tasks it spawns (hedges, coalesced calls).
+    def __init__(self, name, traceparent=None, **attributes):
+        match = _TRACEPARENT_RE.match(traceparent.strip().lower()) if traceparent else None
+        self.trace_id = match.group(1) if match else secrets.token_hex(16)
+        self.root = Span(name, match.group(2) if match else None, attributes)
+        self.spans = []
+        self._tokens = None
+
+    def stages(self):
+        # Milliseconds per stage name; repeated stages (several upstream
+        # attempts, say) are summed.
+        totals = {}
+        for s in self.spans:
+            totals[s.name] = totals.get(s.name, 0.0) + s.duration_ms()
+        return totals
+
+    def timings(self):
+        timings = {'trace_id': self.trace_id, 'total_ms': round(self.root.duration_ms(), 3)}
+        timings.update({f'{name}_ms': round(ms, 3) for name, ms in self.stages().items()})
+        attempts = [s for s in self.spans if s.name == 'upstream']
+        if attempts:
+            timings['attempts'] = [{
+                'model': s.attributes.get('llm.model'),
+                'ms': round(s.duration_ms(), 3),
+                'ok': s.error is None,
+                **({'error': s.error} if s.error else {})
+            } for s in attempts]
+        return timings
+
+    def server_timing(self):
+        parts = [f'{name};dur={ms:.3f}' for name, ms in self.stages().items()]
+        parts.append(f'total;dur={self.root.duration_ms():.3f}')
+        return ', '.join(parts)
+
+    def to_otlp(self):
+        return {'resourceSpans': [{
+            'resource': {'attributes': _attributes({'service.name': SERVICE_NAME})},
+            'scopeSpans': [{
+                'scope': {'name': 'llm-router'},
+                'spans': [self._otlp_span(self.root, kind=2)] + [self._otlp_span(s, kind=1) for s in self.spans]
+            }]
+        }]}
+
+    def _otlp_span(self, s, kind):
+        span = {
+            'traceId': self.trace_id,
+            'spanId': s.span_id,
+            'name': s.name,
+            'kind': kind,
+            'startTimeUnixNano': str(s.start_ns),
+            'endTimeUnixNano': str(s.end_ns or s.start_ns),
+            'attributes': _attributes(s.attributes),
+            'status': {'code': 2, 'message': s.error} if s.error else {'code': 1}
+        }
+        if s.parent_id:
+            span['parentSpanId'] = s.parent_id
+        return span
+
+def _attributes(values):
+    out = []
+    for key, value in values.items():
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            out.append({'key': key, 'value': {'boolValue': value}})
+        elif isinstance(value, int):
+            out.append({'key': key, 'value': {'intValue': str(value)}})
+        elif isinstance(value, float):
+            out.append({'key': key, 'value': {'doubleValue': value}})
+        else:
+            out.append({'key': key, 'value': {'stringValue': str(value)}})
+    return out
+
+def _reset(var, token):
+    try:
+        var.reset(token)
+    except ValueError:
+        # A streamed body that was never finished is closed by the event loop
+        # from another context; there is nothing left to reset.
+        pass
+
+def start_trace(name, traceparent=None, **attributes):
+    trace = Trace(name, traceparent, **attributes)
+    trace._tokens = (_trace.set(trace), _span.set(trace.root.span_id))
+    return trace
+
+def end_trace(trace, error=None):
+    trace.root.end_ns = time.time_ns()
+    if trace._tokens is not None:
+        _reset(_trace, trace._tokens[0])
+        _reset(_span, trace._tokens[1])
+        trace._tokens = None
+    if error is not None:
+        trace.root.fail(error)
+    if TRACE_FILE:
+        # Written by the log writer thread, batched and fsynced with the logs.
+        writer.submit(TRACE_FILE, trace.to_otlp())
+    return trace
+
+def current_trace():
+    return _trace.get()
+
+@contextmanager
+def span(name, **attributes):
+    # Times one stage of the current trace; a no-op outside a trace (the
+    # offline batch runner, tests calling dispatch directly).
+    trace = _trace.get()
+    if trace is None:
+        yield None
+        return
+    s = Span(name, _span.get(), attributes)
+    token = _span.set(s.span_id)
+    try:
+        yield s
+    except BaseException as e:
+        s.fail(e)
+        raise
+    finally:
+        s.end_ns = time.time_ns()
+        _reset(_span, token)
+        trace.spans.append(s)